@@ -44,10 +44,18 @@ REPO_NOTE_PUPPET = 'puppet-repo'
 # Name of the hosted file describing the contents of the repository
 REPO_METADATA_FILENAME = 'modules.json'
 
+# Name of the gzip compressed copy of the repository metadata, served in its place to
+# clients that accept gzip encoded responses
+REPO_METADATA_GZ_FILENAME = REPO_METADATA_FILENAME + '.gz'
+
 # Name of the file that holds dependency data, which is required by the WSGI
 # app that implements puppet forge's API
 REPO_DEPDATA_FILENAME = '.dependency_db'
 
+# Name of the file that holds the documents served by the WSGI app's implementation
+# of the puppet forge v3 API, precomputed for each module when publishing
+REPO_V3_DATA_FILENAME = '.forge_v3_db'
+
 # File name inside of a module where its metadata is found
 MODULE_METADATA_FILENAME = 'metadata.json'
 
@@ -91,6 +99,45 @@ CONFIG_QUERIES = 'queries'
 CONFIG_REMOVE_MISSING = 'remove_missing'
 DEFAULT_REMOVE_MISSING = False
 
+# Number of modules handed to the downloader at once when syncing against a
+# forge; the number of concurrent downloads within a batch is bounded by the
+# platform's max_downloads setting
+CONFIG_DOWNLOAD_BATCH_SIZE = 'download_batch_size'
+DEFAULT_DOWNLOAD_BATCH_SIZE = 100
+
+# Maximum size, in MiB, of the modules kept in a repository's working directory
+# between syncs so that a failed or canceled sync does not download them again
+CONFIG_DOWNLOAD_CACHE_SIZE = 'download_cache_size'
+DEFAULT_DOWNLOAD_CACHE_SIZE = 1024
+
+# Number of processes metadata is extracted from modules with when syncing
+# against a directory; with one it is extracted on the syncing process itself
+CONFIG_EXTRACT_PROCESSES = 'extract_processes'
+DEFAULT_EXTRACT_PROCESSES = 1
+
+# How module files are placed into Pulp's storage; with hardlink they are linked
+# where the file system allows it, and copied otherwise
+CONFIG_IMPORT_MODE = 'import_mode'
+IMPORT_MODE_COPY = 'copy'
+IMPORT_MODE_HARDLINK = 'hardlink'
+IMPORT_MODES = (IMPORT_MODE_COPY, IMPORT_MODE_HARDLINK)
+DEFAULT_IMPORT_MODE = IMPORT_MODE_COPY
+
+# Kind of source the feed refers to; when not given it is detected by trying the
+# directory method first, and the result is remembered until the feed changes
+CONFIG_FEED_TYPE = 'feed_type'
+FEED_TYPE_DIRECTORY = 'directory'
+FEED_TYPE_FORGE = 'forge'
+FEED_TYPES = (FEED_TYPE_DIRECTORY, FEED_TYPE_FORGE)
+
+# Version of the forge API used to list the modules of an HTTP feed; v1 reads
+# modules.json while v3 walks the paginated releases resource
+CONFIG_FORGE_API = 'forge_api'
+FORGE_API_V1 = 'v1'
+FORGE_API_V3 = 'v3'
+FORGE_API_VERSIONS = (FORGE_API_V1, FORGE_API_V3)
+DEFAULT_FORGE_API = FORGE_API_V1
+
 # -- distributor configuration keys -------------------------------------------
 
 # Controls if modules will be served over HTTP
@@ -109,6 +156,11 @@ DEFAULT_HTTP_DIR = '/var/lib/pulp/published/puppet/http/repos'
 CONFIG_HTTPS_DIR = 'https_dir'
 DEFAULT_HTTPS_DIR = '/var/lib/pulp/published/puppet/https/repos'
 
+# Local directory each publish of a repository is written to once, in a new
+# generation that the HTTP and HTTPS directories then link to
+CONFIG_MASTER_DIR = 'master_dir'
+DEFAULT_MASTER_DIR = '/var/lib/pulp/published/puppet/master'
+
 # Local directory the web server will serve flat directory representations of repositories
 CONFIG_FILE_HTTPS_DIR = 'https_files_dir'
 DEFAULT_FILE_HTTPS_DIR = '/var/lib/pulp/published/puppet/files'
@@ -117,6 +169,16 @@ DEFAULT_FILE_HTTPS_DIR = '/var/lib/pulp/published/puppet/files'
 CONFIG_ABSOLUTE_PATH = 'absolute_path'
 DEFAULT_ABSOLUTE_PATH = '/pulp/puppet/'
 
+# Whether a publish only applies the changes since the previous publish of the
+# repository rather than rebuilding it
+CONFIG_INCREMENTAL_PUBLISH = 'incremental_publish'
+DEFAULT_INCREMENTAL_PUBLISH = False
+
+# Number of threads module files are checksummed with during a publish, for modules
+# whose md5 was not stored when they were imported
+CONFIG_CHECKSUM_THREADS = 'checksum_threads'
+DEFAULT_CHECKSUM_THREADS = 4
+
 CONFIG_INSTALL_PATH = 'install_path'
 
 # -- forge API ---------------------------------------------------------------
@@ -134,6 +196,8 @@ FORGE_PATH = 'pulp_puppet/forge'
 FORGE_PATH_REPO = os.path.join(FORGE_PATH, 'repository')
 # path to use when identifying a consumer whose bindings should be considered
 FORGE_PATH_CONSUMER = os.path.join(FORGE_PATH, 'consumer')
+# path, relative to a forge, of the v3 API's paginated list of releases
+FORGE_V3_RELEASES_PATH = 'v3/releases'
 
 # -- REST API ----------------------------------------------------------------
 
@@ -19,8 +19,9 @@ class PublishProgressReport(object):
     :type conduit: pulp.plugins.conduits.repo_publish.RepoPublishConduit
     """
 
-    def __init__(self, conduit):
+    def __init__(self, conduit, progress_interval=reporting.DEFAULT_PROGRESS_INTERVAL):
         self.conduit = conduit
+        self._sink = reporting.ProgressSink(conduit, progress_interval)
 
         # Modules symlink step
         self.modules_state = STATE_NOT_STARTED
@@ -39,6 +40,12 @@ class PublishProgressReport(object):
         self.metadata_error_message = None
         self.metadata_exception = None
         self.metadata_traceback = None
+        # Module files checksummed because their md5 is not stored; throughput is in
+        # bytes per second
+        self.metadata_checksum_total_count = None
+        self.metadata_checksum_finished_count = None
+        self.metadata_checksum_bytes = None
+        self.metadata_checksum_throughput = None
 
         # Publishing
         self.publish_http = STATE_NOT_STARTED
@@ -82,6 +89,11 @@ class PublishProgressReport(object):
         r.metadata_error_message = m['error_message']
         r.metadata_exception = m['error']
         r.metadata_traceback = m['traceback']
+        # Not present in reports from before files were checksummed in parallel
+        r.metadata_checksum_total_count = m.get('checksum_total_count')
+        r.metadata_checksum_finished_count = m.get('checksum_finished_count')
+        r.metadata_checksum_bytes = m.get('checksum_bytes')
+        r.metadata_checksum_throughput = m.get('checksum_throughput')
 
         m = report['publishing']
         r.publish_http = m['http']
@@ -89,12 +101,23 @@ class PublishProgressReport(object):
 
         return r
 
-    def update_progress(self):
+    def update_progress(self, force=False):
         """
-        Sends the current state of the progress report to Pulp.
+        Sends the current state of the progress report to Pulp. Updates are sent at
+        most once per progress interval, unless the state of a step has changed.
+
+        :param force: if True the update is sent regardless of the interval
+        :type  force: bool
+        """
+        self._sink.send(self.build_progress_report, self._states(), force=force)
+
+    def _states(self):
+        """
+        :return: the states of each of the steps
+        :rtype:  tuple
         """
-        report = self.build_progress_report()
-        self.conduit.set_progress(report)
+        return (self.modules_state, self.metadata_state,
+                self.publish_http, self.publish_https)
 
     def build_final_report(self):
         """
@@ -192,6 +215,10 @@ class PublishProgressReport(object):
             'error_message' : self.metadata_error_message,
             'error' : reporting.format_exception(self.metadata_exception),
             'traceback' : reporting.format_traceback(self.metadata_traceback),
+            'checksum_total_count' : self.metadata_checksum_total_count,
+            'checksum_finished_count' : self.metadata_checksum_finished_count,
+            'checksum_bytes' : self.metadata_checksum_bytes,
+            'checksum_throughput' : self.metadata_checksum_throughput,
             }
         return metadata_report
 
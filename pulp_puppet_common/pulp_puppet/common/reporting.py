@@ -3,9 +3,16 @@ Contains methods related to formatting the progress reports sent back to Pulp
 by all of the puppet plugins.
 """
 
+import copy
+import time
 import traceback
 
 
+# Minimum number of seconds between two progress reports sent to Pulp, unless the
+# state of a step changes in between
+DEFAULT_PROGRESS_INTERVAL = 1.0
+
+
 def format_exception(e):
     """
     Formats the given exception to be included in the report.
@@ -27,3 +34,63 @@ def format_traceback(tb):
         return traceback.extract_tb(tb)
     else:
         return None
+
+
+class ProgressSink(object):
+    """
+    Sends progress reports to a conduit. Reports requested less than the minimum
+    interval after the last one sent are coalesced into the next one, and a report
+    identical to the last one sent is not sent again. A change in the state of the
+    operation, or a forced update, is always sent right away.
+
+    :ivar conduit: conduit the reports are sent through
+    :type conduit: object with a set_progress method
+    :ivar interval: minimum number of seconds between two reports
+    :type interval: float
+    """
+
+    def __init__(self, conduit, interval=DEFAULT_PROGRESS_INTERVAL):
+        """
+        :param conduit: conduit the reports are sent through
+        :type  conduit: object with a set_progress method
+        :param interval: minimum number of seconds between two reports
+        :type  interval: float
+        """
+        self.conduit = conduit
+        self.interval = interval
+        self._last_sent = None
+        self._last_report = None
+        self._last_state = None
+
+    def send(self, build_report, state=None, force=False):
+        """
+        Sends a progress report if one is due.
+
+        :param build_report: called to build the report; it is only built when due
+        :type  build_report: callable
+        :param state: states of the steps of the operation; a change is sent immediately
+        :type  state: tuple
+        :param force: if True the report is sent regardless of the interval
+        :type  force: bool
+
+        :return: True if the report was sent
+        :rtype:  bool
+        """
+        now = time.time()
+        if state != self._last_state:
+            force = True
+        if not force and self._last_sent is not None and now - self._last_sent < self.interval:
+            return False
+
+        report = build_report()
+        if report == self._last_report:
+            return False
+
+        self.conduit.set_progress(report)
+
+        # The report shares lists with the progress report it was built from, which
+        # keep changing after it is sent
+        self._last_report = copy.deepcopy(report)
+        self._last_sent = now
+        self._last_state = state
+        return True
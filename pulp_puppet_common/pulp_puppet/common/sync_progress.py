@@ -19,14 +19,17 @@ class SyncProgressReport(object):
     :type conduit: pulp.plugins.conduits.repo_sync.RepoSyncConduit
     """
 
-    def __init__(self, conduit):
+    def __init__(self, conduit, progress_interval=reporting.DEFAULT_PROGRESS_INTERVAL):
         self.conduit = conduit
+        self._sink = reporting.ProgressSink(conduit, progress_interval)
 
         # Metadata download & parsing
         self.metadata_state = STATE_NOT_STARTED
         self.metadata_query_finished_count = None
         self.metadata_query_total_count = None
         self.metadata_current_query = None
+        # seconds taken by each metadata query, keyed by its URL
+        self.metadata_query_times = {}
         self.metadata_execution_time = None
         self.metadata_error_message = None
         self.metadata_exception = None
@@ -72,6 +75,7 @@ class SyncProgressReport(object):
         r.metadata_current_query = m['current_query']
         r.metadata_query_finished_count = m['query_finished_count']
         r.metadata_query_total_count = m['query_total_count']
+        r.metadata_query_times = m.get('query_times', {})
         r.metadata_error_message = m['error_message']
         r.metadata_exception = m['error']
         r.metadata_traceback = m['traceback']
@@ -89,12 +93,22 @@ class SyncProgressReport(object):
 
         return r
 
-    def update_progress(self):
+    def update_progress(self, force=False):
         """
-        Sends the current state of the progress report to Pulp.
+        Sends the current state of the progress report to Pulp. Updates are sent at
+        most once per progress interval, unless the state of a step has changed.
+
+        :param force: if True the update is sent regardless of the interval
+        :type  force: bool
+        """
+        self._sink.send(self.build_progress_report, self._states(), force=force)
+
+    def _states(self):
+        """
+        :return: the states of each of the steps
+        :rtype:  tuple
         """
-        report = self.build_progress_report()
-        self.conduit.set_progress(report)
+        return (self.metadata_state, self.modules_state)
 
     def build_final_report(self):
         """
@@ -177,6 +191,7 @@ class SyncProgressReport(object):
             'current_query' : self.metadata_current_query,
             'query_finished_count' : self.metadata_query_finished_count,
             'query_total_count' : self.metadata_query_total_count,
+            'query_times' : self.metadata_query_times,
             'error_message' : self.metadata_error_message,
             'error' : reporting.format_exception(self.metadata_exception),
             'traceback' : reporting.format_traceback(self.metadata_traceback),
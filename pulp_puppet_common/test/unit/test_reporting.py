@@ -0,0 +1,93 @@
+import unittest
+
+import mock
+
+from pulp_puppet.common import reporting
+from pulp_puppet.common.constants import STATE_RUNNING, STATE_SUCCESS
+from pulp_puppet.common.sync_progress import SyncProgressReport
+
+
+@mock.patch('pulp_puppet.common.reporting.time.time')
+class ProgressSinkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conduit = mock.Mock()
+        self.sink = reporting.ProgressSink(self.conduit, interval=5)
+        self.report = {'count': 0, 'errors': []}
+
+    def _build(self):
+        return self.report
+
+    def test_send_first(self, mock_time):
+        mock_time.return_value = 100
+
+        self.assertTrue(self.sink.send(self._build))
+
+        self.conduit.set_progress.assert_called_once_with({'count': 0, 'errors': []})
+
+    def test_send_coalesces(self, mock_time):
+        mock_time.side_effect = [100, 101, 104, 105]
+        build = mock.Mock(side_effect=lambda: dict(self.report))
+
+        for count in range(4):
+            self.report['count'] = count
+            self.sink.send(build)
+
+        # Reports within the interval are neither built nor sent
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual([c[0][0]['count'] for c in self.conduit.set_progress.call_args_list],
+                         [0, 3])
+
+    def test_send_unchanged(self, mock_time):
+        mock_time.side_effect = [100, 200, 300]
+
+        self.sink.send(self._build)
+        self.sink.send(self._build)
+        self.report['errors'].append('failed')
+        self.sink.send(self._build)
+
+        # The shared errors list changing is detected
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+    def test_send_state_change(self, mock_time):
+        mock_time.return_value = 100
+
+        self.sink.send(self._build, state=(STATE_RUNNING,))
+        self.report['count'] = 1
+        self.sink.send(self._build, state=(STATE_RUNNING,))
+        self.sink.send(self._build, state=(STATE_SUCCESS,))
+
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+        self.assertEqual(self.conduit.set_progress.call_args[0][0]['count'], 1)
+
+    def test_send_force(self, mock_time):
+        mock_time.return_value = 100
+
+        self.sink.send(self._build)
+        self.report['count'] = 1
+        self.assertFalse(self.sink.send(self._build))
+        self.assertTrue(self.sink.send(self._build, force=True))
+
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+
+class SyncProgressReportUpdateTests(unittest.TestCase):
+
+    @mock.patch('pulp_puppet.common.reporting.time.time')
+    def test_update_progress(self, mock_time):
+        mock_time.return_value = 100
+        conduit = mock.Mock()
+        progress_report = SyncProgressReport(conduit, progress_interval=5)
+
+        progress_report.modules_state = STATE_RUNNING
+        progress_report.update_progress()
+        for count in range(10):
+            progress_report.modules_finished_count = count
+            progress_report.update_progress()
+        progress_report.modules_state = STATE_SUCCESS
+        progress_report.update_progress()
+
+        self.assertEqual(conduit.set_progress.call_count, 2)
+        final = conduit.set_progress.call_args[0][0]
+        self.assertEqual(final['modules']['state'], STATE_SUCCESS)
+        self.assertEqual(final['modules']['finished_count'], 9)
@@ -9,6 +9,7 @@ from pulp.server.db import model
 from pulp.server.managers.consumer.bind import BindManager
 
 from pulp_puppet.common import constants
+from pulp_puppet.forge import v3
 from pulp_puppet.forge.unit import Unit
 
 
@@ -70,14 +71,9 @@ def view(consumer_id, repo_id, module_name, version=None, recurse_deps=True,
                 generates, except this structure is not yet JSON serialized
     :rtype:     dict
     """
-    # Build the list of repositories that should be queried
-    if repo_id == constants.FORGE_NULL_AUTH_VALUE:
-        if consumer_id == constants.FORGE_NULL_AUTH_VALUE:
-            # must provide either consumer ID or repo ID
-            return HttpResponse('Unauthorized', status=401)
-        repo_ids = get_bound_repos(consumer_id)
-    else:
-        repo_ids = [repo_id]
+    repo_ids = get_repo_ids(consumer_id, repo_id)
+    if repo_ids is None:
+        return HttpResponse('Unauthorized', status=401)
 
     dbs = None
     return_data = None
@@ -130,6 +126,115 @@ def view(consumer_id, repo_id, module_name, version=None, recurse_deps=True,
     return return_data
 
 
+def get_repo_ids(consumer_id, repo_id):
+    """
+    Build the list of repositories that should be queried
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+
+    :return:    list of repo IDs; None if neither a consumer ID nor a repo ID
+                was provided
+    :rtype:     list
+    """
+    if repo_id == constants.FORGE_NULL_AUTH_VALUE:
+        if consumer_id == constants.FORGE_NULL_AUTH_VALUE:
+            # must provide either consumer ID or repo ID
+            return None
+        return get_bound_repos(consumer_id)
+    return [repo_id]
+
+
+def v3_releases(consumer_id, repo_id, module_name, version=None):
+    """
+    produces the releases of a module listed by the forge v3 API, as precomputed
+    when the repository was published
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+    :param version:     optional version
+    :type  version:     str
+
+    :return:    JSON serialized description of each release, in the order they are
+                listed; None if they were not precomputed or none match
+    :rtype:     list of str
+    """
+    db = open_v3_db(consumer_id, repo_id)
+    if db is None:
+        return None
+    try:
+        try:
+            versions = json.loads(db[v3.RELEASES_KEY % module_name])
+        except KeyError:
+            return None
+        if version:
+            versions = [v for v in versions if v == version]
+        return [db[v3.RELEASE_KEY % (module_name, v)] for v in versions] or None
+    finally:
+        db.close()
+
+
+def v3_module(consumer_id, repo_id, module_name):
+    """
+    produces the description of a module served by the forge v3 API, as precomputed
+    when the repository was published
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+
+    :return:    JSON serialized description of the module; None if it was not
+                precomputed
+    :rtype:     str
+    """
+    db = open_v3_db(consumer_id, repo_id)
+    if db is None:
+        return None
+    try:
+        return db[v3.MODULE_KEY % module_name]
+    except KeyError:
+        return None
+    finally:
+        db.close()
+
+
+def open_v3_db(consumer_id, repo_id):
+    """
+    Find and open the gdbm database of forge v3 API documents precomputed when the
+    queried repository was published. Results spanning several repositories are
+    merged on request, so it is only opened when a single repository is queried.
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+
+    :return:    open gdbm database; None if more or less than one repository is
+                queried, or its documents were not precomputed
+    :rtype:     gdbm.gdbm
+    """
+    repo_ids = get_repo_ids(consumer_id, repo_id)
+    if not repo_ids or len(repo_ids) != 1:
+        return None
+    for distributor in model.Distributor.objects(repo_id__in=repo_ids):
+        db_path = _get_db_path(distributor, constants.REPO_V3_DATA_FILENAME)
+        try:
+            return gdbm.open(db_path, 'r')
+        except gdbm.error:
+            # published before the documents were precomputed
+            continue
+    return None
+
+
 # this just provides a convenient way to access each config key and value from
 # the following function
 PROTOCOL_CONFIG_KEYS = {
@@ -154,10 +259,8 @@ def get_repo_data(repo_ids):
     ret = {}
     for distributor in model.Distributor.objects(repo_id__in=repo_ids):
         publish_protocol = _get_protocol_from_distributor(distributor)
-        protocol_key, protocol_default_value = PROTOCOL_CONFIG_KEYS[publish_protocol]
-        repo_path = distributor['config'].get(protocol_key, protocol_default_value)
         repo_id = distributor['repo_id']
-        db_path = os.path.join(repo_path, repo_id, constants.REPO_DEPDATA_FILENAME)
+        db_path = _get_db_path(distributor, constants.REPO_DEPDATA_FILENAME)
         try:
             ret[repo_id] = {'db': gdbm.open(db_path, 'r'), 'protocol': publish_protocol}
         except gdbm.error:
@@ -166,6 +269,24 @@ def get_repo_data(repo_ids):
     return ret
 
 
+def _get_db_path(distributor, filename):
+    """
+    :param distributor: distributor as returned by
+                        pulp.server.managers.RepoDistributorManager, should be
+                        a dict with keys 'config' and 'repo_id'
+    :type  distributor: dict
+    :param filename:    name of the database file at the root of the repository
+    :type  filename:    str
+
+    :return:    full path to the database file of the published repository
+    :rtype:     str
+    """
+    publish_protocol = _get_protocol_from_distributor(distributor)
+    protocol_key, protocol_default_value = PROTOCOL_CONFIG_KEYS[publish_protocol]
+    repo_path = distributor['config'].get(protocol_key, protocol_default_value)
+    return os.path.join(repo_path, distributor['repo_id'], filename)
+
+
 def _get_protocol_from_distributor(distributor):
     """
     Look at a distributor's config and determine what protocol it gets published
@@ -0,0 +1,131 @@
+"""
+Documents served by the forge v3 API. They are built on request by the views, and for
+each module in a repository when it is published so that the views can serve them as
+they were stored.
+"""
+
+from distutils.version import StrictVersion
+
+
+# Keys of the documents in the database of precomputed documents
+# Substitutions: module name in form "author/title"
+MODULE_KEY = 'modules/%s'
+# Holds the versions of the module, in the order its releases are listed
+RELEASES_KEY = 'releases/%s'
+# Substitutions: module name in form "author/title", version
+RELEASE_KEY = 'releases/%s/%s'
+
+
+def module_slug(module_name):
+    """
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+
+    :return: name of the module in form "author-title", as the forge v3 API names it
+    :rtype:  str
+    """
+    return module_name.replace('/', '-', 1)
+
+
+def release_document(name, module):
+    """
+    Builds the description of a single release of a module listed by the releases
+    view.
+
+    :param name: name of the module to list the release under
+    :type  name: str
+    :param module: the release as built by pulp_puppet.forge.unit.Unit.to_dict
+    :type  module: dict
+
+    :return: description of the release
+    :rtype:  dict
+    """
+    formatted_dependencies = []
+    for dep in module.get('dependencies', []):
+        formatted_dependencies.append({
+            'name': dep[0],
+            'version_requirement': dep[1]
+        })
+    return {
+        'metadata': {
+            'name': name,
+            'version': module.get('version'),
+            'dependencies': formatted_dependencies
+        },
+        'file_uri': module.get('file'),
+        'file_md5': module.get('file_md5')
+    }
+
+
+def module_document(module_name, module_list):
+    """
+    Builds the description of a module and its releases served by the modules view.
+
+    :param module_name: name of the module in form "author/title"
+    :type  module_name: str
+    :param module_list: the releases of the module as built by
+                        pulp_puppet.forge.unit.Unit.to_dict
+    :type  module_list: list of dict
+
+    :return: description of the module
+    :rtype:  dict
+
+    :raise ValueError: if a version of the module is not a valid version number
+    """
+    clean_author, clean_name = module_name.split('/')
+    slug = module_slug(module_name)
+
+    formatted_results = {
+        'uri': '/v3/modules/' + slug,
+        'slug': slug,
+        'name': clean_name,
+        'created_at': '2015-09-11 07:22:37 -0700',
+        'updated_at': '2016-01-06 12:58:15 -0800',
+        # 'supported': false,
+        'endorsement': None,
+        'module_group': 'base',
+        'current_release': {
+            'module': {
+                'uri': '/v3/modules/' + slug,
+                'slug': slug,
+                'name': clean_name,
+                'owner': {
+                    'slug': clean_author,
+                    'username': clean_author
+                }
+            },
+        },
+        'releases': []
+
+    }
+
+    versions = []
+    module_data = {}
+    for module in module_list:
+        module_release = release_document(slug, module)
+        module_release['version'] = module.get('version')
+        module_release['slug'] = slug + '-' + module.get('version')
+
+        versions.append(module.get('version'))
+        module_data[module.get('version')] = module_release
+
+    versions.sort(key=StrictVersion)
+    current_version = versions.pop()
+
+    for attribute, value in module_data[current_version].iteritems():
+        formatted_results['current_release'][attribute] = value
+
+    release_data = []
+    for version, module in module_data.iteritems():
+        release_data.append({
+            'uri': '/v3/releases/' + str(module['slug']),
+            'slug':  module['slug'],
+            'version': version,
+            'supported': False,
+            'created_at': None,
+            'deleted_at': None
+        })
+
+    formatted_results['releases'] = release_data
+
+    return formatted_results
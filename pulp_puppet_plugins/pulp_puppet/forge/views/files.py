@@ -1,4 +1,5 @@
 import base64
+import json
 import re
 import urllib
 
@@ -135,9 +136,16 @@ class FilesPost36View(FilesView):
 
     def get_releases(self, *args, **kwargs):
         """
-        Get the list of matching releases
+        Get the list of matching releases. The releases precomputed when the repository
+        was published are used when there are any.
 
         :return: The matching modules
         :rtype: dict
         """
+        module_name = kwargs['module_name']
+        precomputed = releases.v3_releases(*args, module_name=module_name,
+                                           version=kwargs.get('version'))
+        if precomputed is not None:
+            return {module_name: [{'file': json.loads(release)['file_uri']}
+                                  for release in precomputed]}
         return releases.view(*args, recurse_deps=False, view_all_matching=True, **kwargs)
@@ -5,11 +5,9 @@ from django.http import HttpResponseNotFound, HttpResponse, HttpResponseBadReque
 
 from pulp.server.webservices.views.util import generate_json_response
 
-from pulp_puppet.forge import releases
+from pulp_puppet.forge import releases, v3
 from pulp_puppet.forge.views.abstract import AbstractForgeView
 
-from distutils.version import StrictVersion
-
 MODULE_PATTERN = re.compile('(^[a-zA-Z0-9]+)(/|-)([a-zA-Z0-9_]+)$')
 
 
@@ -107,11 +105,17 @@ class ModulesPost36View(ModulesView):
 
     def get_releases(self, *args, **kwargs):
         """
-        Get the list of matching releases
+        Get the list of matching releases. When all releases are requested, the
+        description of the module precomputed when the repository was published is
+        served instead if there is one.
 
-        :return: The matching modules
-        :rtype: dict
+        :return: The matching modules, or the response serving the precomputed module
+        :rtype: dict or django.http.HttpResponse
         """
+        if not kwargs.get('version'):
+            precomputed = releases.v3_module(*args, module_name=kwargs['module_name'])
+            if precomputed is not None:
+                return HttpResponse(precomputed, content_type='application/json')
         return releases.view(*args, recurse_deps=False, view_all_matching=True, **kwargs)
 
     def format_results(self, data, get_dict, path, module_name):
@@ -129,78 +133,5 @@ class ModulesPost36View(ModulesView):
         :return: the body of what should be streamed out to the caller
         :rtype: str
         """
-        # module_name = get_dict.get('module', '')
-        # clean_name = self._get_module_name(module_name)
-        clean_name = module_name.split('/')[1]
-        clean_author = self._get_module_author(module_name)
-        module_slug = clean_author + '-' + clean_name
-
-        formatted_results = {
-            'uri': '/v3/modules/' + module_slug,
-            'slug': module_slug,
-            'name': clean_name,
-            'created_at': '2015-09-11 07:22:37 -0700',
-            'updated_at': '2016-01-06 12:58:15 -0800',
-            # 'supported': false,
-            'endorsement': None,
-            'module_group': 'base',
-            'current_release': {
-                'module': {
-                    'uri': '/v3/modules/' + module_slug,
-                    'slug': module_slug,
-                    'name': clean_name,
-                    'owner': {
-                        'slug': clean_author,
-                        'username': clean_author
-                    }
-                },
-            },
-            'releases': []
-
-        }
-
-        module_list = data.get(module_name)
-
-        versions = []
-        module_data = {}
-        for module in module_list:
-            formatted_dependencies = []
-            for dep in module.get('dependencies', []):
-                formatted_dependencies.append({
-                    'name': dep[0],
-                    'version_requirement': dep[1]
-                })
-
-            versions.append(module.get('version'))
-            module_data[module.get('version')] = {
-                'metadata': {
-                    'name': module_slug,
-                    'version': module.get('version'),
-                    'dependencies': formatted_dependencies
-                },
-                'file_uri': module.get('file'),
-                'file_md5': module.get('file_md5'),
-                'version': module.get('version'),
-                'slug': module_slug + '-' + module.get('version')
-            }
-
-        versions.sort(key=StrictVersion)
-        current_version = versions.pop()
-
-        for attribute, value in module_data[current_version].iteritems():
-            formatted_results['current_release'][attribute] = value
-
-        release_data = []
-        for version, module in module_data.iteritems():
-            release_data.append({
-                'uri': '/v3/releases/' + str(module['slug']),
-                'slug':  module['slug'],
-                'version': version,
-                'supported': False,
-                'created_at': None,
-                'deleted_at': None
-            })
-
-        formatted_results['releases'] = release_data
-
-        return generate_json_response(formatted_results)
\ No newline at end of file
+        return generate_json_response(v3.module_document(module_name,
+                                                         data.get(module_name)))
@@ -1,13 +1,12 @@
 import base64
+import json
 import re
 import urllib
 
 from django.http import HttpResponseNotFound, HttpResponse, HttpResponseBadRequest
 
-from pulp.server.webservices.views.util import generate_json_response
-
 from pulp_puppet.forge.views.abstract import AbstractForgeView
-from pulp_puppet.forge import releases
+from pulp_puppet.forge import releases, v3
 
 
 MODULE_PATTERN = re.compile('(^[a-zA-Z0-9]+)(/|-)([a-zA-Z0-9_]+)$')
@@ -97,19 +96,25 @@ class ReleasesPost36View(ReleasesView):
 
     def get_releases(self, *args, **kwargs):
         """
-        Get the list of matching releases
+        Get the list of matching releases. The releases precomputed when the repository
+        was published are used when there are any.
 
-        :return: The matching modules
-        :rtype: dict
+        :return: The matching modules, or the JSON serialized precomputed releases
+        :rtype: dict or list of str
         """
+        precomputed = releases.v3_releases(*args, module_name=kwargs['module_name'],
+                                           version=kwargs.get('version'))
+        if precomputed is not None:
+            return precomputed
         return releases.view(*args, recurse_deps=False, view_all_matching=True, **kwargs)
 
     def format_results(self, data, get_dict, path):
         """
         Format the results and begin streaming out to the caller for the v3 API
 
-        :param data: The module data to stream back to the caller
-        :type data: dict
+        :param data: The module data to stream back to the caller, or the JSON serialized
+                     releases precomputed when the repository was published
+        :type data: dict or list of str
         :param get_dict: The GET parameters
         :type get_dict: dict
         :param path: The path starting with parameters
@@ -132,45 +137,50 @@ class ReleasesPost36View(ReleasesView):
         else:
             previous_path = None
 
-        formatted_results = {
-            'pagination': {
-                'limit': limit,
-                'offset': current_offset,
-                'first': first_path,
-                'previous': previous_path,
-                'current': current_path,
-                'next': None,
-                'total': 1
-            },
-            'results': []
+        pagination = {
+            'limit': limit,
+            'offset': current_offset,
+            'first': first_path,
+            'previous': previous_path,
+            'current': current_path,
+            'next': None,
+            'total': 1
         }
-        module_list = data.get(self._get_module_name(get_dict))
-        total_count = len(module_list)
-
-        for module in module_list[current_offset: (current_offset + limit)]:
-            formatted_dependencies = []
-            for dep in module.get('dependencies', []):
-                formatted_dependencies.append({
-                    'name': dep[0],
-                    'version_requirement': dep[1]
-                })
-            module_data = {
-                'metadata': {
-                    'name': module_name,
-                    'version': module.get('version'),
-                    'dependencies': formatted_dependencies
-                },
-                'file_uri': module.get('file'),
-                'file_md5': module.get('file_md5')
-            }
-
-            formatted_results['results'].append(module_data)
-
-        formatted_results['pagination']['total'] = total_count
+
+        if isinstance(data, list):
+            # Releases precomputed when the repository was published, already serialized
+            total_count = len(data)
+            page = data[current_offset: (current_offset + limit)]
+            if module_name != v3.module_slug(self._get_module_name(get_dict)):
+                # They name the module as the forge does; name it as requested instead
+                page = [self._rename_release(release, module_name) for release in page]
+        else:
+            module_list = data.get(self._get_module_name(get_dict))
+            total_count = len(module_list)
+            page = [json.dumps(v3.release_document(module_name, module))
+                    for module in module_list[current_offset: (current_offset + limit)]]
+
+        pagination['total'] = total_count
 
         if total_count > (current_offset + limit):
             next_path = self._format_query_string(path, module_name, module_version,
                                                   current_offset + limit, limit)
-            formatted_results['pagination']['next'] = next_path
+            pagination['next'] = next_path
+
+        # The results are already serialized, so the document is assembled around them
+        body = '{"pagination": %s, "results": [%s]}' % (json.dumps(pagination), ', '.join(page))
+        return HttpResponse(body, content_type='application/json')
 
-        return generate_json_response(formatted_results)
+    @staticmethod
+    def _rename_release(release, name):
+        """
+        :param release: JSON serialized description of a release
+        :type release: str
+        :param name: name of the module to list the release under
+        :type name: str
+        :return: the JSON serialized description of the release listed under the name
+        :rtype: str
+        """
+        release = json.loads(release)
+        release['metadata']['name'] = name
+        return json.dumps(release)
@@ -1,3 +1,8 @@
+from collections import namedtuple
+from cStringIO import StringIO
+import errno
+import os
+
 from mongoengine import ListField, StringField
 from pulp.common.compat import json
 from pulp.server.db.model import FileContentUnit
@@ -16,6 +21,8 @@ class RepositoryMetadata(object):
 
     def __init__(self):
         self.modules = []
+        # unit keys of the records added by update_records_from_json
+        self._record_keys = set()
 
     def update_from_json(self, metadata_json):
         """
@@ -35,6 +42,27 @@ class RepositoryMetadata(object):
             module = Module.from_metadata(module_dict)
             self.modules.append(module)
 
+    def update_records_from_json(self, metadata_json):
+        """
+        Updates this metadata instance with lightweight records of the modules found in
+        the given JSON document. The document is parsed one module at a time and only the
+        unit key and tags of each module are kept, which keeps the memory used for large
+        documents low. This can be called multiple times to merge multiple repository
+        metadata JSON documents into this instance; a module listed more than once is
+        only added the first time.
+
+        :param metadata_json: repository metadata JSON document
+        :type  metadata_json: str
+
+        :raise ValueError: if the document cannot be parsed
+        """
+        for module_dict in metadata_parser.iter_json_array(metadata_json):
+            record = ModuleRecord.from_metadata(module_dict)
+            unit_key = (record.author, record.name, record.version)
+            if unit_key not in self._record_keys:
+                self._record_keys.add(unit_key)
+                self.modules.append(record)
+
     def to_json(self):
         """
         Return the repository metadata as a JSON representation.
@@ -42,14 +70,69 @@ class RepositoryMetadata(object):
         :return: The repository metadata as json.
         :rtype: str
         """
-        repo_metadata_dict = []
-        for module in self.modules:
+        fp = StringIO()
+        self.write_json(fp)
+        return fp.getvalue()
+
+    def write_json(self, fp):
+        """
+        Writes the JSON representation of the repository metadata to the given file.
+        The document is written one module at a time, so it is never held in memory in
+        full and the modules may be any iterable, such as a cursor over the units in
+        the repository.
+
+        :param fp: file to write the metadata to
+        :type  fp: file
+        """
+        fp.write('[')
+        for i, module in enumerate(self.modules):
+            if i:
+                fp.write(', ')
             module_metadata = {'name': module.name, 'author': module.author,
                                'version': module.version, 'tag_list': module.tag_list}
-            repo_metadata_dict.append(module_metadata)
+            fp.write(json.dumps(module_metadata))
+        fp.write(']')
+
+
+class ModuleRecord(namedtuple('ModuleRecord', ['author', 'name', 'version', 'tag_list',
+                                               'file_uri', 'file_md5'])):
+    """
+    Lightweight description of a module listed in repository metadata. Feeds that
+    describe where each module file lives and its md5 (the forge v3 API) also fill in
+    file_uri and file_md5; otherwise they are None.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, author, name, version, tag_list, file_uri=None, file_md5=None):
+        return super(ModuleRecord, cls).__new__(cls, author, name, version, tag_list,
+                                                file_uri, file_md5)
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """
+        :param metadata: a single module entry of a repository metadata document
+        :type  metadata: dict
+
+        :return: record of the module
+        :rtype:  ModuleRecord
+        """
+        return cls(metadata.get('author'), metadata.get('name'), metadata.get('version'),
+                   metadata.get('tag_list') or [], metadata.get('file_uri'),
+                   metadata.get('file_md5'))
 
-        # Serialize metadata of all modules in the repo into a single JSON document
-        return json.dumps(repo_metadata_dict)
+    @property
+    def unit_key(self):
+        return dict((field, getattr(self, field)) for field in Module.unit_key_fields)
+
+    def puppet_standard_filename(self):
+        """
+        Returns the Puppet standard filename for this module.
+
+        :return: Puppet standard filename for this module
+        :rtype:  str
+        """
+        return constants.MODULE_FILENAME % (self.author, self.name, self.version)
 
 
 class Module(FileContentUnit):
@@ -70,6 +153,7 @@ class Module(FileContentUnit):
     # Generated at the file level
     checksum = StringField()
     checksum_type = StringField(default=constants.DEFAULT_HASHLIB)
+    file_md5 = StringField()
 
     # From Module Metadata
     source = StringField()
@@ -115,7 +199,7 @@ class Module(FileContentUnit):
         if isinstance(document.checksums, dict):
             document.checksums = [(k, v) for k, v in document.checksums.items()]
 
-    def import_content(self, path, location=None):
+    def import_content(self, path, location=None, link=False):
         """
         The parent class promises to import a content file into platform storage.
         The (optional) *location* may be used to specify a path within the unit
@@ -126,21 +210,56 @@ class Module(FileContentUnit):
 
         In addition to the parent behavior, this overridden method calculates the
         checksum after moving the content to permanent storage if it has not already
-        been provided.
+        been provided. The content may also be hard linked into storage instead of
+        copied, in which case it is copied only if the link cannot be made, such as
+        when the file is on a different file system.
 
         :param path:     The absolute path to the file to be imported.
         :type  path:     str
         :param location: The (optional) location within the unit storage path
                          where the content is to be stored.
         :type  location: str
+        :param link:     True to hard link the file into storage where possible
+        :type  link:     bool
 
         :raises PulpCodedException: PLP0036 if the unit has not been saved.
         :raises PulpCodedException: PLP0037 if *path* is not an existing file.
         """
-        super(Module, self).import_content(path, location=location)
+        if not (link and self._last_updated and os.path.isfile(path) and
+                self._link_content(path, location)):
+            super(Module, self).import_content(path, location=location)
         if self.checksum is None:
             self.checksum = metadata_parser.calculate_checksum(self._storage_path)
-        self.save()
+            self.save()
+
+    def _link_content(self, path, location=None):
+        """
+        Hard links a content file into the unit storage.
+
+        :param path:     The absolute path to the file to be linked.
+        :type  path:     str
+        :param location: The (optional) location within the unit storage path
+                         where the content is to be stored.
+        :type  location: str
+
+        :return: True if the file was linked; False if it must be copied instead
+        :rtype:  bool
+        """
+        destination = self._storage_path
+        if location:
+            destination = os.path.join(destination, location.lstrip('/'))
+        try:
+            os.makedirs(os.path.dirname(destination))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        try:
+            os.link(path, destination)
+        except OSError:
+            # Across file systems, on file systems without hard links, or if the
+            # destination is already there
+            return False
+        return True
 
     def __str__(self):
         """ Backwards compatible with __str__ from pulp.plugins.model.AssociatedUnit """
@@ -10,8 +10,11 @@ DEFAULT_CONFIG = {
     constants.CONFIG_SERVE_HTTPS: constants.DEFAULT_SERVE_HTTPS,
     constants.CONFIG_HTTP_DIR: constants.DEFAULT_HTTP_DIR,
     constants.CONFIG_HTTPS_DIR: constants.DEFAULT_HTTPS_DIR,
+    constants.CONFIG_MASTER_DIR: constants.DEFAULT_MASTER_DIR,
     constants.CONFIG_ABSOLUTE_PATH: constants.DEFAULT_ABSOLUTE_PATH,
-    constants.CONFIG_FILE_HTTPS_DIR: constants.DEFAULT_FILE_HTTPS_DIR
+    constants.CONFIG_FILE_HTTPS_DIR: constants.DEFAULT_FILE_HTTPS_DIR,
+    constants.CONFIG_INCREMENTAL_PUBLISH: constants.DEFAULT_INCREMENTAL_PUBLISH,
+    constants.CONFIG_CHECKSUM_THREADS: constants.DEFAULT_CHECKSUM_THREADS,
 }
 
 
@@ -28,7 +31,9 @@ def validate(config):
 
     validations = (
         _validate_http,
-        _validate_https
+        _validate_https,
+        _validate_incremental_publish,
+        _validate_checksum_threads,
     )
 
     for v in validations:
@@ -62,3 +67,38 @@ def _validate_https(config):
 
     return True, None
 
+
+def _validate_incremental_publish(config):
+    """
+    Validates the incremental publish flag if it is specified.
+    """
+    # The flag is optional
+    if constants.CONFIG_INCREMENTAL_PUBLISH not in config.keys():
+        return True, None
+
+    parsed = config.get_boolean(constants.CONFIG_INCREMENTAL_PUBLISH)
+    if parsed is None:
+        msg_dict = {'k': constants.CONFIG_INCREMENTAL_PUBLISH}
+        return False, _('The value for <%(k)s> must be either "true" or "false"') % msg_dict
+
+    return True, None
+
+
+def _validate_checksum_threads(config):
+    """
+    Validates the number of checksum threads if it is specified.
+    """
+    # The number is optional
+    if constants.CONFIG_CHECKSUM_THREADS not in config.keys():
+        return True, None
+
+    value = config.get(constants.CONFIG_CHECKSUM_THREADS)
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None or parsed < 1 or str(parsed) != str(value).strip():
+        msg_dict = {'k': constants.CONFIG_CHECKSUM_THREADS}
+        return False, _('The value for <%(k)s> must be a positive integer') % msg_dict
+
+    return True, None
@@ -0,0 +1,133 @@
+"""
+Record of what the previous publish of a repository produced, used to publish only
+the changes made to the repository since then.
+"""
+
+import errno
+import json
+import os
+
+from pulp_puppet.common import constants
+
+
+# Name of the file, in the repository's working directory, holding the manifest
+MANIFEST_FILENAME = '.puppet_publish_manifest.json'
+
+# Incremented whenever the layout of a published repository changes, so that
+# repositories published with a different layout are rebuilt
+MANIFEST_VERSION = 2
+
+
+class PublishManifest(object):
+    """
+    The modules a repository was published with, keyed by the path they are served
+    at relative to the root of the published repository.
+
+    :ivar fingerprint: description of the configuration the repository was published
+                       with; see publish_fingerprint()
+    :type fingerprint: dict
+    :ivar modules: relative path of each published module mapped to a list of the full
+                   path to its file in Pulp's storage and its forge key
+    :type modules: dict
+    """
+
+    def __init__(self, fingerprint, modules=None):
+        self.fingerprint = fingerprint
+        self.modules = modules or {}
+
+    def diff(self, current):
+        """
+        Compares the published modules with the modules now in the repository.
+
+        :param current: relative path of each module now in the repository mapped to
+                        the full path to its file in Pulp's storage
+        :type  current: dict
+
+        :return: tuple of the relative paths of the modules that are no longer
+                 published and the relative paths of those to be newly published; a
+                 module whose file changed is in both
+        :rtype:  tuple
+        """
+        removed = [path for path, (storage_path, forge_key) in self.modules.iteritems()
+                   if current.get(path) != storage_path]
+        added = [path for path, storage_path in current.iteritems()
+                 if path not in self.modules or self.modules[path][0] != storage_path]
+        return removed, added
+
+    @classmethod
+    def load(cls, working_dir):
+        """
+        :param working_dir: working directory of the repository being published
+        :type  working_dir: str
+
+        :return: manifest of the previous publish; None if there is none or it cannot
+                 be read
+        :rtype:  PublishManifest
+        """
+        try:
+            with open(os.path.join(working_dir, MANIFEST_FILENAME)) as fp:
+                data = json.load(fp)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        except ValueError:
+            # A corrupt manifest only costs a full publish
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get('modules'), dict):
+            return None
+        return cls(data.get('fingerprint'), data['modules'])
+
+    def save(self, working_dir):
+        """
+        Writes the manifest to disk. The file is replaced atomically so an interrupted
+        write never leaves a corrupt manifest behind.
+
+        :param working_dir: working directory of the repository being published
+        :type  working_dir: str
+        """
+        path = os.path.join(working_dir, MANIFEST_FILENAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump({'fingerprint': self.fingerprint, 'modules': self.modules}, fp)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def remove(working_dir):
+        """
+        Removes the manifest, so the next publish rebuilds the repository.
+
+        :param working_dir: working directory of the repository being published
+        :type  working_dir: str
+        """
+        try:
+            os.remove(os.path.join(working_dir, MANIFEST_FILENAME))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+def publish_fingerprint(repo_id, config):
+    """
+    Describes everything besides the modules that determines what a published
+    repository looks like. A repository may only be published incrementally if its
+    fingerprint is unchanged since the previous publish.
+
+    :param repo_id: ID of the repository being published
+    :type  repo_id: str
+    :param config: configuration of the distributor
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+
+    :return: JSON serializable description of the publish
+    :rtype:  dict
+    """
+    return {
+        'version': MANIFEST_VERSION,
+        'repo_id': repo_id,
+        'http_dir': config.get(constants.CONFIG_HTTP_DIR),
+        'https_dir': config.get(constants.CONFIG_HTTPS_DIR),
+        'serve_http': config.get_boolean(constants.CONFIG_SERVE_HTTP),
+        'serve_https': config.get_boolean(constants.CONFIG_SERVE_HTTPS),
+        'absolute_path': config.get(constants.CONFIG_ABSOLUTE_PATH,
+                                    constants.DEFAULT_ABSOLUTE_PATH),
+    }
@@ -1,22 +1,41 @@
+import errno
 import gdbm
+import gzip
 import hashlib
+import itertools
 import json
 import logging
 import os
 import shutil
 import sys
+import time
 
 from datetime import datetime
 from gettext import gettext as _
+from multiprocessing.pool import ThreadPool
 
-from pulp.server.controllers.repository import find_repo_content_units
+from pulp.server.db.model import RepositoryContentUnit
 
 from pulp_puppet.common import constants
 from pulp_puppet.common.constants import (STATE_FAILED, STATE_RUNNING, STATE_SKIPPED, STATE_SUCCESS)
 from pulp_puppet.common.publish_progress import PublishProgressReport
-from pulp_puppet.plugins.db.models import RepositoryMetadata
+from pulp_puppet.forge import v3
+from pulp_puppet.forge.unit import Unit
+from pulp_puppet.plugins.db.models import Module, RepositoryMetadata
+from pulp_puppet.plugins.distributors.manifest import PublishManifest, publish_fingerprint
 
 
+# Size of the reads made when checksumming a module file; large reads keep the number
+# of requests made to network attached storage low
+CHECKSUM_READ_BUFFER_SIZE = 1024 * 1024
+
+# Fields loaded for the modules in a repository being published
+PUBLISH_FIELDS = Module.unit_key_fields + ('tag_list', 'dependencies', 'file_md5',
+                                           '_storage_path')
+
+# Maximum number of modules loaded by a single query when publishing
+PUBLISH_BATCH_SIZE = 500
+
 _logger = logging.getLogger(__name__)
 
 
@@ -49,6 +68,15 @@ class PuppetModulePublishRun(object):
         self.is_cancelled_call = is_cancelled_call
         self.progress_report = PublishProgressReport(self.publish_conduit)
 
+        # Manifest of the previous publish when only the changes since are published
+        self.previous_manifest = None
+        # Modules published by this run, in the format of PublishManifest.modules
+        self.published_modules = {}
+        # Forge keys of the modules added or removed since the previous publish
+        self.changed_forge_keys = set()
+        # When the md5 of module files began to be calculated
+        self._checksum_start_time = None
+
     def perform_publish(self):
         """
         Performs the publish operation according to the configured state of the
@@ -73,7 +101,7 @@ class PuppetModulePublishRun(object):
                 self._metadata_step(modules)
         finally:
             # One final update before finishing
-            self.progress_report.update_progress()
+            self.progress_report.update_progress(force=True)
             report = self.progress_report.build_final_report()
             return report
 
@@ -83,8 +111,8 @@ class PuppetModulePublishRun(object):
 
         Calls in here should *only* update the modules-related steps in the progress report.
 
-        :return: list of modules in the repository; None if the modules step failed.
-        :rtype: list of pulp_puppet.plugins.db.models.Module or None
+        :return: modules in the repository; None if the modules step failed.
+        :rtype: RepositoryModules or None
         """
         self.progress_report.modules_state = STATE_RUNNING
         # Do not update here; the counts need to be set first by the
@@ -93,9 +121,14 @@ class PuppetModulePublishRun(object):
         start_time = datetime.now()
 
         try:
-            self._init_build_dir()
+            self.previous_manifest = self._previous_manifest()
+            if self.previous_manifest is None:
+                self._init_build_dir()
             modules = self._retrieve_repo_modules()
-            self._symlink_modules(modules)
+            if self.previous_manifest is None:
+                self._symlink_modules(modules)
+            else:
+                self._update_symlinks(modules)
         except Exception, e:
             msg = _('Exception during modules step for repository <%(repo_id)s>')
             msg_dict = {'repo_id': self.repo.repo_id}
@@ -130,8 +163,8 @@ class PuppetModulePublishRun(object):
         publish. Calls in here should *only* update the metadata-related steps
         in the progress report.
 
-        :param modules: list of modules in the repository; empty list if there are none
-        :type modules: list of pulp_puppet.plugins.db.models.Module
+        :param modules: modules in the repository
+        :type modules: RepositoryModules
         """
         self.progress_report.metadata_state = STATE_RUNNING
         self.progress_report.update_progress()
@@ -184,10 +217,55 @@ class PuppetModulePublishRun(object):
 
         os.makedirs(build_dir)
 
+    def _previous_manifest(self):
+        """
+        Loads the manifest of the previous publish if this publish is to apply only the
+        changes made to the repository since then. The manifest is removed from disk
+        either way, so should this publish fail the next one rebuilds the repository.
+
+        :return: manifest of the previous publish; None if the repository is rebuilt
+        :rtype:  pulp_puppet.plugins.distributors.manifest.PublishManifest
+        """
+        working_dir = self.repo_transfer.working_dir
+        manifest = PublishManifest.load(working_dir)
+        PublishManifest.remove(working_dir)
+
+        if not self._incremental() or manifest is None:
+            return None
+        if manifest.fingerprint != self._fingerprint():
+            msg = _('Configuration changed since the previous publish of repository '
+                    '<%(repo_id)s>; rebuilding it')
+            _logger.info(msg, {'repo_id': self.repo.repo_id})
+            return None
+        if not os.path.isdir(self._build_dir()):
+            return None
+        return manifest
+
+    def _incremental(self):
+        """
+        :return: True if only the changes since the previous publish are to be published
+        :rtype:  bool
+        """
+        return bool(self.config.get_boolean(constants.CONFIG_INCREMENTAL_PUBLISH))
+
+    def _fingerprint(self):
+        """
+        :return: description of the configuration this repository is published with
+        :rtype:  dict
+        """
+        return publish_fingerprint(self.repo.repo_id, self.config)
+
     def _cleanup_build_dir(self):
         """
-        Deletes the build directory after a successful publish.
+        Deletes the build directory after a successful publish. When publishing
+        incrementally it is kept instead, along with a manifest of the modules in it,
+        so the next publish only needs to apply the changes made since.
         """
+        if self._incremental():
+            manifest = PublishManifest(self._fingerprint(), self.published_modules)
+            manifest.save(self.repo_transfer.working_dir)
+            return
+
         msg = _('Cleaning up build directory for repository <%(repo_id)s>')
         msg_dict = {'repo_id': self.repo.repo_id}
         _logger.info(msg, msg_dict)
@@ -197,14 +275,14 @@ class PuppetModulePublishRun(object):
 
     def _retrieve_repo_modules(self):
         """
-        Retrieves all modules in the repository.
+        Retrieves the modules in the repository. Only the ids of the modules are held
+        in memory; the modules themselves are loaded a batch at a time as each step
+        iterates over them.
 
-        :return: list of modules in the repository; empty list if there are none
-        :rtype:  list of pulp_puppet.plugins.db.models.Module objects
+        :return: modules in the repository
+        :rtype:  RepositoryModules
         """
-        modules_generator = find_repo_content_units(self.repo, yield_content_unit=True)
-        modules = list(modules_generator)
-        return modules
+        return RepositoryModules.for_repo(self.repo.repo_id)
 
     def _symlink_modules(self, modules):
         """
@@ -213,8 +291,8 @@ class PuppetModulePublishRun(object):
         this call will match the expected structure of how the repository will
         be served.
 
-        :param modules: list of modules in the repository; empty list if there are none
-        :type modules: list of pulp_puppet.plugins.db.models.Module
+        :param modules: modules in the repository
+        :type modules: RepositoryModules
         """
         msg = _('Creating symlinks for modules in repository <%(repo_id)s>')
         msg_dict = {'repo_id': self.repo.repo_id}
@@ -228,20 +306,78 @@ class PuppetModulePublishRun(object):
         self.progress_report.update_progress()
 
         for module in modules:
-            served_relative_path = self._build_relative_path(module)
-            symlink_path = os.path.join(build_dir, served_relative_path)
-            symlink_dir = os.path.dirname(symlink_path)
+            self._symlink_module(build_dir, module)
+            self.progress_report.update_progress()
 
-            try:
-                if not os.path.exists(symlink_dir):
-                    os.makedirs(symlink_dir)
-                os.symlink(module._storage_path, symlink_path)
-                self.progress_report.modules_finished_count += 1
-            except Exception:
-                self.progress_report.add_failed_module(module, sys.exc_info()[2])
+    def _update_symlinks(self, modules):
+        """
+        Brings the symlinks left in the build directory by the previous publish up to
+        date, only touching those of modules added to or removed from the repository
+        since then.
+
+        :param modules: modules in the repository
+        :type modules: RepositoryModules
+        """
+        msg = _('Updating symlinks for modules in repository <%(repo_id)s>')
+        msg_dict = {'repo_id': self.repo.repo_id}
+        _logger.info(msg, msg_dict)
+
+        build_dir = self._build_dir()
+        previous_modules = self.previous_manifest.modules
+        current = dict((self._build_relative_path(m), m._storage_path) for m in modules)
+        removed_paths, added_paths = self.previous_manifest.diff(current)
+
+        for path in removed_paths:
+            _remove_module_file(build_dir, path)
+            self.changed_forge_keys.add(previous_modules[path][1])
+        removed = set(removed_paths)
+        for path, published in previous_modules.iteritems():
+            if path not in removed:
+                self.published_modules[path] = published
+
+        self.progress_report.modules_total_count = len(modules)
+        self.progress_report.modules_finished_count = len(self.published_modules)
+        self.progress_report.modules_error_count = 0
+        self.progress_report.update_progress()
 
+        # Only the paths of the modules are kept from the first pass over the modules,
+        # so the modules to add are loaded again
+        added = set(added_paths)
+        for module in modules:
+            if not added:
+                break
+            path = self._build_relative_path(module)
+            if path not in added:
+                continue
+            added.remove(path)
+            self.changed_forge_keys.add(_forge_key(module))
+            self._symlink_module(build_dir, module)
             self.progress_report.update_progress()
 
+    def _symlink_module(self, build_dir, module):
+        """
+        Creates the symlink to a single module in the build directory, recording the
+        module as published if it succeeds.
+
+        :param build_dir: full path to the directory the repository is built in
+        :type  build_dir: str
+        :param module: puppet module
+        :type  module: pulp_puppet.plugins.db.models.Module
+        """
+        served_relative_path = self._build_relative_path(module)
+        symlink_path = os.path.join(build_dir, served_relative_path)
+        symlink_dir = os.path.dirname(symlink_path)
+
+        try:
+            if not os.path.exists(symlink_dir):
+                os.makedirs(symlink_dir)
+            os.symlink(module._storage_path, symlink_path)
+            self.published_modules[served_relative_path] = [module._storage_path,
+                                                            _forge_key(module)]
+            self.progress_report.modules_finished_count += 1
+        except Exception:
+            self.progress_report.add_failed_module(module, sys.exc_info()[2])
+
     def _build_relative_path(self, module):
         """
         Build a relative path from the repository root to the module.
@@ -269,10 +405,11 @@ class PuppetModulePublishRun(object):
 
     def _generate_metadata(self, modules):
         """
-        Generates the repository metadata document for all modules in the
+        Generates the repository metadata document for all modules in the repository,
+        and a gzip compressed copy of it.
 
-        :param modules: list of modules in the repository; empty list if there are none
-        :type modules: list of pulp_puppet.plugins.db.models.Module
+        :param modules: modules in the repository
+        :type modules: RepositoryModules
         """
         msg = _('Generating metadata for repository <%(repo_id)s>')
         msg_dict = {'repo_id': self.repo.repo_id}
@@ -281,14 +418,17 @@ class PuppetModulePublishRun(object):
         metadata = RepositoryMetadata()
         metadata.modules = modules
 
-        # Write the JSON representation of the metadata to the repository
-        json_metadata = metadata.to_json()
+        # Write the JSON representation of the metadata to the repository, along with a
+        # compressed copy served to clients that accept it
         build_dir = self._build_dir()
         metadata_file = os.path.join(build_dir, constants.REPO_METADATA_FILENAME)
+        with open(metadata_file, 'w') as f:
+            metadata.write_json(f)
 
-        f = open(metadata_file, 'w')
-        f.write(json_metadata)
-        f.close()
+        gz_file = os.path.join(build_dir, constants.REPO_METADATA_GZ_FILENAME)
+        with open(metadata_file, 'rb') as f_in:
+            with gzip.open(gz_file, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
 
     def _generate_dependency_data(self, modules):
         """
@@ -296,98 +436,183 @@ class PuppetModulePublishRun(object):
 
         Generate the dependency metadata that is required to provide the API used by the
         "puppet module" tool. Store the metadata in a gdbm database at the root of the repo.
-        This always overwrites previously published dependency metadata by opening the gdbm
-        database with the 'n' option.
+        This overwrites previously published dependency metadata, except when publishing
+        incrementally, in which case only the entries of the modules with versions added
+        or removed since the previous publish are rewritten.
 
         Generating and storing it at publish time means the API requests will always return
         results that are in-sync with the most recent publish and are not influenced by more
-        recent changes to the repo or its contents.
+        recent changes to the repo or its contents. The documents served by the forge v3
+        API are rendered from the same metadata and stored in a second database, so they
+        need not be built on each request.
 
-        :param modules: list of modules in the repository; empty list if there are none
-        :type modules: list of pulp_puppet.plugins.db.models.Module
+        :param modules: modules in the repository
+        :type modules: RepositoryModules
         """
         filename = os.path.join(self._build_dir(), constants.REPO_DEPDATA_FILENAME)
         msg = _('generating dependency metadata in file %(filename)s')
         msg_dict = {'filename': filename}
         _logger.debug(msg, msg_dict)
-        # opens a new file for writing and overwrites any existing file
-        db = gdbm.open(filename, 'n')
-        try:
-            for module in modules:
+
+        forge_keys = None
+        if self.previous_manifest is not None:
+            forge_keys = self.changed_forge_keys
+
+        grouped = write_dependency_data(
+            filename, self._dependency_entries(modules, forge_keys), forge_keys)
+
+        v3_filename = os.path.join(self._build_dir(), constants.REPO_V3_DATA_FILENAME)
+        write_v3_data(v3_filename, grouped, forge_keys)
+
+        report = self.progress_report
+        if report.metadata_checksum_total_count:
+            msg = _('Calculated the md5 of %(count)d module files for repository '
+                    '<%(repo_id)s> at %(throughput)s bytes per second')
+            msg_dict = {'count': report.metadata_checksum_total_count,
+                        'repo_id': self.repo.repo_id,
+                        'throughput': report.metadata_checksum_throughput}
+            _logger.info(msg, msg_dict)
+
+    def _dependency_entries(self, modules, forge_keys=None):
+        """
+        Generates the dependency metadata of each module, a batch of modules at a time.
+
+        :param modules: modules in the repository
+        :type  modules: RepositoryModules
+        :param forge_keys: if given, only the modules with these forge keys are included
+        :type  forge_keys: collection of str
+
+        :return: tuples of the forge key of a module and its dependency metadata
+        :rtype:  generator
+        """
+        for batch in _batches(modules, PUBLISH_BATCH_SIZE):
+            if forge_keys is not None:
+                batch = [m for m in batch if _forge_key(m) in forge_keys]
+
+            # The md5 is stored on the module when it is imported; only modules whose
+            # file could not be read at that time need to be read here
+            calculated_md5s = self._calculate_md5s(
+                [m._storage_path for m in batch if m.file_md5 is None])
+
+            for module in batch:
                 path = os.path.join(self._repo_path, self._build_relative_path(module))
-                # calculate the checksum
-                with open(module._storage_path, 'rb') as file_handle:
-                    file_hash = hashlib.md5()
-                    while True:
-                        # This leverages the style of 128 chunking size of MD5 and does
-                        # compute the checksum on the entire file.
-                        content = file_handle.read(128)
-                        if not content:
-                            break
-                        file_hash.update(content)
-                    md5_sum = file_hash.hexdigest()
+                md5_sum = module.file_md5 or calculated_md5s[module._storage_path]
                 value = {
                     'file': path,
                     'version': module.version,
                     'dependencies': module.dependencies,
                     'file_md5': md5_sum
                 }
+                yield _forge_key(module), value
 
-                forge_key = '%s/%s' % (module.author, module.name)
+    def _calculate_md5s(self, paths):
+        """
+        Calculates the md5 of module files. The files are read concurrently by a bounded
+        pool of threads; hashing releases the GIL, and reading files from network
+        attached storage is dominated by the latency of each request. The number of
+        files and bytes read and the throughput are reported as the files are read,
+        accumulated over all calls made during the publish.
 
-                try:
-                    module_list = json.loads(db[forge_key])
-                except KeyError:
-                    module_list = []
-                module_list.append(value)
-                db[forge_key] = json.dumps(module_list)
+        :param paths: full paths to the module files
+        :type  paths: list of str
+
+        :return: md5 of each file keyed by its path
+        :rtype:  dict
+        """
+        md5s = {}
+        if not paths:
+            return md5s
+
+        report = self.progress_report
+        if self._checksum_start_time is None:
+            self._checksum_start_time = time.time()
+            report.metadata_checksum_total_count = 0
+            report.metadata_checksum_finished_count = 0
+            report.metadata_checksum_bytes = 0
+        report.metadata_checksum_total_count += len(paths)
+        report.update_progress()
+
+        threads = int(self.config.get(constants.CONFIG_CHECKSUM_THREADS,
+                                      constants.DEFAULT_CHECKSUM_THREADS))
+        pool = ThreadPool(min(threads, len(paths)))
+        try:
+            for path, md5_sum, size in pool.imap_unordered(_file_md5, paths):
+                md5s[path] = md5_sum
+                report.metadata_checksum_finished_count += 1
+                report.metadata_checksum_bytes += size
+                elapsed = time.time() - self._checksum_start_time
+                if elapsed > 0:
+                    report.metadata_checksum_throughput = int(
+                        report.metadata_checksum_bytes / elapsed)
+                report.update_progress()
         finally:
-            db.close()
+            pool.terminate()
+            pool.join()
+
+        return md5s
 
     def _copy_to_published(self):
         """
-        Moves the built repository into the proper locations where it will be
-        hosted. If a directory is found at the destination, it will be deleted
-        first.
+        Makes the built repository live. It is copied once into a new generation in
+        the master directory, and the repository in each protocol's hosting directory
+        is a symlink that is then pointed at the new generation. Replacing a symlink is
+        atomic, so clients see either the previous or the new repository and never one
+        being written. The generation that was live before the swap is kept until the
+        next publish, so requests that already resolved the previous symlink can finish
+        reading from it; older generations are removed.
         """
         msg = ('Making newly built repository live for repository <%s>') % self.repo.repo_id
         _logger.info(msg)
 
-        build_dir = self._build_dir()
-
-        # Remove the existing repository if it's found. It will either
-        # remain deleted if the configuration changed and it shouldn't be
-        # served, or it will be replaced with the newly built one.
-
-        # -- HTTP --------
-        proto_dir = self.config.get(constants.CONFIG_HTTP_DIR)
-        repo_dest_dir = os.path.join(proto_dir, self.repo.repo_id)
-
-        unpublish(proto_dir, self.repo_transfer)
-
-        should_serve = self.config.get_boolean(constants.CONFIG_SERVE_HTTP)
-        if should_serve:
-            shutil.copytree(build_dir, repo_dest_dir, symlinks=True)
-            self.progress_report.publish_http = STATE_SUCCESS
-        else:
-            self.progress_report.publish_http = STATE_SKIPPED
-
-        self.progress_report.update_progress()
+        protocols = (
+            (constants.CONFIG_HTTP_DIR, constants.CONFIG_SERVE_HTTP, 'publish_http'),
+            (constants.CONFIG_HTTPS_DIR, constants.CONFIG_SERVE_HTTPS, 'publish_https'),
+        )
+
+        # Generations live before this publish, possibly still being read from
+        previous_dirs = set()
+        for dir_key, serve_key, state in protocols:
+            link_path = os.path.join(self.config.get(dir_key), self.repo.repo_id)
+            if os.path.islink(link_path):
+                previous_dirs.add(os.readlink(link_path))
+
+        generation_dir = None
+        if any(self.config.get_boolean(serve_key) for dir_key, serve_key, state in protocols):
+            generation_dir = self._create_generation()
+
+        for dir_key, serve_key, state in protocols:
+            proto_dir = self.config.get(dir_key)
+            if self.config.get_boolean(serve_key):
+                _swap_symlink(generation_dir, os.path.join(proto_dir, self.repo.repo_id))
+                setattr(self.progress_report, state, STATE_SUCCESS)
+            else:
+                # Remove the existing repository if it's found, as the configuration
+                # changed and it shouldn't be served
+                unpublish(proto_dir, self.repo_transfer)
+                setattr(self.progress_report, state, STATE_SKIPPED)
+            self.progress_report.update_progress()
 
-        # -- HTTPS --------
-        proto_dir = self.config.get(constants.CONFIG_HTTPS_DIR)
-        repo_dest_dir = os.path.join(proto_dir, self.repo.repo_id)
+        remove_generations(self._master_dir(), keep=previous_dirs | set([generation_dir]))
 
-        unpublish(proto_dir, self.repo_transfer)
+    def _create_generation(self):
+        """
+        Copies the built repository into a new generation in the master directory.
 
-        should_serve = self.config.get_boolean(constants.CONFIG_SERVE_HTTPS)
-        if should_serve:
-            shutil.copytree(build_dir, repo_dest_dir, symlinks=True)
-            self.progress_report.publish_https = STATE_SUCCESS
-        else:
-            self.progress_report.publish_https = STATE_SKIPPED
+        :return: full path to the new generation
+        :rtype:  str
+        """
+        master_dir = self._master_dir()
+        generation = max(_generations(master_dir) or [0]) + 1
+        generation_dir = os.path.join(master_dir, str(generation))
+        shutil.copytree(self._build_dir(), generation_dir, symlinks=True)
+        return generation_dir
 
-        self.progress_report.update_progress()
+    def _master_dir(self):
+        """
+        :return: full path to the directory holding the generations of this repository
+        :rtype:  str
+        """
+        return os.path.join(self.config.get(constants.CONFIG_MASTER_DIR), self.repo.repo_id)
 
     def _build_dir(self):
         """
@@ -402,6 +627,276 @@ class PuppetModulePublishRun(object):
         return build_dir
 
 
+class RepositoryModules(object):
+    """
+    The modules in a repository being published. Each iteration over the modules
+    loads them from the database a batch at a time, with only the fields publishing
+    uses, so no more than a single batch of modules is held in memory at once.
+
+    :ivar unit_ids: ids of the modules in the repository
+    :type unit_ids: list
+    """
+
+    def __init__(self, unit_ids):
+        self.unit_ids = unit_ids
+
+    @classmethod
+    def for_repo(cls, repo_id):
+        """
+        :param repo_id: ID of the repository being published
+        :type  repo_id: str
+
+        :return: modules in the repository
+        :rtype:  RepositoryModules
+        """
+        query = RepositoryContentUnit.objects(repo_id=repo_id,
+                                              unit_type_id=constants.TYPE_PUPPET_MODULE)
+        return cls(list(query.scalar('unit_id')))
+
+    def __len__(self):
+        return len(self.unit_ids)
+
+    def __iter__(self):
+        for i in xrange(0, len(self.unit_ids), PUBLISH_BATCH_SIZE):
+            chunk = self.unit_ids[i:i + PUBLISH_BATCH_SIZE]
+            for module in Module.objects(id__in=chunk).only(*PUBLISH_FIELDS):
+                yield module
+
+
+def write_dependency_data(filename, entries, forge_keys=None):
+    """
+    Writes the dependency metadata of a repository to a new gdbm database. The entries
+    are grouped by their forge key in memory first, so each key is encoded and written
+    exactly once no matter how many versions of the module there are.
+
+    :param filename: full path to the database; an existing file is overwritten
+    :type  filename: str
+    :param entries: tuples of the forge key of a module and the dependency metadata of
+                    one of its versions, in the order the versions are to be listed
+    :type  entries: iterable of tuple
+    :param forge_keys: if given, the existing database is updated instead: the entries
+                       of these keys are replaced, and deleted for keys that have none
+    :type  forge_keys: collection of str
+
+    :return: the values of the entries keyed by their forge key
+    :rtype:  dict
+    """
+    grouped = {}
+    for forge_key, value in entries:
+        grouped.setdefault(forge_key, []).append(value)
+
+    if forge_keys is None:
+        # opens a new file for writing and overwrites any existing file; writes are not
+        # synchronized to disk one at a time since the database is only read once closed
+        db = gdbm.open(filename, 'nf')
+    else:
+        db = gdbm.open(filename, 'wf')
+    try:
+        for forge_key, module_list in grouped.iteritems():
+            db[forge_key] = json.dumps(module_list)
+        for forge_key in set(forge_keys or ()) - set(grouped):
+            try:
+                del db[forge_key]
+            except KeyError:
+                pass
+    finally:
+        db.close()
+    return grouped
+
+
+def write_v3_data(filename, grouped, forge_keys=None):
+    """
+    Writes the documents served by the forge v3 API for each module to a new gdbm
+    database: the description of the module, and of each of its releases along with
+    the order they are listed in.
+
+    :param filename: full path to the database; an existing file is overwritten
+    :type  filename: str
+    :param grouped: dependency metadata of each version of a module keyed by its forge
+                    key, as returned by write_dependency_data
+    :type  grouped: dict
+    :param forge_keys: if given, the existing database is updated instead: the
+                       documents of these keys are replaced, and deleted for keys that
+                       are not in grouped
+    :type  forge_keys: collection of str
+    """
+    if forge_keys is None:
+        db = gdbm.open(filename, 'nf')
+    else:
+        db = gdbm.open(filename, 'wf')
+    try:
+        for forge_key in forge_keys or ():
+            _delete_v3_documents(db, forge_key)
+        for forge_key, values in grouped.iteritems():
+            module_list = [Unit(name=forge_key, db=None, repo_id=None, host=None,
+                                protocol=None, **value).to_dict() for value in values]
+            slug = v3.module_slug(forge_key)
+            versions = []
+            for module in module_list:
+                versions.append(module['version'])
+                db[v3.RELEASE_KEY % (forge_key, module['version'])] = json.dumps(
+                    v3.release_document(slug, module))
+            db[v3.RELEASES_KEY % forge_key] = json.dumps(versions)
+            try:
+                db[v3.MODULE_KEY % forge_key] = json.dumps(
+                    v3.module_document(forge_key, module_list))
+            except ValueError:
+                # Left for the view to build on request, which reports the invalid version
+                pass
+    finally:
+        db.close()
+
+
+def _delete_v3_documents(db, forge_key):
+    """
+    Deletes the forge v3 API documents of a module.
+
+    :param db: database opened for writing
+    :type  db: gdbm.gdbm
+    :param forge_key: forge key of the module
+    :type  forge_key: str
+    """
+    try:
+        versions = json.loads(db[v3.RELEASES_KEY % forge_key])
+    except KeyError:
+        versions = []
+    keys = [v3.RELEASE_KEY % (forge_key, version) for version in versions]
+    keys.extend([v3.RELEASES_KEY % forge_key, v3.MODULE_KEY % forge_key])
+    for key in keys:
+        try:
+            del db[key]
+        except KeyError:
+            pass
+
+
+def _batches(iterable, size):
+    """
+    :param iterable: items to split into batches
+    :type  iterable: iterable
+    :param size: maximum number of items in a batch
+    :type  size: int
+
+    :return: lists of consecutive items
+    :rtype:  generator
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _forge_key(module):
+    """
+    :param module: puppet module
+    :type  module: pulp_puppet.plugins.db.models.Module
+
+    :return: key the module's dependency metadata is listed under
+    :rtype:  str
+    """
+    return '%s/%s' % (module.author, module.name)
+
+
+def _file_md5(path):
+    """
+    Calculates the md5 of a file. Runs on the threads of a pool.
+
+    :param path: full path to the file
+    :type  path: str
+
+    :return: tuple of the path, the md5 of the file and its size in bytes
+    :rtype:  tuple
+    """
+    file_hash = hashlib.md5()
+    size = 0
+    with open(path, 'rb') as file_handle:
+        while True:
+            content = file_handle.read(CHECKSUM_READ_BUFFER_SIZE)
+            if not content:
+                break
+            file_hash.update(content)
+            size += len(content)
+    return path, file_hash.hexdigest(), size
+
+
+def _remove_module_file(root, relative_path):
+    """
+    Removes a module from a built or published repository, along with its directory if
+    no other modules are left in it.
+
+    :param root: full path to the root of the repository
+    :type  root: str
+    :param relative_path: path of the module relative to the root
+    :type  relative_path: str
+    """
+    path = os.path.join(root, relative_path)
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        # Other modules are still in the directory
+        pass
+
+
+def _swap_symlink(target, link_path):
+    """
+    Atomically points a symlink at a new target by renaming a new symlink over it.
+
+    :param target: full path the symlink is to point to
+    :type  target: str
+    :param link_path: full path to the symlink
+    :type  link_path: str
+    """
+    link_dir = os.path.dirname(link_path)
+    if not os.path.isdir(link_dir):
+        os.makedirs(link_dir)
+    if os.path.isdir(link_path) and not os.path.islink(link_path):
+        # Published as a copy of the repository before generations were used, which
+        # cannot be replaced atomically
+        shutil.rmtree(link_path)
+
+    tmp_path = os.path.join(link_dir, '.%s.tmp' % os.path.basename(link_path))
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(target, tmp_path)
+    os.rename(tmp_path, link_path)
+
+
+def _generations(master_dir):
+    """
+    :param master_dir: full path to the directory holding the generations of a repository
+    :type  master_dir: str
+
+    :return: numbers of the generations of the repository
+    :rtype:  list of int
+    """
+    if not os.path.isdir(master_dir):
+        return []
+    return [int(name) for name in os.listdir(master_dir) if name.isdigit()]
+
+
+def remove_generations(master_dir, keep=None):
+    """
+    Removes the generations of a repository, including any left behind by a publish
+    that did not finish.
+
+    :param master_dir: full path to the directory holding the generations of a repository
+    :type  master_dir: str
+    :param keep: full paths to the generations that are not to be removed
+    :type  keep: collection of str
+    """
+    keep = keep or ()
+    for generation in _generations(master_dir):
+        generation_dir = os.path.join(master_dir, str(generation))
+        if generation_dir not in keep:
+            shutil.rmtree(generation_dir)
+
+
 def unpublish_repo(repo, config):
     """
     Performs all clean up required to stop hosting the provided repository.
@@ -418,6 +913,10 @@ def unpublish_repo(repo, config):
         proto_dir = config.get(proto_key)
         unpublish(proto_dir, repo)
 
+    master_dir = os.path.join(config.get(constants.CONFIG_MASTER_DIR), repo.id)
+    if os.path.exists(master_dir):
+        shutil.rmtree(master_dir)
+
 
 def unpublish(protocol_directory, repo):
     """
@@ -431,5 +930,8 @@ def unpublish(protocol_directory, repo):
     """
     repo_dest_dir = os.path.join(protocol_directory, repo.id)
 
-    if os.path.exists(repo_dest_dir):
+    if os.path.islink(repo_dest_dir):
+        # Link to a generation, which is removed with the rest of the generations
+        os.remove(repo_dest_dir)
+    elif os.path.exists(repo_dest_dir):
         shutil.rmtree(repo_dest_dir)
@@ -0,0 +1,311 @@
+"""
+Cache of downloaded modules kept in a repository's working directory between syncs.
+Modules stay in the cache until they have been imported into Pulp, so a sync that
+fails or is canceled part way through only needs to download what it did not already
+retrieve when it is run again.
+"""
+
+import errno
+import hashlib
+import os
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.importers.metadata import CHECKSUM_READ_BUFFER_SIZE
+
+
+# Digests computed for every module as it is downloaded: the checksum stored on the
+# module, and the md5 forges list for each module
+DOWNLOAD_DIGESTS = (constants.DEFAULT_HASHLIB, 'md5')
+
+# Suffix of the file a module is downloaded to; it is renamed into place once the
+# download completes, so a file without the suffix is always a complete download
+PARTIAL_SUFFIX = '.part'
+
+# Suffix of the file recording the digest a module's download completed with; cached
+# modules the feed lists no checksum for are verified against it instead
+DIGEST_SUFFIX = '.' + constants.DEFAULT_HASHLIB
+
+BYTES_PER_MIB = 1024 * 1024
+
+
+class DownloadCache(object):
+    """
+    Directory of downloaded module files, keyed by filename.
+
+    :ivar path: full path to the directory holding the cached files
+    :type path: str
+    :ivar max_size: number of bytes the cached files may occupy before the least
+                    recently used are evicted
+    :type max_size: int
+    """
+
+    def __init__(self, path, max_size):
+        """
+        :param path: full path to the directory holding the cached files; it is
+                     created if it does not exist
+        :type  path: str
+        :param max_size: number of bytes the cached files may occupy
+        :type  max_size: int
+        """
+        self.path = path
+        self.max_size = max_size
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def path_for(self, filename):
+        """
+        :param filename: name of the module file
+        :type  filename: str
+
+        :return: full path the module file is cached at
+        :rtype:  str
+        """
+        return os.path.join(self.path, os.path.basename(filename))
+
+    def partial_path_for(self, filename):
+        """
+        :param filename: name of the module file
+        :type  filename: str
+
+        :return: full path the module file is to be downloaded to
+        :rtype:  str
+        """
+        return self.path_for(filename) + PARTIAL_SUFFIX
+
+    def digest_path_for(self, filename):
+        """
+        :param filename: name of the module file
+        :type  filename: str
+
+        :return: full path to the file recording the digest of the cached module file
+        :rtype:  str
+        """
+        return self.path_for(filename) + DIGEST_SUFFIX
+
+    def get(self, filename, checksum=None, checksum_type=constants.DEFAULT_HASHLIB):
+        """
+        Looks up a completely downloaded module file. A cached file that does not
+        match the given checksum is discarded. Without a checksum, the file is verified
+        against the digest recorded when its download completed, and is discarded if
+        none was recorded. The file is read once to compute all of the
+        DOWNLOAD_DIGESTS, which are returned so it need not be read again.
+
+        :param filename: name of the module file
+        :type  filename: str
+        :param checksum: expected checksum of the file; None to verify it against the
+                         digest recorded for it
+        :type  checksum: str
+        :param checksum_type: name of the hashlib algorithm the checksum was made with
+        :type  checksum_type: str
+
+        :return: tuple of the full path to the cached file and its digests keyed by
+                 algorithm name; both are None if it is not cached
+        :rtype:  tuple
+        """
+        path = self.path_for(filename)
+        if not os.path.isfile(path):
+            return None, None
+        if not checksum:
+            checksum, checksum_type = self._recorded_digest(filename), constants.DEFAULT_HASHLIB
+            if checksum is None:
+                self.remove(filename)
+                return None, None
+        digests = file_digests(path, set(DOWNLOAD_DIGESTS + (checksum_type,)))
+        if digests[checksum_type] != checksum:
+            self.remove(filename)
+            return None, None
+
+        # Mark the file as recently used so it is the last to be evicted
+        os.utime(path, None)
+        return path, digests
+
+    def open_partial(self, filename):
+        """
+        Opens the file a module is to be downloaded to. Its digests are computed as it
+        is written; once it is closed, complete() moves it into place.
+
+        :param filename: name of the module file
+        :type  filename: str
+
+        :return: file to download the module to
+        :rtype:  DigestingFile
+        """
+        return DigestingFile(self.partial_path_for(filename), DOWNLOAD_DIGESTS)
+
+    def complete(self, filename, digests):
+        """
+        Moves a finished download into place, recording its digest so it can be
+        verified when it is looked up again.
+
+        :param filename: name of the module file
+        :type  filename: str
+        :param digests: digests of the download keyed by algorithm name, as computed
+                        by the DigestingFile it was written to
+        :type  digests: dict
+
+        :return: full path to the cached file
+        :rtype:  str
+        """
+        with open(self.digest_path_for(filename), 'w') as f:
+            f.write(digests[constants.DEFAULT_HASHLIB])
+        path = self.path_for(filename)
+        os.rename(self.partial_path_for(filename), path)
+        return path
+
+    def remove(self, filename):
+        """
+        Removes a module file, any partial download of it and its recorded digest from
+        the cache.
+
+        :param filename: name of the module file
+        :type  filename: str
+        """
+        for path in (self.path_for(filename), self.partial_path_for(filename),
+                     self.digest_path_for(filename)):
+            _remove(path)
+
+    def prune(self):
+        """
+        Removes partial downloads, which cannot be resumed, and evicts the least
+        recently used files until the cache fits within its maximum size. Recorded
+        digests are removed along with their file.
+        """
+        entries = []
+        total_size = 0
+        names = os.listdir(self.path)
+        for name in names:
+            path = os.path.join(self.path, name)
+            if not os.path.isfile(path):
+                continue
+            if name.endswith(PARTIAL_SUFFIX):
+                _remove(path)
+                continue
+            if name.endswith(DIGEST_SUFFIX):
+                if name[:-len(DIGEST_SUFFIX)] not in names:
+                    _remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total_size += stat.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total_size <= self.max_size:
+                break
+            self.remove(name)
+            total_size -= size
+
+    def _recorded_digest(self, filename):
+        """
+        :param filename: name of the module file
+        :type  filename: str
+
+        :return: digest recorded when the module file was downloaded; None if there
+                 is none
+        :rtype:  str
+        """
+        try:
+            with open(self.digest_path_for(filename)) as f:
+                return f.read().strip() or None
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+
+class DigestingFile(object):
+    """
+    File opened for writing that computes digests of everything written to it, so a
+    download does not need to be read back to be checksummed.
+
+    :ivar path: full path to the file
+    :type path: str
+    """
+
+    def __init__(self, path, digest_types):
+        """
+        :param path: full path to the file; it is created, or truncated if it exists
+        :type  path: str
+        :param digest_types: names of the hashlib algorithms to compute
+        :type  digest_types: iterable of str
+        """
+        self.path = path
+        self._file = open(path, 'wb')
+        self._hashes = dict((t, hashlib.new(t)) for t in digest_types)
+
+    def write(self, data):
+        self._file.write(data)
+        for h in self._hashes.itervalues():
+            h.update(data)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def digests(self):
+        """
+        :return: hex digests of everything written, keyed by algorithm name
+        :rtype:  dict
+        """
+        return dict((t, h.hexdigest()) for t, h in self._hashes.iteritems())
+
+    def __getattr__(self, name):
+        # Anything else, such as flush, is handled by the file itself
+        return getattr(self._file, name)
+
+
+def file_digests(path, digest_types=DOWNLOAD_DIGESTS):
+    """
+    Computes several digests of a file while reading it once.
+
+    :param path: full path to the file
+    :type  path: str
+    :param digest_types: names of the hashlib algorithms to compute
+    :type  digest_types: iterable of str
+
+    :return: hex digests of the file, keyed by algorithm name
+    :rtype:  dict
+    """
+    hashes = dict((t, hashlib.new(t)) for t in digest_types)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(CHECKSUM_READ_BUFFER_SIZE)
+            if not data:
+                break
+            for h in hashes.itervalues():
+                h.update(data)
+    return dict((t, h.hexdigest()) for t, h in hashes.iteritems())
+
+
+def max_cache_size(config):
+    """
+    :param config: configuration of the importer
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+
+    :return: number of bytes the download cache may occupy
+    :rtype:  int
+    """
+    size = config.get(constants.CONFIG_DOWNLOAD_CACHE_SIZE)
+    if size is None:
+        size = constants.DEFAULT_DOWNLOAD_CACHE_SIZE
+    return int(size) * BYTES_PER_MIB
+
+
+def _remove(path):
+    """
+    Removes a file, ignoring that it does not exist.
+
+    :param path: full path to the file
+    :type  path: str
+    """
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -20,6 +20,12 @@ def validate(config):
         _validate_feed,
         _validate_remove_missing,
         _validate_queries,
+        _validate_download_batch_size,
+        _validate_download_cache_size,
+        _validate_extract_processes,
+        _validate_import_mode,
+        _validate_feed_type,
+        _validate_forge_api,
     )
 
     for v in validations:
@@ -91,3 +97,118 @@ def _validate_remove_missing(config):
         return False, msg
 
     return True, None
+
+
+def _validate_download_batch_size(config):
+    """
+    Validates the number of modules to download per batch if it is specified.
+    """
+    return _validate_positive_int(config, constants.CONFIG_DOWNLOAD_BATCH_SIZE)
+
+
+def _validate_download_cache_size(config):
+    """
+    Validates the maximum size of the download cache if it is specified.
+    """
+    return _validate_positive_int(config, constants.CONFIG_DOWNLOAD_CACHE_SIZE)
+
+
+def _validate_extract_processes(config):
+    """
+    Validates the number of metadata extraction processes if it is specified.
+    """
+    return _validate_positive_int(config, constants.CONFIG_EXTRACT_PROCESSES)
+
+
+def _validate_import_mode(config):
+    """
+    Validates how module files are placed into storage if it is specified.
+    """
+    # The mode is optional
+    if constants.CONFIG_IMPORT_MODE not in config.keys():
+        return True, None
+
+    import_mode = config.get(constants.CONFIG_IMPORT_MODE)
+    if import_mode not in constants.IMPORT_MODES:
+        error_dict = {'import_mode': constants.CONFIG_IMPORT_MODE,
+                      'modes': ', '.join(constants.IMPORT_MODES)}
+        msg = _('The value for <%(import_mode)s> must be one of: %(modes)s') % error_dict
+        return False, msg
+
+    return True, None
+
+
+def _validate_feed_type(config):
+    """
+    Validates the kind of source the feed refers to if it is specified.
+    """
+    # The type is optional; it is detected when not given
+    if constants.CONFIG_FEED_TYPE not in config.keys():
+        return True, None
+
+    feed_type = config.get(constants.CONFIG_FEED_TYPE)
+    if feed_type not in constants.FEED_TYPES:
+        error_dict = {'feed_type': constants.CONFIG_FEED_TYPE,
+                      'types': ', '.join(constants.FEED_TYPES)}
+        msg = _('The value for <%(feed_type)s> must be one of: %(types)s') % error_dict
+        return False, msg
+
+    return True, None
+
+
+def _validate_forge_api(config):
+    """
+    Validates the forge API version if it is specified.
+    """
+    # The version is optional
+    if constants.CONFIG_FORGE_API not in config.keys():
+        return True, None
+
+    forge_api = config.get(constants.CONFIG_FORGE_API)
+    if forge_api not in constants.FORGE_API_VERSIONS:
+        error_dict = {'forge_api': constants.CONFIG_FORGE_API,
+                      'versions': ', '.join(constants.FORGE_API_VERSIONS)}
+        msg = _('The value for <%(forge_api)s> must be one of: %(versions)s') % error_dict
+        return False, msg
+
+    feed = config.get(constants.CONFIG_FEED)
+    if feed and not downloader_factory.supports_forge_api(feed, forge_api):
+        error_dict = {'forge_api': forge_api, 'feed_name': feed}
+        msg = _('The forge API <%(forge_api)s> cannot be used with the feed <%(feed_name)s>')
+        return False, msg % error_dict
+
+    # The v3 releases resource lists the releases of one module at a time
+    if forge_api == constants.FORGE_API_V3 and not config.get(constants.CONFIG_QUERIES):
+        error_dict = {'forge_api': forge_api, 'queries': constants.CONFIG_QUERIES}
+        msg = _('The forge API <%(forge_api)s> requires <%(queries)s> naming the modules to '
+                'synchronize')
+        return False, msg % error_dict
+
+    return True, None
+
+
+def _validate_positive_int(config, key):
+    """
+    Validates that the optional value for the given key is a positive integer.
+
+    :param config: configuration passed in by Pulp
+    :type config: pulp.plugins.config.PluginCallConfiguration
+    :param key: configuration key to validate
+    :type key: str
+
+    :return: tuple of the validation result and an error message
+    :rtype: tuple
+    """
+    if key not in config.keys():
+        return True, None
+
+    value = config.get(key)
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None or parsed < 1 or str(parsed) != str(value).strip():
+        msg = _('The value for <%(key)s> must be a positive integer') % {'key': key}
+        return False, msg
+
+    return True, None
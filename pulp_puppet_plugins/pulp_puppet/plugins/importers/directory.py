@@ -1,14 +1,12 @@
 from contextlib import closing
 from gettext import gettext as _
+from itertools import izip
+from multiprocessing import Pool
 from StringIO import StringIO
-from tempfile import mkdtemp
 from time import time
 from urlparse import urlparse, urljoin
-import json
 import logging
 import os
-import shutil
-import tarfile
 
 from nectar.downloaders.local import LocalFileDownloader
 from nectar.downloaders.threaded import HTTPThreadedDownloader
@@ -20,6 +18,14 @@ from pulp.server.controllers import repository as repo_controller
 from pulp_puppet.common import constants
 from pulp_puppet.common.sync_progress import SyncProgressReport
 from pulp_puppet.plugins.db.models import Module
+from pulp_puppet.plugins.importers import metadata as metadata_parser
+from pulp_puppet.plugins.importers.cache import DownloadCache, max_cache_size
+from pulp_puppet.plugins.importers.downloaders.web import (_conditional_headers,
+                                                           _is_not_modified, _validators)
+from pulp_puppet.plugins.importers.state import SyncState, metadata_digest, sync_fingerprint
+from pulp_puppet.plugins.importers.units import (ExistingModuleIndex, ModuleCommitter,
+                                                 associate_modules, link_content,
+                                                 unit_key_tuple)
 
 
 _logger = logging.getLogger(__name__)
@@ -34,6 +40,24 @@ URL_TO_DOWNLOADER = {
 FETCH_SUCCEEDED = _('Fetched URL: %(url)s destination: %(dst)s')
 FETCH_FAILED = _('Fetch URL: %(url)s failed: %(msg)s')
 IMPORT_MODULE = _('Importing module: %(mod)s')
+ASSOCIATE_MODULE = _('Associating existing module: %(mod)s')
+SKIP_KNOWN_MODULES = _('Skipping %(count)d modules already in repository <%(repo_id)s>')
+MANIFEST_UNCHANGED = _('Manifest for repository <%(repo_id)s> is unchanged; skipping module import')
+EXTRACT_POOL_FAILED = _('Unable to start %(count)d processes to extract module metadata; '
+                        'extracting it serially')
+
+# Key in the importer state under which the last successful directory sync is described
+SYNC_STATE_KEY = 'directory_sync'
+
+# Directory, in the repository's working directory, modules are downloaded into; modules
+# are kept there until imported so an interrupted sync does not download them again
+DOWNLOAD_CACHE_DIR = 'directory-downloads'
+
+# Extension of module files named following the puppet standard
+MODULE_FILE_EXTENSION = '.tar.gz'
+
+# Number of modules handed to an extraction process at a time
+EXTRACT_CHUNK_SIZE = 8
 
 
 class SynchronizeWithDirectory(object):
@@ -52,34 +76,35 @@ class SynchronizeWithDirectory(object):
     :type report: SyncProgressReport
     :ivar canceled: The operation canceled flag.
     :type canceled: bool
-    :ivar tmp_dir: The path to the temporary directory used to download files.
-    :type tmp_dir: str
+    :ivar cache: The cache modules are downloaded into.
+    :type cache: pulp_puppet.plugins.importers.cache.DownloadCache
+    :ivar module_digests: The digests of each fetched module, keyed by path.
+    :type module_digests: dict
+    :ivar module_index: The modules known to Pulp before the sync.
+    :type module_index: pulp_puppet.plugins.importers.units.ExistingModuleIndex
+    :ivar known_unit_keys: The unit keys of the modules in the manifest that were not fetched
+        because they are already in Pulp.
+    :type known_unit_keys: list
     """
 
     @staticmethod
     def _extract_metadata(module_path):
         """
         Extract the puppet module metadata from the tarball at the specified path.
-        Search the tarball content for a file named: */metadata.json and extract
-        it into temporary directory. Then read the file and return the json decoded content.
+        The file named: */metadata.json is read straight out of the tarball and its
+        json decoded content returned. When the module's main directory holds none,
+        the first metadata.json at any depth is used, as modules in a directory feed
+        are not always packaged with a main directory.
 
         :param module_path: The fully qualified path to the module.
         :type module_path: str
 
         :return: The puppet module metadata.
         :rtype: dict
+
+        :raise metadata_parser.ExtractionException: if the metadata cannot be extracted
         """
-        tmp_dir = mkdtemp(dir=os.path.dirname(module_path))
-        try:
-            with closing(tarfile.open(module_path)) as tarball:
-                for member in tarball.getmembers():
-                    path = member.name.split('/')
-                    if path[-1] == constants.MODULE_METADATA_FILENAME:
-                        tarball.extract(member, tmp_dir)
-                        with open(os.path.join(tmp_dir, member.name)) as fp:
-                            return json.load(fp)
-        finally:
-            shutil.rmtree(tmp_dir)
+        return metadata_parser.extract_metadata(module_path, any_depth=True)
 
     def __init__(self, repo, conduit, config):
         """
@@ -95,7 +120,12 @@ class SynchronizeWithDirectory(object):
         self.config = config
         self.report = None
         self.canceled = False
-        self.tmp_dir = None
+        self.cache = None
+        self.module_digests = {}
+        self.module_index = None
+        self.known_unit_keys = []
+        self._manifest_validators = None
+        self._manifest_digest = None
 
     def feed_url(self):
         """
@@ -116,16 +146,18 @@ class SynchronizeWithDirectory(object):
         """
         self.canceled = True
 
-    def _download(self, urls):
+    def _download(self, urls, headers=None):
         """
         Download files by URL.
 
         Encapsulates nectar details and provides a simplified method of downloading files.
 
-        :param urls: A list of tuples: (url, destination).  The *url* and *destination* are both
-                     strings.  The *destination* is the fully qualified path to where the file is
-                     to be downloaded.
+        :param urls: A list of tuples: (url, destination).  The *url* is a string.  The
+                     *destination* is either the fully qualified path to where the file is to be
+                     downloaded or an open file it is written to.
         :type urls: list
+        :param headers: Optional HTTP headers to send with every request.
+        :type headers: dict
 
         :return: The nectar reports.  Tuple of: (succeeded_reports, failed_reports)
         :rtype: tuple
@@ -138,7 +170,7 @@ class SynchronizeWithDirectory(object):
 
         request_list = []
         for url, destination in urls:
-            request_list.append(DownloadRequest(url, destination))
+            request_list.append(DownloadRequest(url, destination, headers=headers))
         downloader.download(request_list)
         nectar_config.finalize()
 
@@ -166,11 +198,21 @@ class SynchronizeWithDirectory(object):
         self.report.metadata_query_finished_count = 0
         self.report.update_progress()
 
+        # Validators recorded by the last successful sync may only be used if nothing else
+        # that influences the outcome of the sync has changed since
+        previous_sync = self._previous_sync()
+
         # download manifest
         destination = StringIO()
         feed_url = self.feed_url()
         url = urljoin(feed_url, constants.MANIFEST_FILENAME)
-        succeeded_reports, failed_reports = self._download([(url, destination)])
+        headers = _conditional_headers(previous_sync.get('validators'))
+        succeeded_reports, failed_reports = self._download([(url, destination)], headers=headers)
+
+        # report manifest unchanged since the last sync
+        if failed_reports and _is_not_modified(failed_reports[0]):
+            self._manifest_unchanged(started)
+            return None
 
         # report download failed
         if failed_reports:
@@ -187,17 +229,125 @@ class SynchronizeWithDirectory(object):
         self.report.metadata_execution_time = time() - started
         self.report.update_progress()
 
+        content = destination.getvalue()
+        self._manifest_validators = _validators(succeeded_reports[0])
+        self._manifest_digest = metadata_digest([content])
+        if self._manifest_digest == previous_sync.get('digest'):
+            self._manifest_unchanged(started)
+            return None
+
         # return parsed manifest
-        entries = destination.getvalue().split('\n')
+        entries = content.split('\n')
         manifest = [tuple(e.split(',')) for e in entries if e]
         return manifest
 
-    def _fetch_modules(self, manifest):
+    def _manifest_unchanged(self, started):
+        """
+        Updates the progress report for a sync whose manifest has not changed since the
+        last successful sync, in which case there are no modules to import.
+
+        :param started: when fetching the manifest started
+        :type started: float
+        """
+        _logger.info(MANIFEST_UNCHANGED, dict(repo_id=self.repo.id))
+
+        self.report.metadata_state = constants.STATE_SUCCESS
+        self.report.metadata_query_finished_count = 1
+        self.report.metadata_current_query = None
+        self.report.metadata_execution_time = time() - started
+
+        self.report.modules_state = constants.STATE_SUCCESS
+        self.report.modules_execution_time = 0
+        self.report.modules_total_count = 0
+        self.report.modules_finished_count = 0
+        self.report.modules_error_count = 0
+        self.report.update_progress()
+
+    def _previous_sync(self):
+        """
+        Returns what was recorded about the last successful sync, provided it is
+        still applicable to this one.
+
+        :return: dict with the keys validators and digest; empty if not applicable
+        :rtype: dict
+        """
+        previous_sync = SyncState(self.repo.working_dir).get(SYNC_STATE_KEY)
+        if not previous_sync:
+            return {}
+        if previous_sync.get('fingerprint') != sync_fingerprint(self.repo, self.config):
+            return {}
+        return previous_sync
+
+    def _record_sync(self):
+        """
+        Records the validators and digest of the manifest imported by this sync so the
+        next sync can skip the module phase if the manifest has not changed.
+        """
+        state = SyncState(self.repo.working_dir)
+        state.set(SYNC_STATE_KEY, {
+            'fingerprint': sync_fingerprint(self.repo, self.config),
+            'validators': self._manifest_validators,
+            'digest': self._manifest_digest,
+        })
+        state.save()
+
+    def _skip_known_modules(self, manifest):
+        """
+        Remove the modules already in Pulp from the manifest, so they are not fetched.
+        A module in the repository is recognized by the checksum listed in the manifest or,
+        if the module has no comparable checksum, by the unit key in its file name. A module
+        in Pulp but not in the repository is recognized by its checksum and associated.
+
+        :param manifest: A parsed PULP_MANIFEST. List of: (name,checksum,size).
+        :type manifest: list
+
+        :return: A tuple of: (the manifest entries to fetch, the number of modules associated).
+        :rtype: tuple
+        """
+        self.module_index = ExistingModuleIndex(self.repo.repo_obj)
+        self.known_unit_keys = []
+
+        remaining = []
+        for entry in manifest:
+            path, checksum = entry[0], entry[1]
+            unit_key = self.module_index.find_file_in_repo(checksum,
+                                                           _unit_key_from_filename(path))
+            if unit_key is None:
+                remaining.append(entry)
+            else:
+                self.known_unit_keys.append(unit_key)
+                self.cache.remove(path)
+        if self.known_unit_keys:
+            _logger.info(SKIP_KNOWN_MODULES, dict(count=len(self.known_unit_keys),
+                                                  repo_id=self.repo.id))
+
+        found = self.module_index.find_outside_repo_by_checksum([e[1] for e in remaining])
+        if not found:
+            return remaining, 0
+
+        associate_modules(self.repo.repo_obj, [module_id for k, module_id in found.values()])
+        self.known_unit_keys.extend(unit_key for unit_key, module_id in found.values())
+        for entry in remaining:
+            if entry[1] in found:
+                self.cache.remove(entry[0])
+        to_fetch = [e for e in remaining if e[1] not in found]
+        return to_fetch, len(remaining) - len(to_fetch)
+
+    def _fetch_modules(self, manifest, associated_count=0):
         """
         Fetch all of the modules referenced in the manifest.
 
         :param manifest: A parsed PULP_MANIFEST. List of: (name,checksum,size).
         :type manifest: list
+        :param associated_count: The number of modules in the PULP_MANIFEST that were
+            associated without being fetched.
+        :type associated_count: int
+
+        Modules left in the download cache by an earlier sync, and matching the checksum
+        listed in the manifest, are not downloaded again. The digests of each module are
+        computed as it is downloaded and kept in module_digests. When the feed is a local
+        directory and module files are hard linked into storage, they are used where they
+        are instead of being copied.
 
         :return: A list of paths to the fetched module files.
         :rtype: list
@@ -206,19 +356,44 @@ class SynchronizeWithDirectory(object):
 
         # report progress: started
         self.report.modules_state = constants.STATE_RUNNING
-        self.report.modules_total_count = len(manifest)
-        self.report.modules_finished_count = 0
+        self.report.modules_total_count = len(manifest) + associated_count
+        self.report.modules_finished_count = associated_count
         self.report.modules_error_count = 0
         self.report.update_progress()
 
-        # download modules
+        # download modules missing from the cache
+        module_paths = {}
+        paths_by_url = {}
         urls = []
         feed_url = self.feed_url()
+        source_dir = self._linkable_source_dir()
         for path, checksum, size in manifest:
+            if source_dir is not None:
+                source_path = os.path.join(source_dir, path)
+                if os.path.isfile(source_path):
+                    module_paths[path] = source_path
+                    continue
+            cached_path, digests = self.cache.get(path, checksum)
+            if cached_path is not None:
+                module_paths[path] = cached_path
+                self.module_digests[cached_path] = digests
+                continue
             url = urljoin(feed_url, path)
-            destination = os.path.join(self.tmp_dir, os.path.basename(path))
-            urls.append((url, destination))
-        succeeded_reports, failed_reports = self._download(urls)
+            paths_by_url[url] = path
+            urls.append((url, self.cache.open_partial(path)))
+
+        succeeded_reports, failed_reports = [], []
+        if urls:
+            try:
+                succeeded_reports, failed_reports = self._download(urls)
+            finally:
+                for url, destination in urls:
+                    destination.close()
+        for report in succeeded_reports:
+            path = paths_by_url[report.url]
+            digests = report.destination.digests()
+            module_paths[path] = self.cache.complete(path, digests)
+            self.module_digests[module_paths[path]] = digests
 
         # report failed downloads
         if failed_reports:
@@ -230,7 +405,21 @@ class SynchronizeWithDirectory(object):
             self.report.modules_individual_errors.append(report.error_msg)
         self.report.update_progress()
 
-        return [r.destination for r in succeeded_reports]
+        return [module_paths[e[0]] for e in manifest if e[0] in module_paths]
+
+    def _linkable_source_dir(self):
+        """
+        Get the directory module files can be imported from in place. That is the case
+        when the feed is a local directory and the files are hard linked into storage,
+        so copying them first would only add a copy of every module.
+
+        :return: The directory or None if the modules must be fetched.
+        :rtype: str
+        """
+        parsed = urlparse(self.feed_url())
+        if parsed.scheme != 'file' or not link_content(self.config):
+            return None
+        return parsed.path
 
     def _import_modules(self, module_paths):
         """
@@ -241,34 +430,43 @@ class SynchronizeWithDirectory(object):
         :param module_paths: A list of paths to puppet module files.
         :type module_paths: list
         """
-        existing_module_ids_by_key = {}
-        for module in Module.objects.only(*Module.unit_key_fields).all():
-            existing_module_ids_by_key[module.unit_key_str] = module.id
-
-        remote_unit_keys = []
-
-        for module_path in module_paths:
-            if self.canceled:
-                return
-            puppet_manifest = self._extract_metadata(module_path)
-            module = Module.from_metadata(puppet_manifest)
-            remote_unit_keys.append(module.unit_key_str)
-
-            # Even though we've already basically processed this unit, not doing this makes the
-            # progress reporting confusing because it shows Pulp always importing all the modules.
-            if module.unit_key_str in existing_module_ids_by_key:
-                self.report.modules_total_count -= 1
-                continue
-            _logger.debug(IMPORT_MODULE, dict(mod=module_path))
-
-            module.set_storage_path(os.path.basename(module_path))
-            module.save()
-            module.import_content(module_path)
-
-            repo_controller.associate_single_unit(self.repo.repo_obj, module)
-
-            self.report.modules_finished_count += 1
-            self.report.update_progress()
+        module_index = self.module_index or ExistingModuleIndex(self.repo.repo_obj)
+        existing_module_ids_by_key = module_index.repo_ids_by_key
+
+        # Modules that were not fetched because they are already in Pulp are still remote
+        remote_unit_keys = list(self.known_unit_keys)
+        committer = ModuleCommitter(self.repo.repo_obj, link=link_content(self.config))
+
+        with closing(self._iter_metadata(module_paths)) as extracted:
+            for module_path, puppet_manifest in extracted:
+                if self.canceled:
+                    return
+                module = Module.from_metadata(puppet_manifest)
+                remote_unit_keys.append(unit_key_tuple(module))
+
+                # Even though we've already basically processed this unit, not doing this makes
+                # the progress reporting confusing because it shows Pulp always importing all
+                # the modules.
+                if module_index.in_repo(unit_key_tuple(module)):
+                    self.report.modules_total_count -= 1
+                    self.cache.remove(module_path)
+                    continue
+
+                # The module is already in Pulp, so it only needs to be associated
+                known_module_ids_by_key = module_index.find_outside_repo([module])
+                if known_module_ids_by_key:
+                    _logger.debug(ASSOCIATE_MODULE, dict(mod=module_path))
+                    associate_modules(self.repo.repo_obj, known_module_ids_by_key.values())
+                    self.cache.remove(module_path)
+                    self.report.modules_finished_count += 1
+                    self.report.update_progress()
+                    continue
+
+                _logger.debug(IMPORT_MODULE, dict(mod=module_path))
+                digests = self.module_digests.get(module_path)
+                self._record_committed(committer.add(module, module_path, digests=digests))
+
+        self._record_committed(committer.flush())
 
         # Write the report, making sure we don't overwrite a failure in _fetch_modules
         if self.report.modules_state not in constants.COMPLETE_STATES:
@@ -282,15 +480,88 @@ class SynchronizeWithDirectory(object):
         if remove_missing:
             self._remove_missing(existing_module_ids_by_key, remote_unit_keys)
 
+        # Only a complete sync may be used to skip later ones
+        if self.report.modules_state == constants.STATE_SUCCESS and not self.canceled:
+            self._record_sync()
+
+    def _iter_metadata(self, module_paths):
+        """
+        Extract the metadata of each module. When more than one extraction process is
+        configured, the modules are decompressed by a pool of processes and their metadata
+        is yielded as it becomes available, so earlier modules are saved while later ones
+        are still being extracted. Only the metadata is handled by the pool; everything
+        touching the database stays on this process.
+
+        :param module_paths: A list of paths to puppet module files.
+        :type module_paths: list
+
+        :return: A generator of tuples: (module_path, metadata) in the order of module_paths.
+        :rtype: generator
+        """
+        processes = self._extract_processes()
+        pool = None
+        if processes > 1 and len(module_paths) > 1:
+            try:
+                pool = Pool(processes)
+            except (AssertionError, OSError):
+                # Daemonic worker processes are not allowed to have children
+                _logger.warning(EXTRACT_POOL_FAILED, dict(count=processes), exc_info=True)
+
+        if pool is None:
+            for module_path in module_paths:
+                yield module_path, self._extract_metadata(module_path)
+            return
+
+        try:
+            results = pool.imap(_extract_metadata_in_worker, module_paths, EXTRACT_CHUNK_SIZE)
+            for module_path, puppet_manifest in izip(module_paths, results):
+                if puppet_manifest is None:
+                    # Extract it again here so the error is raised as it is when serial
+                    puppet_manifest = self._extract_metadata(module_path)
+                yield module_path, puppet_manifest
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _extract_processes(self):
+        """
+        Get the number of processes to extract module metadata with from the configuration.
+
+        :return: The number of processes.
+        :rtype: int
+        """
+        processes = self.config.get(constants.CONFIG_EXTRACT_PROCESSES)
+        if processes is None:
+            return constants.DEFAULT_EXTRACT_PROCESSES
+        return int(processes)
+
+    def _record_committed(self, results):
+        """
+        Updates the progress report with the outcome of storing new modules. Modules that
+        could not be stored fail the sync but are kept in the download cache.
+
+        :param results: results of storing the modules
+        :type results: list of pulp_puppet.plugins.importers.units.CommitResult
+        """
+        for result in results:
+            if result.error is None:
+                self.cache.remove(result.path)
+                self.report.modules_finished_count += 1
+            else:
+                self.report.add_failed_module(result.module, result.error, result.traceback)
+                self.report.modules_state = constants.STATE_FAILED
+        if results:
+            self.report.update_progress()
+
     def _remove_missing(self, existing_module_ids_by_key, remote_unit_keys):
         """
         Removes units from the local repository if they are missing from the remote repository.
 
         :param existing_module_ids_by_key: A dict keyed on Module unit key associated with the
             current repository. The values are the mongoengine id of the corresponding Module.
-        :type existing_module_ids_by_key: dict of Module.id values keyed on unit_key_str
+        :type existing_module_ids_by_key: dict of Module.id values keyed on unit_key_tuple
         :param remote_unit_keys: A list of all the Module keys in the remote repository
-        :type remote_unit_keys: list of strings
+        :type remote_unit_keys: list of tuples
         """
         keys_to_remove = list(set(existing_module_ids_by_key.keys()) - set(remote_unit_keys))
         doomed_ids = [existing_module_ids_by_key[key] for key in keys_to_remove]
@@ -301,25 +572,26 @@ class SynchronizeWithDirectory(object):
         """
         Invoke the callable object.
 
-        All work is performed in the repository working directory and cleaned up after the call.
+        All work is performed in the repository working directory. Modules that were downloaded
+        but not imported, because the sync failed or was canceled, are kept for the next call.
 
         :return: The final synchronization report.
         :rtype: SyncProgressReport
         """
         self.canceled = False
         self.report = SyncProgressReport(self.conduit)
-        self.tmp_dir = mkdtemp(dir=self.repo.working_dir)
+        cache_dir = os.path.join(self.repo.working_dir, DOWNLOAD_CACHE_DIR)
+        self.cache = DownloadCache(cache_dir, max_cache_size(self.config))
+        self.cache.prune()
         try:
             manifest = self._fetch_manifest()
             if manifest is not None:
-                module_paths = self._fetch_modules(manifest)
+                manifest, associated_count = self._skip_known_modules(manifest)
+                module_paths = self._fetch_modules(manifest, associated_count)
                 self._import_modules(module_paths)
         finally:
             # Update the progress report one last time
-            self.report.update_progress()
-
-            shutil.rmtree(self.tmp_dir)
-            self.tmp_dir = None
+            self.report.update_progress(force=True)
 
         return self.report
 
@@ -358,3 +630,42 @@ class DownloadListener(AggregatingEventListener):
         """
         if self.synchronizer.canceled:
             self.downloader.cancel()
+
+
+def _unit_key_from_filename(path):
+    """
+    Derive the unit key of a module from the name of its file, which is expected to
+    follow the puppet standard: author-name-version.tar.gz.
+
+    :param path: The path of the module file as listed in the PULP_MANIFEST.
+    :type path: str
+
+    :return: The unit key, as returned by unit_key_tuple, or None if the file is not
+        named following the standard.
+    :rtype: tuple
+    """
+    filename = os.path.basename(path)
+    if not filename.endswith(MODULE_FILE_EXTENSION):
+        return None
+    parts = filename[:-len(MODULE_FILE_EXTENSION)].split('-', 2)
+    if len(parts) != 3 or not all(parts):
+        return None
+    values = dict(zip(('author', 'name', 'version'), parts))
+    return tuple(values[field] for field in Module.unit_key_fields)
+
+
+def _extract_metadata_in_worker(module_path):
+    """
+    Extract the metadata of a module in an extraction process. Errors are not sent back
+    to the syncing process, which might not be able to unpickle them.
+
+    :param module_path: The fully qualified path to the module.
+    :type module_path: str
+
+    :return: The puppet module metadata or None if it could not be extracted.
+    :rtype: dict
+    """
+    try:
+        return metadata_parser.extract_metadata(module_path, any_depth=True)
+    except Exception:
+        return None
@@ -10,18 +10,29 @@ class BaseDownloader(object):
         self.conduit = conduit
         self.config = config
         self.downloader = None
+        # Cache validators of the documents fetched by retrieve_metadata, keyed by URL
+        self.metadata_validators = {}
 
-    def retrieve_metadata(self, progress_report):
+    def retrieve_metadata(self, progress_report, validators=None):
         """
         Retrieves all metadata documents needed to fulfill the configuration
         set for the repository. The progress report will be updated as the
         downloads take place.
 
+        Downloaders that support conditional requests use the given validators
+        and record those of the retrieved documents in metadata_validators.
+
         :param progress_report: used to communicate the progress of this operation
         :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
 
+        :param validators: cache validators recorded by a previous call, keyed by URL
+        :type validators: dict
+
         :return: list of JSON documents describing all modules to import
         :rtype: list
+
+        :raise MetadataNotModified: if validators were given and none of the
+               documents changed
         """
         raise NotImplementedError()
 
@@ -61,6 +72,39 @@ class BaseDownloader(object):
         """
         raise NotImplementedError()
 
+    def retrieve_module_batch(self, progress_report, module_list):
+        """
+        Batch version of the retrieve_module method that does not abort on the
+        first failure. Every module in the batch is attempted and the outcome of
+        each is returned so the caller can report failures per module.
+
+        This default implementation retrieves the modules one at a time;
+        subclasses that can download concurrently should override it.
+
+        :param progress_report: used if any updates need to be made as the
+               download runs
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param module_list: list of modules to be downloaded
+        :type module_list: iterable
+
+        :return: tuple of (succeeded, failed); succeeded is a list of
+                 (module, path, digests) tuples and failed is a list of
+                 (module, exception) tuples. digests are the digests of the
+                 module file keyed by algorithm name, if they were computed
+                 while retrieving it, otherwise None.
+        :rtype: tuple
+        """
+        succeeded = []
+        failed = []
+        for module in module_list:
+            try:
+                path = self.retrieve_module(progress_report, module)
+                succeeded.append((module, path, None))
+            except Exception, e:
+                failed.append((module, e))
+        return succeeded, failed
+
     def cancel(self):
         """
         Cancel the current operation.
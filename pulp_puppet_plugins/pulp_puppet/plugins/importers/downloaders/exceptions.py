@@ -43,3 +43,24 @@ class UnauthorizedException(FileRetrievalException):
     (e.g. 401 from a web request, no read perms for a local read).
     """
     pass
+
+
+class ChecksumMismatchException(FileRetrievalException):
+    """
+    Raised if a retrieved file does not match the checksum the feed lists for it.
+    """
+    pass
+
+
+class MetadataNotModified(Exception):
+    """
+    Raised when conditional requests for the repository metadata report that none of
+    the documents changed since the validators were recorded.
+    """
+    def __init__(self, urls, *args):
+        """
+        :param urls: URLs of the unchanged metadata documents
+        :type  urls: list
+        """
+        Exception.__init__(self, urls, *args)
+        self.urls = urls
@@ -7,7 +7,9 @@ from gettext import gettext as _
 import logging
 import urlparse
 
+from pulp_puppet.common import constants
 from pulp_puppet.plugins.importers.downloaders.exceptions import UnsupportedFeedType, InvalidFeed
+from pulp_puppet.plugins.importers.downloaders.forge_v3 import ForgeV3Downloader
 from pulp_puppet.plugins.importers.downloaders.web import HttpDownloader
 from pulp_puppet.plugins.importers.downloaders.local import LocalDownloader
 
@@ -19,6 +21,12 @@ MAPPINGS = {
     'https'  : HttpDownloader,
 }
 
+# Mapping from feed prefix to downloader class when the forge v3 API is configured
+FORGE_V3_MAPPINGS = {
+    'http'  : ForgeV3Downloader,
+    'https'  : ForgeV3Downloader,
+}
+
 logger = logging.getLogger(__name__)
 
 
@@ -50,10 +58,36 @@ def get_downloader(feed, repo, conduit, config):
     if feed_type not in MAPPINGS:
         raise UnsupportedFeedType(feed_type)
 
-    downloader = MAPPINGS[feed_type](repo, conduit, config)
+    mappings = MAPPINGS
+    if config is not None and config.get(constants.CONFIG_FORGE_API) == constants.FORGE_API_V3:
+        mappings = FORGE_V3_MAPPINGS
+        if feed_type not in mappings:
+            raise UnsupportedFeedType(feed_type)
+
+    downloader = mappings[feed_type](repo, conduit, config)
     return downloader
 
 
+def supports_forge_api(feed, forge_api):
+    """
+    Returns whether or not the given forge API version can be used with the feed.
+
+    :param feed: repository source
+    :type  feed: str
+    :param forge_api: one of constants.FORGE_API_VERSIONS
+    :type  forge_api: str
+
+    :return: true if a downloader exists for the combination; false otherwise
+    :rtype:  bool
+    """
+    if forge_api != constants.FORGE_API_V3:
+        return True
+    try:
+        return _determine_feed_type(feed) in FORGE_V3_MAPPINGS
+    except InvalidFeed:
+        return False
+
+
 def is_valid_feed(feed):
     """
     Returns whether or not the feed is valid.
@@ -0,0 +1,252 @@
+import urllib
+import urlparse
+
+from cStringIO import StringIO
+
+from nectar.request import DownloadRequest
+
+from pulp.common.compat import json
+from pulp.plugins.util.nectar_config import importer_config_to_nectar_config
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.db.models import Module
+from pulp_puppet.plugins.importers.downloaders import exceptions
+from pulp_puppet.plugins.importers.downloaders.web import HttpDownloader
+
+
+# Number of releases requested per page; servers may return fewer
+PAGE_SIZE = 100
+
+
+class ForgeV3Downloader(HttpDownloader):
+    """
+    Used when the source for puppet modules is a forge implementing the v3 API, such
+    as the Puppet Forge or another Pulp server's forge endpoint. Releases are listed by
+    walking the paginated releases resource instead of downloading modules.json, and
+    each module is downloaded from the file_uri listed for it.
+
+    Each query configured on the importer names a module to list the releases of, as
+    the releases resource of Pulp's forge only lists the releases of a single module.
+    """
+
+    def retrieve_metadata(self, progress_report, validators=None):
+        """
+        Retrieves every page of releases needed to fulfill the configuration set for the
+        repository. The first page of each query reports how many releases there are,
+        after which its remaining pages are requested concurrently. Servers that do not
+        report a total are followed one page at a time using the next links.
+
+        Pages are requested in windows of as many pages as are downloaded concurrently,
+        and each page is converted into a repository metadata document as soon as it is
+        parsed, so at most one window of the API's output is held at a time.
+
+        :param progress_report: used to communicate the progress of this operation
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param validators: unused; the pages of a listing are not cacheable as a whole
+        :type validators: dict
+
+        :return: list of JSON documents describing all modules to import
+        :rtype: list
+        """
+        queries = self.config.get(constants.CONFIG_QUERIES) or []
+
+        progress_report.metadata_query_finished_count = 0
+        progress_report.metadata_query_total_count = 0
+
+        window_size = self._window_size()
+
+        # Tuples of (query, URL, True if it is the first page of the query)
+        pending = [(query, self._releases_url(query, 0), True) for query in queries]
+        documents = []
+        while pending:
+            window, pending = pending[:window_size], pending[window_size:]
+            pages = self._retrieve_pages(progress_report, [url for q, url, f in window])
+            for (query, url, first), page in zip(window, pages):
+                documents.append(_page_to_document(page))
+                if first:
+                    urls = self._remaining_page_urls(query, page)
+                else:
+                    urls = self._next_page_urls(page)
+                pending.extend((query, next_url, False) for next_url in urls)
+
+        return documents
+
+    def retrieve_module_batch(self, progress_report, module_list):
+        """
+        Downloads all of the given modules concurrently and verifies each against the
+        md5 listed for it by the forge, using the md5 computed as it was downloaded.
+
+        :param progress_report: used if any updates need to be made as the download runs
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param module_list: list of modules to be downloaded
+        :type module_list: list of pulp_puppet.plugins.db.models.ModuleRecord
+
+        :return: tuple of (succeeded, failed); succeeded is a list of
+                 (module, path, digests) tuples and failed is a list of
+                 (module, exception) tuples
+        :rtype: tuple
+        """
+        downloaded, failed = super(ForgeV3Downloader, self).retrieve_module_batch(
+            progress_report, module_list)
+
+        succeeded = []
+        for module, path, digests in downloaded:
+            if module.file_md5 and digests['md5'] != module.file_md5:
+                failed.append((module, exceptions.ChecksumMismatchException(path)))
+                self.cleanup_module(module)
+            else:
+                succeeded.append((module, path, digests))
+
+        return succeeded, failed
+
+    def _retrieve_pages(self, progress_report, urls):
+        """
+        Downloads the given pages of releases concurrently and parses them one at a
+        time, releasing each downloaded page once it is parsed.
+
+        :param progress_report: used to communicate the progress of this operation
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param urls: URLs of the pages to retrieve
+        :type urls: list of str
+
+        :return: generator of the parsed pages, in the order of the URLs
+        :rtype: generator
+
+        :raise exceptions.FileRetrievalException: if any of the pages cannot be retrieved
+        """
+        progress_report.metadata_query_total_count += len(urls)
+
+        request_list = [DownloadRequest(url, StringIO()) for url in urls]
+        listener = self._download_metadata(progress_report, request_list)
+
+        for report in listener.failed_reports:
+            raise exceptions.FileRetrievalException(report.error_msg)
+
+        # The listener's reports refer to the requests' buffers as well
+        del listener
+        while request_list:
+            request = request_list.pop(0)
+            page = json.loads(request.destination.getvalue())
+            request.destination.close()
+            yield page
+
+    def _window_size(self):
+        """
+        :return: number of pages requested at once, which is the number of downloads
+                 the importer is configured to run concurrently
+        :rtype: int
+        """
+        nectar_config = importer_config_to_nectar_config(self.config.flatten())
+        try:
+            return nectar_config.max_concurrent
+        finally:
+            nectar_config.finalize()
+
+    def _remaining_page_urls(self, query, page):
+        """
+        Determines the URLs of the pages following the first page of a query.
+
+        :param query: module the releases are listed for
+        :type query: str
+
+        :param page: first page of the query
+        :type page: dict
+
+        :return: URLs of the remaining pages
+        :rtype: list of str
+        """
+        pagination = page.get('pagination') or {}
+        total = pagination.get('total')
+        if total is None:
+            return self._next_page_urls(page)
+
+        limit = pagination.get('limit') or PAGE_SIZE
+        return [self._releases_url(query, offset, limit)
+                for offset in xrange(limit, total, limit)]
+
+    def _next_page_urls(self, page):
+        """
+        Follows the next link of a page whose listing does not report a total; pages
+        requested by offset are not followed as they were all requested up front.
+
+        :param page: page of releases
+        :type page: dict
+
+        :return: URL of the next page, if one needs to be followed
+        :rtype: list of str
+        """
+        pagination = page.get('pagination') or {}
+        if pagination.get('total') is not None or not pagination.get('next'):
+            return []
+        return [urlparse.urljoin(self._feed_url(), pagination['next'])]
+
+    def _releases_url(self, query, offset, limit=PAGE_SIZE):
+        """
+        :param query: module to list the releases of
+        :type query: str
+
+        :param offset: index of the first release on the page
+        :type offset: int
+
+        :param limit: maximum number of releases on the page
+        :type limit: int
+
+        :return: URL of a page of releases
+        :rtype: str
+        """
+        params = [('limit', limit), ('offset', offset), ('module', query)]
+        url = self._feed_url() + constants.FORGE_V3_RELEASES_PATH
+        return '%s?%s' % (url, urllib.urlencode(params))
+
+    def _create_module_url(self, module):
+        """
+        Generates the URL for a module from the file_uri listed for it by the forge.
+
+        :param module: module instance being downloaded
+        :type module: pulp_puppet.plugins.db.models.ModuleRecord
+
+        :return: full URL to download the module
+        :rtype: str
+        """
+        if not module.file_uri:
+            return super(ForgeV3Downloader, self)._create_module_url(module)
+        return urlparse.urljoin(self._feed_url(), module.file_uri)
+
+    def _feed_url(self):
+        """
+        :return: the feed, ending with a slash so paths can be appended to it
+        :rtype: str
+        """
+        feed = self.config.get(constants.CONFIG_FEED)
+        if not feed.endswith('/'):
+            feed += '/'
+        return feed
+
+
+def _page_to_document(page):
+    """
+    Converts a page of the releases resource into a repository metadata document,
+    keeping the file location and md5 of each release.
+
+    :param page: parsed page of releases
+    :type page: dict
+
+    :return: JSON document in the format of modules.json
+    :rtype: str
+    """
+    modules = []
+    for release in page.get('results') or []:
+        metadata = release.get('metadata') or {}
+        module = Module.split_filename(metadata['name'])
+        module.update({
+            'version': metadata.get('version'),
+            'tag_list': metadata.get('tags') or [],
+            'file_uri': release.get('file_uri'),
+            'file_md5': release.get('file_md5'),
+        })
+        modules.append(module)
+    return json.dumps(modules)
+
@@ -19,15 +19,20 @@ class LocalDownloader(BaseDownloader):
     server.
     """
 
-    def retrieve_metadata(self, progress_report):
+    def retrieve_metadata(self, progress_report, validators=None):
         """
         Retrieves all metadata documents needed to fulfill the configuration
         set for the repository. The progress report will be updated as the
         downloads take place.
 
+        Local files are always read in full; the validators are ignored.
+
         :param progress_report: used to communicate the progress of this operation
         :type  progress_report: pulp_puppet.importer.sync_progress.ProgressReport
 
+        :param validators: unused
+        :type  validators: dict
+
         :return: list of JSON documents describing all modules to import
         :rtype:  list
         """
@@ -1,6 +1,8 @@
 import copy
 import errno
+import httplib
 import os
+import time
 
 from cStringIO import StringIO
 
@@ -12,6 +14,7 @@ from pulp.plugins.util.nectar_config import importer_config_to_nectar_config
 
 from pulp_puppet.plugins.importers.downloaders.base import BaseDownloader
 from pulp_puppet.common import constants
+from pulp_puppet.plugins.importers.cache import DownloadCache, max_cache_size
 from pulp_puppet.plugins.importers.downloaders import exceptions
 
 
@@ -23,28 +26,83 @@ class HttpDownloader(BaseDownloader):
     Used when the source for puppet modules is a remote source over HTTP.
     """
 
-    def retrieve_metadata(self, progress_report):
+    def __init__(self, repo, conduit, config):
+        super(HttpDownloader, self).__init__(repo, conduit, config)
+        self._cache = None
+
+    def retrieve_metadata(self, progress_report, validators=None):
         """
         Retrieves all metadata documents needed to fulfill the configuration set for the
         repository. The progress report will be updated as the downloads take place.
 
+        When validators are given, each document is requested conditionally using the ETag
+        and Last-Modified values recorded for its URL. The validators of the documents
+        retrieved are recorded in metadata_validators.
+
         :param progress_report: used to communicate the progress of this operation
         :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
 
+        :param validators: cache validators recorded by a previous call, keyed by URL
+        :type validators: dict
+
         :return: list of JSON documents describing all modules to import
         :rtype: list
+
+        :raise exceptions.MetadataNotModified: if validators were given and the server
+               reported that none of the documents changed
         """
         urls = self._create_metadata_download_urls()
+        validators = validators or {}
 
         # Update the progress report to reflect the number of queries it will take
         progress_report.metadata_query_finished_count = 0
         progress_report.metadata_query_total_count = len(urls)
 
+        request_list = [DownloadRequest(url, StringIO(),
+                                        headers=_conditional_headers(validators.get(url)))
+                        for url in urls]
+        listener = self._download_metadata(progress_report, request_list)
+
+        not_modified = [r.url for r in listener.failed_reports if _is_not_modified(r)]
+        if not_modified and len(not_modified) == len(urls):
+            raise exceptions.MetadataNotModified(not_modified)
+
+        # Only some of the documents are unchanged, but all of them are needed to
+        # determine the modules to import
+        if not_modified:
+            refetch_list = [DownloadRequest(url, StringIO()) for url in not_modified]
+            refetch_listener = self._download_metadata(progress_report, refetch_list)
+            request_list = [r for r in request_list if r.url not in not_modified] + refetch_list
+            listener.succeeded_reports.extend(refetch_listener.succeeded_reports)
+            listener.failed_reports.extend(refetch_listener.failed_reports)
+
+        for report in listener.failed_reports:
+            if not _is_not_modified(report):
+                raise exceptions.FileRetrievalException(report.error_msg)
+
+        self.metadata_validators = {}
+        for report in listener.succeeded_reports:
+            self.metadata_validators[report.url] = _validators(report)
+
+        documents_by_url = dict((r.url, r.destination.getvalue()) for r in request_list)
+        return [documents_by_url[url] for url in urls]
+
+    def _download_metadata(self, progress_report, request_list):
+        """
+        Downloads the given metadata requests.
+
+        :param progress_report: used to communicate the progress of this operation
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param request_list: requests for metadata documents
+        :type request_list: list of nectar.request.DownloadRequest
+
+        :return: the listener holding the reports of the downloads
+        :rtype: HTTPMetadataDownloadEventListener
+        """
         listener = HTTPMetadataDownloadEventListener(progress_report)
         self.downloader = self._create_and_configure_downloader(listener)
 
-        request_list = [DownloadRequest(url, StringIO()) for url in urls]
-
         # Let any exceptions from this bubble up, the caller will update
         # the progress report as necessary
         try:
@@ -53,10 +111,7 @@ class HttpDownloader(BaseDownloader):
             self.downloader.config.finalize()
             self.downloader = None
 
-        for report in listener.failed_reports:
-            raise exceptions.FileRetrievalException(report.error_msg)
-
-        return [r.destination.getvalue() for r in request_list]
+        return listener
 
     def retrieve_module(self, progress_report, module):
         """
@@ -86,28 +141,107 @@ class HttpDownloader(BaseDownloader):
         :return: list of full paths to the temporary locations where the modules are
         :rtype: list
         """
-        listener = HTTPModuleDownloadEventListener(progress_report)
-        self.downloader = self._create_and_configure_downloader(listener)
+        succeeded, failed = self._download_modules(progress_report, module_list)
 
-        request_list = []
+        for module, error_msg in failed:
+            raise exceptions.FileRetrievalException(error_msg)
 
+        return [path for module, path, digests in succeeded]
+
+    def retrieve_module_batch(self, progress_report, module_list):
+        """
+        Downloads all of the given modules with a single nectar downloader so
+        they are fetched concurrently, bounded by the configured max_downloads.
+        Unlike retrieve_modules, a failed download does not abort the batch.
+
+        :param progress_report: used if any updates need to be made as the download runs
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param module_list: list of modules to be downloaded
+        :type module_list: list of pulp_puppet.plugins.db.models.Module objects
+
+        :return: tuple of (succeeded, failed); succeeded is a list of
+                 (module, path, digests) tuples and failed is a list of
+                 (module, exception) tuples. The digests of each module were
+                 computed as it was downloaded, keyed by algorithm name.
+        :rtype: tuple
+        """
+        succeeded, failed = self._download_modules(progress_report, module_list)
+
+        failed = [(module, exceptions.FileRetrievalException(error_msg))
+                  for module, error_msg in failed]
+        return succeeded, failed
+
+    def _download_modules(self, progress_report, module_list):
+        """
+        Downloads the given modules into the download cache. Modules left in the
+        cache by an earlier sync that did not get to import them are not downloaded
+        again. Each request carries its module as the nectar request data so the
+        reports can be tied back to the module they describe.
+
+        :param progress_report: used if any updates need to be made as the download runs
+        :type progress_report: pulp_puppet.importer.sync_progress.ProgressReport
+
+        :param module_list: list of modules to be downloaded
+        :type module_list: list of pulp_puppet.plugins.db.models.Module objects
+
+        :return: tuple of (succeeded, failed); succeeded is a list of
+                 (module, path, digests) tuples in the order of module_list and
+                 failed is a list of (module, error message) tuples
+        :rtype: tuple
+        """
+        cache = self._download_cache()
+
+        downloaded = {}
+        request_list = []
         for module in module_list:
+            filename = module.puppet_standard_filename()
+            cached_path, digests = cache.get(filename, *_cache_checksum(module))
+            if cached_path is not None:
+                downloaded[id(module)] = (cached_path, digests)
+                continue
             url = self._create_module_url(module)
-            module_tmp_dir = _create_download_tmp_dir(self.repo.working_dir)
-            module_tmp_filename = os.path.join(module_tmp_dir, module.puppet_standard_filename())
-            request = DownloadRequest(url, module_tmp_filename)
+            request = DownloadRequest(url, cache.open_partial(filename), data=module)
             request_list.append(request)
 
-        try:
-            self.downloader.download(request_list)
-        finally:
-            self.downloader.config.finalize()
-            self.downloader = None
-
-        for report in listener.failed_reports:
-            raise exceptions.FileRetrievalException(report.error_msg)
+        failed = []
+        if request_list:
+            listener = HTTPModuleDownloadEventListener(progress_report)
+            self.downloader = self._create_and_configure_downloader(listener)
+
+            try:
+                self.downloader.download(request_list)
+            finally:
+                self.downloader.config.finalize()
+                self.downloader = None
+                for request in request_list:
+                    request.destination.close()
+
+            failed = [(r.data, r.error_msg) for r in listener.failed_reports]
+            # Only downloads reported as succeeded are complete; requests a cancel kept
+            # from finishing are in neither list and are left for prune() to remove
+            for report in listener.succeeded_reports:
+                digests = report.destination.digests()
+                path = cache.complete(report.data.puppet_standard_filename(), digests)
+                downloaded[id(report.data)] = (path, digests)
+
+        succeeded = [(m,) + downloaded[id(m)] for m in module_list if id(m) in downloaded]
+        return succeeded, failed
+
+    def _download_cache(self):
+        """
+        Returns the cache modules are downloaded into. The first time it is used by
+        this downloader, partial downloads and the least recently used modules beyond
+        the configured size are removed from it.
 
-        return [r.destination for r in request_list]
+        :return: the download cache in the repository's working directory
+        :rtype: pulp_puppet.plugins.importers.cache.DownloadCache
+        """
+        if self._cache is None:
+            cache_dir = _create_download_tmp_dir(self.repo.working_dir)
+            self._cache = DownloadCache(cache_dir, max_cache_size(self.config))
+            self._cache.prune()
+        return self._cache
 
     def cancel(self):
         """
@@ -128,15 +262,7 @@ class HttpDownloader(BaseDownloader):
         :param module: module to clean up
         :type  module: pulp_puppet.plugins.db.models.Module
         """
-        module_tmp_dir = _create_download_tmp_dir(self.repo.working_dir)
-        module_tmp_filename = os.path.join(module_tmp_dir, module.puppet_standard_filename())
-
-        try:
-            os.remove(module_tmp_filename)
-        except OSError as e:
-            if e.errno != errno.ENOENT:
-                raise
-
+        self._download_cache().remove(module.puppet_standard_filename())
 
     def _create_metadata_download_urls(self):
         """
@@ -212,12 +338,14 @@ class HTTPMetadataDownloadEventListener(AggregatingEventListener):
         """
         super(HTTPMetadataDownloadEventListener, self).__init__()
         self.progress_report = progress_report
+        self.started = {}
 
     def download_started(self, report):
         """
         :param report: download report for a specific download
         :type report: nectar.report.DownloadReport
         """
+        self.started[report.url] = time.time()
         self.progress_report.metadata_current_query = report.url
         self.progress_report.update_progress()
 
@@ -227,9 +355,30 @@ class HTTPMetadataDownloadEventListener(AggregatingEventListener):
         :type report: nectar.report.DownloadReport
         """
         super(HTTPMetadataDownloadEventListener, self).download_succeeded(report)
+        self._record_query_time(report)
         self.progress_report.metadata_query_finished_count += 1
         self.progress_report.update_progress()
 
+    def download_failed(self, report):
+        """
+        :param report: download report for a specific download
+        :type report: nectar.report.DownloadReport
+        """
+        super(HTTPMetadataDownloadEventListener, self).download_failed(report)
+        self._record_query_time(report)
+
+    def _record_query_time(self, report):
+        """
+        Records how long the query took in the progress report. A query that is
+        fetched again keeps the time of its latest attempt.
+
+        :param report: download report for a specific download
+        :type report: nectar.report.DownloadReport
+        """
+        started = self.started.pop(report.url, None)
+        if started is not None:
+            self.progress_report.metadata_query_times[report.url] = time.time() - started
+
 
 class HTTPModuleDownloadEventListener(AggregatingEventListener):
     """
@@ -245,6 +394,68 @@ class HTTPModuleDownloadEventListener(AggregatingEventListener):
         self.progress_report = progress_report
 
 
+def _conditional_headers(validators):
+    """
+    Builds the headers that make a request conditional on the document having changed.
+
+    :param validators: validators recorded for the document; may be None
+    :type  validators: dict
+
+    :return: request headers; None if there is nothing to validate against
+    :rtype:  dict
+    """
+    if not validators:
+        return None
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers or None
+
+
+def _validators(report):
+    """
+    Extracts the cache validators from the response headers of a successful download.
+
+    :param report: download report for a specific download
+    :type  report: nectar.report.DownloadReport
+
+    :return: dict with the keys etag and last_modified; values are None if not sent
+    :rtype:  dict
+    """
+    headers = getattr(report, 'headers', None) or {}
+    lowered = dict((k.lower(), v) for k, v in headers.items())
+    return {
+        'etag': lowered.get('etag'),
+        'last_modified': lowered.get('last-modified'),
+    }
+
+
+def _is_not_modified(report):
+    """
+    :param report: download report for a failed download
+    :type  report: nectar.report.DownloadReport
+
+    :return: True if the download "failed" because the server answered 304 Not Modified
+    :rtype:  bool
+    """
+    error_report = getattr(report, 'error_report', None) or {}
+    return error_report.get('response_code') == httplib.NOT_MODIFIED
+
+
+def _cache_checksum(module):
+    """
+    :param module: module being downloaded
+    :type  module: pulp_puppet.plugins.db.models.Module or ModuleRecord
+
+    :return: tuple of the checksum a cached copy of the module must match and the
+             name of its algorithm; the checksum is None if the feed lists none
+    :rtype:  tuple
+    """
+    return getattr(module, 'file_md5', None), 'md5'
+
+
 def _create_download_tmp_dir(repo_working_dir):
     tmp_dir = os.path.join(repo_working_dir, DOWNLOAD_TMP_DIR)
     try:
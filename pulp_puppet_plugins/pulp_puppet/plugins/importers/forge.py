@@ -1,7 +1,6 @@
 from datetime import datetime
 from gettext import gettext as _
 import logging
-import os
 import sys
 
 from pulp.server.controllers import repository as repo_controller
@@ -13,10 +12,19 @@ from pulp_puppet.common.sync_progress import SyncProgressReport
 from pulp_puppet.plugins.db.models import Module, RepositoryMetadata
 from pulp_puppet.plugins.importers import metadata as metadata_module
 from pulp_puppet.plugins.importers.downloaders import factory as downloader_factory
+from pulp_puppet.plugins.importers.downloaders.exceptions import MetadataNotModified
+from pulp_puppet.plugins.importers.pipeline import Pipeline
+from pulp_puppet.plugins.importers.state import SyncState, metadata_digest, sync_fingerprint
+from pulp_puppet.plugins.importers.units import (CommitResult, ExistingModuleIndex,
+                                                 ModuleCommitter, associate_modules,
+                                                 link_content, unit_key_tuple)
 
 
 _logger = logging.getLogger(__name__)
 
+# Key in the importer state under which the last successful forge sync is described
+SYNC_STATE_KEY = 'forge_sync'
+
 
 class SynchronizeWithPuppetForge(object):
     """
@@ -31,19 +39,25 @@ class SynchronizeWithPuppetForge(object):
 
         self.progress_report = SyncProgressReport(sync_conduit)
         self.downloader = None
-        # Since SynchronizeWithPuppetForge creates a Nectar downloader for each unit, we cannot
+        self.pipeline = None
+        # Since SynchronizeWithPuppetForge creates a Nectar downloader for each batch, we cannot
         # rely on telling the current downloader to cancel. Therefore, we need another state
         # tracker to check in the download units loop.
         self._canceled = False
 
+        # Describe the metadata retrieved by this sync
+        self._metadata_validators = None
+        self._metadata_digest = None
+
     def __call__(self):
         """
         Sync according to the configured state of the instance and return a report.
 
         This function will make update progress as appropriate.
 
-        This function executes serially, and does not create any threads. It will not return until
-        either a step fails or the entire sync is complete.
+        Modules are imported by a pipeline whose download and metadata extraction stages run in
+        their own threads; all database access happens on the calling thread. This call will not
+        return until either a step fails or the entire sync is complete.
 
         :return: the report object to return to Pulp from the sync call
         :rtype: SyncProgressReport
@@ -69,7 +83,7 @@ class SynchronizeWithPuppetForge(object):
             self._import_modules(metadata)
         finally:
             # One final progress update before finishing
-            self.progress_report.update_progress()
+            self.progress_report.update_progress(force=True)
 
             return self.progress_report
 
@@ -78,6 +92,8 @@ class SynchronizeWithPuppetForge(object):
         Cancel an in-progress sync, if there is one.
         """
         self._canceled = True
+        if self.pipeline is not None:
+            self.pipeline.stop()
         if self.downloader is None:
             return
         self.downloader.cancel()
@@ -87,10 +103,11 @@ class SynchronizeWithPuppetForge(object):
         Takes the necessary actions (according to the run configuration) to
         retrieve and parse the repository's metadata. This call will return
         either the successfully parsed metadata or None if it could not
-        be retrieved or parsed. The progress report will be updated with the
+        be retrieved or parsed, or if it has not changed since the last
+        successful sync. The progress report will be updated with the
         appropriate description of what went wrong in the event of an error,
-        so the caller should interpret a None return as an error occurring and
-        not continue the sync.
+        so the caller should interpret a None return as a reason not to
+        continue the sync.
 
         :return: object representation of the metadata
         :rtype:  RepositoryMetadata
@@ -104,11 +121,21 @@ class SynchronizeWithPuppetForge(object):
 
         start_time = datetime.now()
 
+        # Validators recorded by the last successful sync may only be used if nothing else
+        # that influences the outcome of the sync has changed since
+        previous_sync = self._previous_sync()
+
         # Retrieve the metadata from the source
         try:
             downloader = self._create_downloader()
             self.downloader = downloader
-            metadata_json_docs = downloader.retrieve_metadata(self.progress_report)
+            metadata_json_docs = downloader.retrieve_metadata(
+                self.progress_report, validators=previous_sync.get('validators'))
+            self._metadata_validators = downloader.metadata_validators
+
+        except MetadataNotModified:
+            self._metadata_unchanged(start_time)
+            return None
 
         except Exception as e:
             if self._canceled:
@@ -136,11 +163,17 @@ class SynchronizeWithPuppetForge(object):
         finally:
             self.downloader = None
 
+        # Skip the module phase entirely if the content is identical to the last sync
+        self._metadata_digest = metadata_digest(metadata_json_docs)
+        if self._metadata_digest == previous_sync.get('digest'):
+            self._metadata_unchanged(start_time)
+            return None
+
         # Parse the retrieved metadata documents
         try:
             metadata = RepositoryMetadata()
             for doc in metadata_json_docs:
-                metadata.update_from_json(doc)
+                metadata.update_records_from_json(doc)
         except Exception as e:
             msg = _('Exception parsing metadata for repository <%(repo_id)s>')
             msg_dict = {'repo_id': self.repo.id}
@@ -169,6 +202,58 @@ class SynchronizeWithPuppetForge(object):
 
         return metadata
 
+    def _metadata_unchanged(self, start_time):
+        """
+        Updates the progress report for a sync whose metadata has not changed since the
+        last successful sync, in which case there are no modules to import.
+
+        :param start_time: when the metadata step started
+        :type  start_time: datetime.datetime
+        """
+        msg = _('Metadata for repository <%(repo_id)s> is unchanged; skipping module import')
+        msg_dict = {'repo_id': self.repo.id}
+        _logger.info(msg, msg_dict)
+
+        duration = datetime.now() - start_time
+        self.progress_report.metadata_state = STATE_SUCCESS
+        self.progress_report.metadata_execution_time = duration.seconds
+
+        self.progress_report.modules_state = STATE_SUCCESS
+        self.progress_report.modules_execution_time = 0
+        self.progress_report.modules_total_count = 0
+        self.progress_report.modules_finished_count = 0
+        self.progress_report.modules_error_count = 0
+
+        self.progress_report.update_progress()
+
+    def _previous_sync(self):
+        """
+        Returns what was recorded about the last successful sync, provided it is
+        still applicable to this one.
+
+        :return: dict with the keys validators and digest; empty if not applicable
+        :rtype:  dict
+        """
+        previous_sync = SyncState(self.repo.working_dir).get(SYNC_STATE_KEY)
+        if not previous_sync:
+            return {}
+        if previous_sync.get('fingerprint') != sync_fingerprint(self.repo, self.config):
+            return {}
+        return previous_sync
+
+    def _record_sync(self):
+        """
+        Records the validators and digest of the metadata imported by this sync so the
+        next sync can skip the module phase if the metadata has not changed.
+        """
+        state = SyncState(self.repo.working_dir)
+        state.set(SYNC_STATE_KEY, {
+            'fingerprint': sync_fingerprint(self.repo, self.config),
+            'validators': self._metadata_validators,
+            'digest': self._metadata_digest,
+        })
+        state.save()
+
     def _import_modules(self, metadata):
         """
         Imports each module in the repository into Pulp.
@@ -222,6 +307,10 @@ class SynchronizeWithPuppetForge(object):
 
         self.progress_report.update_progress()
 
+        # Only a complete sync may be used to skip later ones
+        if not self._canceled and not self.progress_report.modules_error_count:
+            self._record_sync()
+
     def _do_import_modules(self, metadata):
         """
         Actual logic of the import. This method will do a best effort per module;
@@ -233,35 +322,51 @@ class SynchronizeWithPuppetForge(object):
         self.downloader = downloader
 
         # Ease module lookup
-        metadata_modules_by_key = dict([(m.unit_key_str, m) for m in metadata.modules])
+        metadata_modules_by_key = dict([(unit_key_tuple(m), m) for m in metadata.modules])
 
-        # Collect information about the repository's modules before changing it
-        existing_module_ids_by_key = {}
-        for module in Module.objects.only(*Module.unit_key_fields).all():
-            existing_module_ids_by_key[module.unit_key_str] = module.id
+        # Collect information about the repository's modules before changing it. Modules
+        # that already exist in Pulp outside of this repository are not downloaded again.
+        module_index = ExistingModuleIndex(self.repo.repo_obj)
+        existing_module_ids_by_key = module_index.repo_ids_by_key
+        known_module_ids_by_key = module_index.find_outside_repo(metadata.modules)
 
-        new_unit_keys = self._resolve_new_units(existing_module_ids_by_key.keys(),
-                                                metadata_modules_by_key.keys())
+        new_unit_keys = self._resolve_new_units(
+            existing_module_ids_by_key.keys() + known_module_ids_by_key.keys(),
+            metadata_modules_by_key.keys())
 
         # Once we know how many things need to be processed, we can update the progress report
-        self.progress_report.modules_total_count = len(new_unit_keys)
+        self.progress_report.modules_total_count = \
+            len(new_unit_keys) + len(known_module_ids_by_key)
         self.progress_report.modules_finished_count = 0
         self.progress_report.modules_error_count = 0
         self.progress_report.update_progress()
 
-        # Add new units
-        for key in new_unit_keys:
-            if self._canceled:
-                break
-            module = metadata_modules_by_key[key]
-            try:
-                self._add_new_module(downloader, module)
-                self.progress_report.modules_finished_count += 1
-            except Exception as e:
-                self.progress_report.add_failed_module(module, e, sys.exc_info()[2])
-
+        # Modules already in Pulp only need to be associated with the repository
+        if known_module_ids_by_key and not self._canceled:
+            self.progress_report.modules_finished_count += \
+                associate_modules(self.repo.repo_obj, known_module_ids_by_key.values())
             self.progress_report.update_progress()
 
+        # Add new units. Downloading, metadata extraction and storing each run in their
+        # own stage so the network is kept busy while earlier modules are processed.
+        new_modules = [metadata_modules_by_key[key] for key in new_unit_keys]
+        batch_size = self._download_batch_size()
+        batches = [new_modules[i:i + batch_size] for i in xrange(0, len(new_modules), batch_size)]
+
+        stages = [
+            lambda batch: self._download_stage(downloader, batch),
+            self._extract_stage,
+        ]
+        committer = ModuleCommitter(self.repo.repo_obj, link=link_content(self.config))
+        self.pipeline = Pipeline(stages, queue_size=batch_size)
+        try:
+            self.pipeline.run(batches,
+                              lambda work: self._store_stage(downloader, committer, work))
+        finally:
+            self.pipeline = None
+        if not self._canceled:
+            self._record_stored(downloader, committer.flush())
+
         # Remove missing units if the configuration indicates to do so
         if self._should_remove_missing():
             remove_unit_keys = self._resolve_remove_units(existing_module_ids_by_key.keys(),
@@ -272,39 +377,107 @@ class SynchronizeWithPuppetForge(object):
 
         self.downloader = None
 
-    def _add_new_module(self, downloader, module):
+    def _download_stage(self, downloader, modules):
         """
-        Performs the tasks for downloading and saving a new unit in Pulp.
+        First stage of the module import pipeline. Downloads a batch of new modules,
+        which the downloader may retrieve concurrently.
 
-        This method entirely skips modules that are already in the repository.
-
-        :param downloader: downloader instance to use for retrieving the unit
+        :param downloader: downloader instance to use for retrieving the units
         :type downloader: child of pulp_puppet.plugins.importers.downloaders.base.BaseDownloader
 
-        :param module: module to download and add
-        :type  module: pulp_puppet.plugins.db.models.Module
+        :param modules: modules to download
+        :type  modules: list of pulp_puppet.plugins.db.models.ModuleRecord
+
+        :return: one work item per module in the batch
+        :rtype:  list of ModuleImport
         """
-        try:
-            # Download the bits
-            downloaded_filename = downloader.retrieve_module(self.progress_report, module)
+        if self._canceled:
+            return []
 
-            # Extract the extra metadata into the module
-            metadata = metadata_module.extract_metadata(downloaded_filename,
-                                                         self.repo.working_dir)
+        succeeded, failed = downloader.retrieve_module_batch(self.progress_report, modules)
 
-            # Overwrite the author and name
-            metadata.update(Module.split_filename(metadata['name']))
+        work = [ModuleImport(module, path=path, digests=digests)
+                for module, path, digests in succeeded]
+        work.extend(ModuleImport(module, error=e) for module, e in failed)
+        return work
 
-            # Create and save the Module
-            module = Module.from_metadata(metadata)
-            module.set_storage_path(os.path.basename(downloaded_filename))
-            module.save()
-            module.import_content(downloaded_filename)
+    def _extract_stage(self, work):
+        """
+        Second stage of the module import pipeline. Extracts the metadata out of a
+        downloaded module.
 
-            # Associate the module with the repo
-            repo_controller.associate_single_unit(self.repo.repo_obj, module)
-        finally:
-            downloader.cleanup_module(module)
+        :param work: work item for a single module
+        :type  work: ModuleImport
+
+        :return: the work item, with either its metadata or its error populated
+        :rtype:  list of ModuleImport
+        """
+        if work.error is None and not self._canceled:
+            try:
+                metadata = metadata_module.extract_metadata(work.path)
+
+                # Overwrite the author and name
+                metadata.update(Module.split_filename(metadata['name']))
+                work.metadata = metadata
+            except Exception as e:
+                work.error = e
+                work.traceback = sys.exc_info()[2]
+        return [work]
+
+    def _store_stage(self, downloader, committer, work):
+        """
+        Last stage of the module import pipeline, run on the sync's own thread. Hands
+        the module to the committer, which saves modules in Pulp and associates them
+        with the repository in batches, or records why it could not be imported.
+
+        :param downloader: downloader instance used to retrieve the unit
+        :type downloader: child of pulp_puppet.plugins.importers.downloaders.base.BaseDownloader
+
+        :param committer: stores the new modules
+        :type  committer: pulp_puppet.plugins.importers.units.ModuleCommitter
+
+        :param work: work item for a single module
+        :type  work: ModuleImport
+        """
+        if self._canceled:
+            # A module that was not imported because the sync was canceled stays in the
+            # download cache for the next sync
+            return
+        if work.error is None:
+            try:
+                module = Module.from_metadata(work.metadata)
+            except Exception as e:
+                work.error = e
+                work.traceback = sys.exc_info()[2]
+        if work.error is not None:
+            result = CommitResult(work.module, work.path, work, work.error, work.traceback)
+            self._record_stored(downloader, [result])
+        else:
+            self._record_stored(downloader,
+                                committer.add(module, work.path, work, work.digests))
+
+    def _record_stored(self, downloader, results):
+        """
+        Updates the progress report with the outcome of storing modules and removes
+        their downloaded files.
+
+        :param downloader: downloader instance used to retrieve the units
+        :type downloader: child of pulp_puppet.plugins.importers.downloaders.base.BaseDownloader
+
+        :param results: results of storing the modules; the data of each is its ModuleImport
+        :type  results: list of pulp_puppet.plugins.importers.units.CommitResult
+        """
+        for result in results:
+            work = result.data
+            if result.error is None:
+                self.progress_report.modules_finished_count += 1
+            else:
+                self.progress_report.add_failed_module(work.module, result.error,
+                                                       result.traceback)
+            if work.path is not None:
+                downloader.cleanup_module(work.module)
+        if results:
+            self.progress_report.update_progress()
 
     def _resolve_new_units(self, existing_unit_keys, metadata_unit_keys):
         """
@@ -336,6 +509,18 @@ class SynchronizeWithPuppetForge(object):
         feed = self.config.get(constants.CONFIG_FEED)
         return downloader_factory.get_downloader(feed, self.repo, self.sync_conduit, self.config)
 
+    def _download_batch_size(self):
+        """
+        Returns the number of modules to hand to the downloader at once.
+
+        :return: number of modules per download batch
+        :rtype:  int
+        """
+        batch_size = self.config.get(constants.CONFIG_DOWNLOAD_BATCH_SIZE)
+        if batch_size is None:
+            return constants.DEFAULT_DOWNLOAD_BATCH_SIZE
+        return int(batch_size)
+
     def _should_remove_missing(self):
         """
         Returns whether or not missing units should be removed.
@@ -348,3 +533,31 @@ class SynchronizeWithPuppetForge(object):
             return constants.DEFAULT_REMOVE_MISSING
         else:
             return self.config.get_boolean(constants.CONFIG_REMOVE_MISSING)
+
+
+class ModuleImport(object):
+    """
+    Work item passed between the stages of the forge module import pipeline.
+
+    :ivar module: module from the repository metadata being imported
+    :type module: pulp_puppet.plugins.db.models.ModuleRecord
+    :ivar path: full path to the downloaded module file; None if the download failed
+    :type path: str
+    :ivar digests: digests of the module file keyed by algorithm name, if the downloader
+                   computed them while retrieving it
+    :type digests: dict
+    :ivar metadata: metadata extracted from the module file
+    :type metadata: dict
+    :ivar error: exception raised while processing the module; None if successful so far
+    :type error: Exception
+    :ivar traceback: traceback of the error, if one is available
+    :type traceback: traceback
+    """
+
+    def __init__(self, module, path=None, error=None, digests=None):
+        self.module = module
+        self.path = path
+        self.digests = digests
+        self.metadata = None
+        self.error = error
+        self.traceback = None
@@ -9,6 +9,7 @@ from pulp_puppet.common import constants
 from pulp_puppet.plugins.importers import configuration, upload, copier
 from pulp_puppet.plugins.importers.directory import SynchronizeWithDirectory
 from pulp_puppet.plugins.importers.forge import SynchronizeWithPuppetForge
+from pulp_puppet.plugins.importers.state import SyncState
 
 
 # The platform currently doesn't support automatic loading of conf files when the plugin
@@ -18,6 +19,15 @@ from pulp_puppet.plugins.importers.forge import SynchronizeWithPuppetForge
 # entry_point method.
 CONF_FILENAME = 'server/plugins.conf.d/%s.json' % constants.IMPORTER_TYPE_ID
 
+# Key in the importer state under which the detected type of the feed is remembered
+FEED_TYPE_STATE_KEY = 'feed_type'
+
+# Synchronization method used for each type of feed
+SYNC_METHODS = {
+    constants.FEED_TYPE_DIRECTORY: SynchronizeWithDirectory,
+    constants.FEED_TYPE_FORGE: SynchronizeWithPuppetForge,
+}
+
 _logger = logging.getLogger(__name__)
 
 
@@ -55,20 +65,43 @@ class PuppetModuleImporter(Importer):
         # Supports two methods of synchronization.
         # 1. Synchronize with a directory containing a pulp manifest and puppet modules.
         # 2. Synchronize with Puppet Forge.
-        # When the feed URL references a PULP_MANIFEST, the directory synchronization
-        # method is used.  Otherwise, the puppet forge synchronization method is used.
-
-        # synchronize with a directory
-        self.sync_method = SynchronizeWithDirectory(repo, sync_conduit, config)
-        report = self.sync_method()
-
-        # When fetching the PULP_MANIFEST is not successful, it's assumed that the
-        # feed points to a puppet forge instance and the synchronization is retried
-        # using puppet forge method.
-
-        if report.metadata_state == constants.STATE_FAILED:
-            self.sync_method = SynchronizeWithPuppetForge(repo, sync_conduit, config)
+        # When the feed type is configured only that method is used. Otherwise the
+        # method that worked for the feed the last time is tried first; a feed that is
+        # not yet known is tried as a directory first, and when fetching the
+        # PULP_MANIFEST is not successful it's assumed that the feed points to a
+        # puppet forge instance and the synchronization is retried using the puppet
+        # forge method.
+
+        configured_type = config.get(constants.CONFIG_FEED_TYPE)
+        remembered_type = None
+        if configured_type:
+            feed_types = [configured_type]
+        else:
+            feed_types = list(constants.FEED_TYPES)
+            remembered_type = _remembered_feed_type(repo, config)
+            if remembered_type in feed_types:
+                feed_types.remove(remembered_type)
+                feed_types.insert(0, remembered_type)
+
+        # Report of the remembered method failing; when detecting the feed again fails
+        # too, it holds the actual error rather than a failed probe of the other type
+        remembered_report = None
+        for feed_type in feed_types:
+            self.sync_method = SYNC_METHODS[feed_type](repo, sync_conduit, config)
             report = self.sync_method()
+            if report.metadata_state != constants.STATE_FAILED:
+                if not configured_type:
+                    _remember_feed_type(repo, config, feed_type)
+                break
+            if feed_type == remembered_type:
+                remembered_report = report
+            if self.sync_cancelled:
+                break
+        else:
+            if remembered_report is not None and remembered_report is not report:
+                # The progress last sent is that of the other method
+                report = remembered_report
+                sync_conduit.set_progress(report.build_progress_report())
 
         self.sync_method = None
         return report.build_final_report()
@@ -102,3 +135,40 @@ class PuppetModuleImporter(Importer):
         :rtype: bool
         """
         return self.sync_cancelled
+
+
+def _remembered_feed_type(repo, config):
+    """
+    Looks up the type detected for the feed by a previous sync of the repository.
+
+    :param repo: repository being synchronized
+    :type  repo: pulp.plugins.model.Repository
+    :param config: configuration of the importer and call
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+
+    :return: type of the feed; None if it has not been detected or the feed changed
+    :rtype:  str
+    """
+    detected = SyncState(repo.working_dir).get(FEED_TYPE_STATE_KEY) or {}
+    if detected.get('feed') != config.get(constants.CONFIG_FEED):
+        return None
+    return detected.get('type')
+
+
+def _remember_feed_type(repo, config, feed_type):
+    """
+    Records the type of the feed so the next sync of the repository does not need to
+    detect it again.
+
+    :param repo: repository being synchronized
+    :type  repo: pulp.plugins.model.Repository
+    :param config: configuration of the importer and call
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+    :param feed_type: type of the feed, one of constants.FEED_TYPES
+    :type  feed_type: str
+    """
+    detected = {'feed': config.get(constants.CONFIG_FEED), 'type': feed_type}
+    sync_state = SyncState(repo.working_dir)
+    if sync_state.get(FEED_TYPE_STATE_KEY) != detected:
+        sync_state.set(FEED_TYPE_STATE_KEY, detected)
+        sync_state.save()
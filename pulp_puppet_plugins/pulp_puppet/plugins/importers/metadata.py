@@ -2,12 +2,11 @@
 Functionality around parsing the metadata within a packaged module (.tar.gz).
 """
 
+from contextlib import closing
 import hashlib
-import os
-import shutil
+import posixpath
 import sys
 import tarfile
-import tempfile
 
 from pulp.common.compat import json
 from pulp.server.exceptions import InvalidValue
@@ -41,36 +40,90 @@ class InvalidTarball(ExtractionException):
 
 CHECKSUM_READ_BUFFER_SIZE = 65536
 
+JSON_WHITESPACE = ' \t\n\r'
 
-def extract_metadata(filename, temp_dir):
+
+def extract_metadata(filename, any_depth=False):
     """
     Pulls the module's metadata file out of the module's tarball and returns it.
 
     :param filename: full path to the module file
     :type filename: str
-
-    :param temp_dir: location the module's files should be extracted to; must exist prior to this
-                     call
-    :type temp_dir: str
+    :param any_depth: if True and the module's main directory holds no metadata file,
+                      the first metadata file found at any depth of the tarball is used
+    :type any_depth: bool
 
     :raise InvalidTarball: if the module file cannot be opened
     :raise MissingModuleFile: if the module's metadata file cannot be found
     """
-    metadata = _extract_json(filename, temp_dir)
+    metadata = _extract_json(filename, any_depth)
     return json.loads(metadata)
 
 
-def calculate_checksum(filename):
+def iter_json_array(document):
+    """
+    Parses a JSON document consisting of a single array one element at a time, so only
+    the element being processed needs to be held in memory as Python objects.
+
+    :param document: JSON document whose top level value is an array
+    :type document: str
+
+    :return: generator of the parsed elements of the array
+    :rtype: generator
+
+    :raise ValueError: if the document is not a valid JSON array
+    """
+    decoder = json.JSONDecoder()
+    end = len(document)
+
+    index = _skip_whitespace(document, 0)
+    if document[index:index + 1] != '[':
+        raise ValueError('Expected a JSON array')
+    index = _skip_whitespace(document, index + 1)
+
+    if document[index:index + 1] == ']':
+        index += 1
+    else:
+        while True:
+            element, index = decoder.raw_decode(document, index)
+            yield element
+
+            index = _skip_whitespace(document, index)
+            separator = document[index:index + 1]
+            index = _skip_whitespace(document, index + 1)
+            if separator == ']':
+                break
+            if separator != ',':
+                raise ValueError('Expected , or ] at position %d' % index)
+
+    if _skip_whitespace(document, index) != end:
+        raise ValueError('Extra data after the JSON array at position %d' % index)
+
+
+def _skip_whitespace(document, index):
+    """
+    :return: the index of the first non whitespace character at or after index
+    :rtype: int
+    """
+    end = len(document)
+    while index < end and document[index] in JSON_WHITESPACE:
+        index += 1
+    return index
+
+
+def calculate_checksum(filename, checksum_type=constants.DEFAULT_HASHLIB):
     """
     Calculate the checksum for a given file using the default hashlib
 
     :param filename: the filename including path of the file to calculate a checksum for
     :type filename: str
+    :param checksum_type: name of the hashlib algorithm to use
+    :type checksum_type: str
 
     :return: The checksum for the file
     :rtype: str
     """
-    m = hashlib.new(constants.DEFAULT_HASHLIB)
+    m = hashlib.new(checksum_type)
     with open(filename, 'r') as f:
         while 1:
             file_buffer = f.read(CHECKSUM_READ_BUFFER_SIZE)
@@ -80,64 +133,59 @@ def calculate_checksum(filename):
     return m.hexdigest()
 
 
-def _extract_json(filename, temp_dir):
+def _extract_json(filename, any_depth=False):
     """
-    The entire module will be extracted to a temporary location and an attempt will be made to
-    find the module file. If it still cannot be found, an exception is raised. The temporary
-    location is deleted at the end of this call regardless.
+    Reads the metadata file in the module's main directory straight out of the
+    compressed tarball. Members are read in order from the compressed stream, nothing
+    is written to disk, and reading stops as soon as the metadata file is found.
 
     :param filename: full path to the module file
     :type filename: str
+    :param any_depth: if True, the first metadata file found at any other depth is kept
+                      and used when the main directory holds none
+    :type any_depth: bool
 
-    :param temp_dir: location the module's files should be extracted to; must exist prior to this
-                     call
-    :type temp_dir: str
+    :return: contents of the module's metadata file
+    :rtype: str
 
     :raise InvalidTarball: if the module file cannot be opened
     :raise MissingModuleFile: if the module's metadata file cannot be found
     """
-
-    extraction_dir = tempfile.mkdtemp(dir=temp_dir)
-
-    # Extract the entire module
     try:
-        tgz = tarfile.open(name=filename)
-        tgz.extractall(path=extraction_dir)
-        tgz.close()
+        tgz = tarfile.open(name=filename, mode='r|*')
     except Exception:
         raise InvalidTarball(filename), None, sys.exc_info()[2]
 
-    try:
-        # Attempt to find the metadata in the Puppet module's main directory
-        # It is expected the .tar.gz file will contain exactly one Puppet module
+    # The stream cannot be read again, so the fallback is read as soon as it is found
+    fallback = None
+    with closing(tgz):
         try:
-            module_dir = os.listdir(extraction_dir)[0]
-        except IndexError:
-            raise MissingModuleFile(filename)
-        metadata_filename = constants.MODULE_METADATA_FILENAME
-        metadata_full_path = os.path.join(extraction_dir, module_dir, metadata_filename)
-        if not os.path.isfile(metadata_full_path):
-            raise MissingModuleFile(filename)
-
-        return _read_contents(metadata_full_path)
-    finally:
-        # Delete the entire extraction directory
-        shutil.rmtree(extraction_dir)
-
-
-def _read_contents(filename):
+            for member in tgz:
+                if not member.isfile():
+                    continue
+                if _is_metadata_member(member.name):
+                    return tgz.extractfile(member).read()
+                if (any_depth and fallback is None and
+                        posixpath.basename(member.name) == constants.MODULE_METADATA_FILENAME):
+                    fallback = tgz.extractfile(member).read()
+        except Exception:
+            raise InvalidTarball(filename), None, sys.exc_info()[2]
+
+    if fallback is not None:
+        return fallback
+    raise MissingModuleFile(filename)
+
+
+def _is_metadata_member(name):
     """
-    Simple utility to read in the contents of the given file, making sure to
-    properly handle the file object.
+    It is expected the .tar.gz file will contain exactly one Puppet module, so the
+    metadata file is the one directly inside the tarball's top level directory.
+
+    :param name: name of a member of the tarball
+    :type name: str
 
-    :return: contents of the given file
+    :return: True if the member is the module's metadata file
+    :rtype: bool
     """
-    try:
-        f = open(filename)
-        contents = f.read()
-        f.close()
-
-        return contents
-    finally:
-        # Clean up the temporary file
-        os.remove(filename)
+    path = posixpath.normpath(name).split('/')
+    return len(path) == 2 and path[1] == constants.MODULE_METADATA_FILENAME
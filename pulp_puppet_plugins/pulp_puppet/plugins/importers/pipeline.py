@@ -0,0 +1,152 @@
+"""
+A small staged pipeline used by the importers to overlap work that is bound by
+different resources, such as downloading modules, extracting their metadata and
+writing them to the database.
+"""
+
+from gettext import gettext as _
+from Queue import Queue
+import logging
+import sys
+import threading
+
+
+_logger = logging.getLogger(__name__)
+
+# Marks the end of the items flowing through a queue
+_DONE = object()
+
+DEFAULT_QUEUE_SIZE = 100
+
+
+class Pipeline(object):
+    """
+    Runs a series of stages concurrently, each in its own thread, connected by bounded
+    queues. The items produced by the last stage are handed to a consumer that runs on
+    the calling thread, so anything that must stay single threaded (database access,
+    progress reporting) belongs in the consumer.
+
+    Every stage is a callable that accepts a single item and returns an iterable of the
+    items to pass to the next stage, which allows a stage to expand one item (a batch of
+    downloads, for instance) into many. Stages are expected to handle their own errors
+    and pass them along as items; an exception escaping a stage stops the pipeline and
+    is raised from run().
+
+    :ivar stages: callables run in order, each on its own thread
+    :type stages: list
+    :ivar queue_size: maximum number of items waiting between two stages
+    :type queue_size: int
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        :param stages: callables run in order, each on its own thread
+        :type  stages: list
+        :param queue_size: maximum number of items waiting between two stages
+        :type  queue_size: int
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self._stopped = threading.Event()
+        self._error = None
+
+    def stop(self):
+        """
+        Stop feeding new items into the pipeline. Items already in flight still pass
+        through the remaining stages and reach the consumer.
+        """
+        self._stopped.set()
+
+    def run(self, items, consumer):
+        """
+        Feed the items through every stage and hand each result to the consumer. This
+        call blocks until all items have been consumed or the pipeline was stopped and
+        drained.
+
+        :param items: items given to the first stage
+        :type  items: iterable
+        :param consumer: called on the calling thread for every item produced by the
+                         last stage
+        :type  consumer: callable
+
+        :raise Exception: the first exception raised by a stage or by the consumer
+        """
+        queues = [Queue(maxsize=self.queue_size) for i in range(len(self.stages) + 1)]
+
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]))]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._work,
+                                            args=(stage, queues[i], queues[i + 1])))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        consumer_error = None
+        try:
+            for item in self._drain(queues[-1]):
+                if consumer_error is not None:
+                    continue
+                try:
+                    consumer(item)
+                except Exception:
+                    consumer_error = sys.exc_info()
+                    self.stop()
+        finally:
+            for thread in threads:
+                thread.join()
+
+        for error in (consumer_error, self._error):
+            if error is not None:
+                raise error[0], error[1], error[2]
+
+    def _feed(self, items, outbound):
+        """
+        Puts the items on the first queue until they run out or the pipeline is stopped.
+        """
+        try:
+            for item in items:
+                if self._stopped.is_set():
+                    break
+                outbound.put(item)
+        except Exception:
+            self._fail()
+        finally:
+            outbound.put(_DONE)
+
+    def _work(self, stage, inbound, outbound):
+        """
+        Runs a single stage over everything arriving on its inbound queue. Once the stage
+        has failed, the remaining items are discarded so the upstream threads are never
+        blocked on a full queue.
+        """
+        failed = False
+        for item in self._drain(inbound):
+            if failed:
+                continue
+            try:
+                for result in stage(item):
+                    outbound.put(result)
+            except Exception:
+                failed = True
+                self._fail()
+        outbound.put(_DONE)
+
+    def _fail(self):
+        """
+        Records the exception currently being handled and stops the pipeline.
+        """
+        _logger.exception(_('Pipeline stage failed'))
+        if self._error is None:
+            self._error = sys.exc_info()
+        self.stop()
+
+    @staticmethod
+    def _drain(queue):
+        """
+        Yields the items from the queue until the end marker is found.
+        """
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            yield item
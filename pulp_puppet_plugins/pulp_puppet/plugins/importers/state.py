@@ -0,0 +1,121 @@
+"""
+Persistence of importer state that needs to survive between syncs of a repository,
+such as the cache validators of the last successfully imported metadata.
+"""
+
+import errno
+import hashlib
+import json
+import os
+
+from pulp.server.db.model import RepositoryContentUnit
+
+from pulp_puppet.common import constants
+
+
+# Name of the file, in the repository's working directory, holding the state
+STATE_FILENAME = '.puppet_importer_state.json'
+
+
+class SyncState(object):
+    """
+    Dictionary-like access to the importer state stored in a repository's working
+    directory. Changes are written to disk by save().
+
+    :ivar path: full path to the file holding the state
+    :type path: str
+    :ivar data: the state itself
+    :type data: dict
+    """
+
+    def __init__(self, working_dir):
+        """
+        :param working_dir: working directory of the repository being synchronized
+        :type  working_dir: str
+        """
+        self.path = os.path.join(working_dir, STATE_FILENAME)
+        self.data = self._load()
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def remove(self, key):
+        self.data.pop(key, None)
+
+    def save(self):
+        """
+        Writes the state to disk. The file is replaced atomically so an interrupted
+        write never leaves a corrupt state behind.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.data, fp)
+        os.rename(tmp_path, self.path)
+
+    def _load(self):
+        """
+        :return: the stored state; an empty dict if there is none or it cannot be read
+        :rtype:  dict
+        """
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {}
+        except ValueError:
+            # A corrupt state only costs a full sync
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return data
+
+
+def sync_fingerprint(repo, config):
+    """
+    Describes everything besides the upstream metadata that influences the outcome of
+    a sync. Metadata validators from a previous sync may only be trusted if the
+    fingerprint is unchanged, which includes the repository still holding the same
+    modules it did when that sync finished. Rather than reading every association, the
+    modules are described by their number and the time the latest was associated;
+    any association added since makes the latter change, and any removed since
+    without one being added makes the former change.
+
+    :param repo: repository being synchronized
+    :type  repo: pulp.plugins.model.Repository
+    :param config: configuration of the importer and call
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+
+    :return: JSON serializable description of the sync
+    :rtype:  dict
+    """
+    associations = RepositoryContentUnit.objects(repo_id=repo.id,
+                                                 unit_type_id=constants.TYPE_PUPPET_MODULE)
+    latest = associations.order_by('-created').only('created').first()
+    return {
+        'feed': config.get(constants.CONFIG_FEED),
+        'queries': config.get(constants.CONFIG_QUERIES),
+        'remove_missing': config.get_boolean(constants.CONFIG_REMOVE_MISSING),
+        'unit_count': associations.count(),
+        'last_associated': latest.created if latest is not None else None,
+    }
+
+
+def metadata_digest(documents):
+    """
+    Calculates a single digest over a list of metadata documents.
+
+    :param documents: metadata documents as retrieved from the feed
+    :type  documents: list of str
+
+    :return: hex digest of the documents
+    :rtype:  str
+    """
+    digest = hashlib.new(constants.DEFAULT_HASHLIB)
+    for document in documents:
+        digest.update(hashlib.new(constants.DEFAULT_HASHLIB, document).digest())
+    return digest.hexdigest()
@@ -0,0 +1,401 @@
+"""
+Lookups of the modules Pulp already knows about, used by the importers to decide which
+remote modules need importing without loading every module in the database, and the
+storing of new modules in Pulp.
+"""
+
+from collections import namedtuple
+import os
+import sys
+
+from mongoengine import Q, signals
+from mongoengine.errors import OperationError
+from pulp.common import dateutils
+from pulp.server.controllers import repository as repo_controller
+from pulp.server.db.model import RepositoryContentUnit
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.db.models import Module
+from pulp_puppet.plugins.importers.cache import file_digests
+
+
+# Maximum number of unit keys looked up in a single query
+QUERY_CHUNK_SIZE = 500
+
+# Fields loaded for the modules in a repository; the checksum identifies a module's file
+# without downloading it
+INDEX_FIELDS = Module.unit_key_fields + ('checksum', 'checksum_type')
+
+# Number of new modules buffered by a ModuleCommitter before they are written together
+COMMIT_BATCH_SIZE = 100
+
+# Digest stored on every module as its file_md5, which forges list for each module
+FILE_MD5_TYPE = 'md5'
+
+# Outcome of storing a single module; error and traceback are None if it was stored
+CommitResult = namedtuple('CommitResult', ['module', 'path', 'data', 'error', 'traceback'])
+
+
+class ExistingModuleIndex(object):
+    """
+    Index of the modules associated with a single repository, keyed by unit key string.
+    Modules that exist in Pulp but are not associated with the repository are looked
+    up on demand, limited to the unit keys the caller asks about.
+
+    :ivar repo_ids_by_key: ids of the modules associated with the repository
+    :type repo_ids_by_key: dict of Module.id values keyed on unit_key_tuple
+    """
+
+    def __init__(self, repo_obj):
+        """
+        :param repo_obj: repository being synchronized
+        :type  repo_obj: pulp.server.db.model.Repository
+        """
+        self.repo_ids_by_key = {}
+        self._repo_keys_by_checksum = {}
+        self._repo_keys_without_checksum = set()
+        units = repo_controller.find_repo_content_units(repo_obj,
+                                                        unit_fields=INDEX_FIELDS,
+                                                        yield_content_unit=True)
+        for module in units:
+            unit_key = unit_key_tuple(module)
+            self.repo_ids_by_key[unit_key] = module.id
+            if module.checksum and module.checksum_type == constants.DEFAULT_HASHLIB:
+                self._repo_keys_by_checksum[module.checksum] = unit_key
+            else:
+                self._repo_keys_without_checksum.add(unit_key)
+
+    def in_repo(self, unit_key):
+        """
+        :param unit_key: unit key of a module as returned by unit_key_tuple
+        :type  unit_key: tuple
+
+        :return: True if the module is associated with the repository
+        :rtype:  bool
+        """
+        return unit_key in self.repo_ids_by_key
+
+    def find_file_in_repo(self, checksum, unit_key=None):
+        """
+        Looks up the module in the repository a module file belongs to, without reading
+        the file. A module is matched by the checksum of its file. A module whose checksum
+        cannot be compared, because it was not calculated with the default algorithm, is
+        matched by the unit key instead, such as one derived from the file's name.
+
+        :param checksum: checksum of the file, calculated with the default algorithm
+        :type  checksum: str
+        :param unit_key: unit key the file is expected to contain, if known
+        :type  unit_key: tuple
+
+        :return: unit key of the module the file belongs to; None if it is not known
+        :rtype:  tuple
+        """
+        if checksum in self._repo_keys_by_checksum:
+            return self._repo_keys_by_checksum[checksum]
+        if unit_key in self._repo_keys_without_checksum:
+            return unit_key
+        return None
+
+    def find_outside_repo_by_checksum(self, checksums):
+        """
+        Finds modules in Pulp that are not associated with the repository by the checksum
+        of their file.
+
+        :param checksums: checksums calculated with the default algorithm
+        :type  checksums: list of str
+
+        :return: tuples of (unit key, id) of the modules found, keyed on checksum
+        :rtype:  dict
+        """
+        checksums = [c for c in checksums if c not in self._repo_keys_by_checksum]
+
+        found = {}
+        for i in xrange(0, len(checksums), QUERY_CHUNK_SIZE):
+            query = Module.objects(checksum__in=checksums[i:i + QUERY_CHUNK_SIZE],
+                                   checksum_type=constants.DEFAULT_HASHLIB)
+            for module in query.only(*INDEX_FIELDS):
+                unit_key = unit_key_tuple(module)
+                if not self.in_repo(unit_key):
+                    found[module.checksum] = (unit_key, module.id)
+        return found
+
+    def find_outside_repo(self, modules):
+        """
+        Finds which of the given modules exist in Pulp without being associated with
+        the repository.
+
+        :param modules: modules to look up; only their unit key fields are used
+        :type  modules: iterable of pulp_puppet.plugins.db.models.Module or ModuleRecord
+
+        :return: ids of the modules found, keyed on unit_key_tuple
+        :rtype:  dict
+        """
+        unit_keys = [m.unit_key for m in modules if not self.in_repo(unit_key_tuple(m))]
+
+        ids_by_key = {}
+        for i in xrange(0, len(unit_keys), QUERY_CHUNK_SIZE):
+            query = None
+            for unit_key in unit_keys[i:i + QUERY_CHUNK_SIZE]:
+                query = Q(**unit_key) if query is None else query | Q(**unit_key)
+            for module in Module.objects(query).only(*Module.unit_key_fields):
+                ids_by_key[unit_key_tuple(module)] = module.id
+        return ids_by_key
+
+
+def link_content(config):
+    """
+    :param config: configuration of the importer
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+
+    :return: True if module files are to be hard linked into storage where possible
+    :rtype:  bool
+    """
+    import_mode = config.get(constants.CONFIG_IMPORT_MODE) or constants.DEFAULT_IMPORT_MODE
+    return import_mode == constants.IMPORT_MODE_HARDLINK
+
+
+def unit_key_tuple(module):
+    """
+    Returns the unit key of a module as a tuple, which unlike the unit key itself can
+    be used in sets and as a dict key.
+
+    :param module: module to return the key of
+    :type  module: pulp_puppet.plugins.db.models.Module or ModuleRecord
+
+    :return: values of the unit key fields, in the order of Module.unit_key_fields
+    :rtype:  tuple
+    """
+    return tuple(getattr(module, field) for field in Module.unit_key_fields)
+
+
+def associate_modules(repo_obj, module_ids):
+    """
+    Associates modules that already exist in Pulp with a repository. Nothing is
+    downloaded or written to disk; only the associations are created, with a bulk write
+    per chunk of modules.
+
+    :param repo_obj: repository to associate the modules with
+    :type  repo_obj: pulp.server.db.model.Repository
+    :param module_ids: ids of the modules to associate
+    :type  module_ids: list
+
+    :return: number of modules associated
+    :rtype:  int
+    """
+    count = 0
+    for i in xrange(0, len(module_ids), QUERY_CHUNK_SIZE):
+        chunk = module_ids[i:i + QUERY_CHUNK_SIZE]
+        modules = list(Module.objects(id__in=chunk).only(*Module.unit_key_fields))
+        _associate_units(repo_obj, modules)
+        count += len(modules)
+    return count
+
+
+def store_module(repo_obj, module, path):
+    """
+    Saves a single new module, imports its file into Pulp's storage and associates it
+    with a repository.
+
+    :param repo_obj: repository to associate the module with
+    :type  repo_obj: pulp.server.db.model.Repository
+    :param module: unsaved module
+    :type  module: pulp_puppet.plugins.db.models.Module
+    :param path: full path to the module's file
+    :type  path: str
+    """
+    _prepare_module(module, path)
+    module.save()
+    module.import_content(path)
+    repo_controller.associate_single_unit(repo_obj, module)
+
+
+class ModuleCommitter(object):
+    """
+    Stores new modules in Pulp in batches. Modules are buffered as they are added; once
+    the buffer is full the modules are inserted with a single bulk write, their files
+    are imported into Pulp's storage, and they are associated with the repository with
+    a second bulk write. Should a bulk write fail, the modules of the batch are written
+    one at a time so the failure is reported against the modules responsible.
+
+    :ivar repo_obj: repository the modules are associated with
+    :type repo_obj: pulp.server.db.model.Repository
+    :ivar batch_size: number of modules buffered before they are stored
+    :type batch_size: int
+    :ivar link: True if module files are hard linked into storage where possible
+    :type link: bool
+    """
+
+    def __init__(self, repo_obj, batch_size=COMMIT_BATCH_SIZE, link=False):
+        """
+        :param repo_obj: repository the modules are associated with
+        :type  repo_obj: pulp.server.db.model.Repository
+        :param batch_size: number of modules buffered before they are stored
+        :type  batch_size: int
+        :param link: True to hard link module files into storage where possible
+        :type  link: bool
+        """
+        self.repo_obj = repo_obj
+        self.batch_size = batch_size
+        self.link = link
+        self._pending = []
+
+    def add(self, module, path, data=None, digests=None):
+        """
+        Buffers a module to be stored, storing every buffered module if the buffer is
+        full.
+
+        :param module: unsaved module
+        :type  module: pulp_puppet.plugins.db.models.Module
+        :param path: full path to the module's file
+        :type  path: str
+        :param data: returned as part of the module's result
+        :type  data: object
+        :param digests: digests of the module's file keyed by algorithm name, computed
+                        while it was downloaded; None if they are not known
+        :type  digests: dict
+
+        :return: results of the modules stored by this call, if any
+        :rtype:  list of CommitResult
+        """
+        self._pending.append((module, path, data, digests))
+        if len(self._pending) < self.batch_size:
+            return []
+        return self.flush()
+
+    def flush(self):
+        """
+        Stores every buffered module.
+
+        :return: one result per module stored, in the order they were added
+        :rtype:  list of CommitResult
+        """
+        pending, self._pending = self._pending, []
+        errors = {}
+
+        prepared = []
+        for module, path, data, digests in pending:
+            try:
+                _prepare_module(module, path, digests)
+                prepared.append((module, path))
+            except Exception as e:
+                errors[id(module)] = (e, sys.exc_info()[2])
+
+        imported = []
+        for module, path in self._insert(prepared, errors):
+            try:
+                module.import_content(path, link=self.link)
+                imported.append(module)
+            except Exception as e:
+                errors[id(module)] = (e, sys.exc_info()[2])
+
+        _associate_units(self.repo_obj, imported, errors)
+
+        results = []
+        for module, path, data, digests in pending:
+            error, traceback = errors.get(id(module), (None, None))
+            results.append(CommitResult(module, path, data, error, traceback))
+        return results
+
+    def _insert(self, prepared, errors):
+        """
+        Inserts the modules with a single bulk write, falling back to saving them one at
+        a time if it fails.
+
+        :param prepared: tuples of (module, path) for the modules to insert
+        :type  prepared: list
+        :param errors: tuples of (exception, traceback) keyed on the id() of the module
+                       they occurred for; the errors of this step are added to it
+        :type  errors: dict
+
+        :return: tuples of (module, path) for the modules saved
+        :rtype:  list
+        """
+        if not prepared:
+            return []
+        try:
+            Module.objects.insert([module for module, path in prepared], load_bulk=False)
+            return prepared
+        except OperationError:
+            pass
+
+        # Modules the failed write did insert are saved again, which overwrites them
+        saved = []
+        for module, path in prepared:
+            try:
+                module.save()
+                saved.append((module, path))
+            except Exception as e:
+                errors[id(module)] = (e, sys.exc_info()[2])
+        return saved
+
+
+def _associate_units(repo_obj, modules, errors=None):
+    """
+    Associates modules with a repository with a single bulk write, falling back to
+    associating them one at a time if it fails. Modules the failed write did associate
+    are associated again, which leaves their association as it is.
+
+    :param repo_obj: repository to associate the modules with
+    :type  repo_obj: pulp.server.db.model.Repository
+    :param modules: saved modules to associate
+    :type  modules: list of pulp_puppet.plugins.db.models.Module
+    :param errors: tuples of (exception, traceback) keyed on the id() of the module
+                   they occurred for; the errors of this step are added to it. If None,
+                   an error associating a single module is raised instead.
+    :type  errors: dict
+    """
+    if not modules:
+        return
+    timestamp = dateutils.format_iso8601_utc_timestamp(dateutils.now_utc_timestamp())
+    associations = [RepositoryContentUnit(repo_id=repo_obj.repo_id, unit_id=module.id,
+                                          unit_type_id=module._content_type_id,
+                                          created=timestamp, updated=timestamp)
+                    for module in modules]
+    try:
+        RepositoryContentUnit.objects.insert(associations, load_bulk=False)
+        return
+    except OperationError:
+        pass
+
+    for module in modules:
+        try:
+            repo_controller.associate_single_unit(repo_obj, module)
+        except Exception as e:
+            if errors is None:
+                raise
+            errors[id(module)] = (e, sys.exc_info()[2])
+
+
+def _prepare_module(module, path, digests=None):
+    """
+    Fills in everything a new module needs before it is written, so that it is
+    written once rather than saved again after its file is imported.
+
+    :param module: unsaved module
+    :type  module: pulp_puppet.plugins.db.models.Module
+    :param path: full path to the module's file
+    :type  path: str
+    :param digests: digests of the module's file keyed by algorithm name; the file is
+                    only read if they do not include its checksum type and md5
+    :type  digests: dict
+    """
+    module.set_storage_path(os.path.basename(path))
+
+    # Module field to fill in for each digest the file has not been checksummed with yet
+    fields = {}
+    if module.checksum is None:
+        fields[module.checksum_type] = 'checksum'
+    if module.file_md5 is None:
+        fields[FILE_MD5_TYPE] = 'file_md5'
+    digests = digests or {}
+    missing = set(fields) - set(digests)
+    if missing:
+        # Every missing digest is computed while reading the file once
+        digests = dict(digests, **file_digests(path, missing))
+    for digest_type, field in fields.iteritems():
+        setattr(module, field, digests[digest_type])
+
+    # Bulk inserts do not send the pre_save signal the unit relies on to record when it
+    # was last updated, which importing its file requires
+    signals.pre_save.send(module.__class__, document=module)
+    module.validate()
@@ -1,11 +1,10 @@
 import os
 import shutil
 
-from pulp.server.controllers import repository as repo_controller
-
 from pulp_puppet.common import constants
 from pulp_puppet.plugins.db.models import Module
 from pulp_puppet.plugins.importers import metadata as metadata_parser
+from pulp_puppet.plugins.importers.units import store_module
 
 
 def handle_uploaded_unit(repo, type_id, unit_key, metadata, file_path, conduit):
@@ -33,7 +32,7 @@ def handle_uploaded_unit(repo, type_id, unit_key, metadata, file_path, conduit):
         raise NotImplementedError()
 
     # Extract the metadata from the module
-    extracted_data = metadata_parser.extract_metadata(file_path, repo.working_dir)
+    extracted_data = metadata_parser.extract_metadata(file_path)
 
     # rename the file so it has the original module name
     original_filename = extracted_data['name'] + '-' + extracted_data['version'] + '.tar.gz'
@@ -44,10 +43,6 @@ def handle_uploaded_unit(repo, type_id, unit_key, metadata, file_path, conduit):
     extracted_data.update(Module.split_filename(extracted_data['name']))
 
     uploaded_module = Module.from_metadata(extracted_data)
-    uploaded_module.set_storage_path(os.path.basename(new_file_path))
-    uploaded_module.save()
-    uploaded_module.import_content(new_file_path)
-
-    repo_controller.associate_single_unit(repo.repo_obj, uploaded_module)
+    store_module(repo.repo_obj, uploaded_module, new_file_path)
 
     return {'success_flag': True, 'summary': '', 'details': {}}
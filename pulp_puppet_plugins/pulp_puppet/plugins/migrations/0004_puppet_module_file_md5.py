@@ -0,0 +1,84 @@
+from gettext import gettext as _
+from itertools import imap
+from multiprocessing import Pool
+import logging
+
+from pulp.server.db.connection import get_collection
+from pymongo import ASCENDING
+
+from pulp_puppet.plugins.importers import metadata
+
+_log = logging.getLogger('pulp')
+
+# Number of modules read from the database at a time, each batch with a query of its
+# own; their files are checksummed in parallel and the results written before the
+# next batch is read
+BATCH_SIZE = 1000
+
+# Number of files handed to a worker process at a time
+CHUNK_SIZE = 16
+
+
+def migrate(*args, **kwargs):
+    """
+    For each puppet module, store the md5 of its file on the module so publishing does
+    not need to read every file again. The files are checksummed by a pool of
+    processes, one batch of modules at a time.
+
+    Batches are read in the order of the modules' IDs, each starting after the last
+    module of the previous batch. No cursor is kept open while files are checksummed,
+    where it could time out, and modules whose file cannot be read are not read again.
+    """
+    collection = get_collection('units_puppet_module')
+
+    try:
+        pool = Pool()
+        map_func = lambda func, batch: pool.imap(func, batch, CHUNK_SIZE)
+    except (AssertionError, OSError):
+        # Processes cannot be started, so the files are checksummed one at a time
+        pool = None
+        map_func = imap
+
+    count = 0
+    spec = {'file_md5': {'$exists': False}}
+    try:
+        while True:
+            units = collection.find(spec, ['_storage_path'], sort=[('_id', ASCENDING)],
+                                    limit=BATCH_SIZE)
+            batch = [(unit['_id'], unit.get('_storage_path')) for unit in units]
+            if not batch:
+                break
+            spec['_id'] = {'$gt': batch[-1][0]}
+            for unit_id, storage_path, md5 in map_func(_file_md5, batch):
+                if md5 is None:
+                    msg = _('Could not calculate the md5 of puppet module file %(path)s')
+                    _log.warning(msg % {'path': storage_path})
+                    continue
+                collection.update_one({'_id': unit_id}, {'$set': {'file_md5': md5}})
+                count += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    _log.info(_('Migrated %(count)d puppet modules to include the md5 of their file') %
+              {'count': count})
+
+
+def _file_md5(unit):
+    """
+    Calculates the md5 of a module's file. Runs in the worker processes.
+
+    :param unit: tuple of the module's ID and the full path to its file
+    :type  unit: tuple
+
+    :return: tuple of the module's ID, the path to its file and its md5; the md5 is
+             None if the file cannot be read
+    :rtype:  tuple
+    """
+    unit_id, storage_path = unit
+    try:
+        md5 = metadata.calculate_checksum(storage_path, 'md5')
+    except (IOError, TypeError):
+        md5 = None
+    return unit_id, storage_path, md5
@@ -0,0 +1,87 @@
+"""
+Compares writing the dependency database of a repository with each key written
+exactly once against the previous approach of rewriting a module's key for each of
+its versions, for repositories with an increasing number of versions per module.
+
+Run from the pulp_puppet_plugins directory:
+
+    python test/benchmark/dependency_data.py --modules 20000
+"""
+
+import argparse
+import gdbm
+import json
+import os
+import shutil
+import tempfile
+import timeit
+
+from pulp_puppet.plugins.distributors import publish
+
+
+def build_entries(module_count, versions):
+    """
+    Builds the dependency metadata of a repository holding the given number of
+    modules, each name having the given number of versions.
+
+    :return: list of (forge_key, value) tuples
+    :rtype:  list
+    """
+    entries = []
+    for i in xrange(module_count):
+        forge_key = 'jdob/module%d' % (i // versions)
+        value = {
+            'file': '/pulp/puppet/repo/system/releases/j/jdob/module-%d.tar.gz' % i,
+            'version': '1.0.%d' % (i % versions),
+            'dependencies': [{'name': 'puppetlabs/stdlib', 'version_requirement': '>= 4.0.0'}],
+            'file_md5': 'd41d8cd98f00b204e9800998ecf8427e',
+        }
+        entries.append((forge_key, value))
+    return entries
+
+
+def write_per_module(filename, entries):
+    """
+    The approach replaced by publish.write_dependency_data, kept as the baseline.
+    """
+    db = gdbm.open(filename, 'n')
+    try:
+        for forge_key, value in entries:
+            try:
+                module_list = json.loads(db[forge_key])
+            except KeyError:
+                module_list = []
+            module_list.append(value)
+            db[forge_key] = json.dumps(module_list)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', type=int, default=5000,
+                        help='number of modules in the repository')
+    parser.add_argument('--versions', type=int, nargs='+', default=[1, 10, 50, 200],
+                        help='numbers of versions per module to time')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of times each approach is timed')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix='bench-dependency-data')
+    filename = os.path.join(temp_dir, '.dependency_db')
+    try:
+        print '%-10s %12s %12s' % ('versions', 'per-module', 'grouped')
+        for versions in args.versions:
+            entries = build_entries(args.modules, versions)
+            timings = []
+            for func in (write_per_module, publish.write_dependency_data):
+                timings.append(min(timeit.repeat(lambda: func(filename, entries),
+                                                 number=1, repeat=args.repeat)))
+            print '%-10d %9.2f ms %9.2f ms' % (versions, timings[0] * 1000,
+                                               timings[1] * 1000)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
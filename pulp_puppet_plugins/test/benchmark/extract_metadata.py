@@ -0,0 +1,81 @@
+"""
+Compares reading a module's metadata.json straight out of the tarball with the
+previous approach of extracting the whole module to a temporary directory.
+
+Run from the pulp_puppet_plugins directory:
+
+    python test/benchmark/extract_metadata.py --files 5000
+"""
+
+from cStringIO import StringIO
+import argparse
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import timeit
+
+from pulp_puppet.plugins.importers import metadata
+
+
+def build_module(directory, file_count):
+    """
+    Builds a module with the given number of files, such as vendored gems or
+    fixtures, in addition to its metadata file.
+
+    :return: full path to the module file
+    :rtype:  str
+    """
+    filename = os.path.join(directory, 'jdob-bench-1.0.0.tar.gz')
+    tgz = tarfile.open(filename, 'w:gz')
+    members = [('jdob-bench-1.0.0/metadata.json', json.dumps({'name': 'jdob-bench'}))]
+    members.extend(('jdob-bench-1.0.0/spec/fixtures/file%d.rb' % i, 'x' * 512)
+                   for i in xrange(file_count))
+    for name, content in members:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        tgz.addfile(info, StringIO(content))
+    tgz.close()
+    return filename
+
+
+def extract_all(filename, temp_dir):
+    """
+    The approach replaced by metadata.extract_metadata, kept as the baseline.
+    """
+    extraction_dir = tempfile.mkdtemp(dir=temp_dir)
+    try:
+        tgz = tarfile.open(name=filename)
+        tgz.extractall(path=extraction_dir)
+        tgz.close()
+        module_dir = os.listdir(extraction_dir)[0]
+        with open(os.path.join(extraction_dir, module_dir, 'metadata.json')) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(extraction_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=2000,
+                        help='number of files in the module besides its metadata')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of times each approach is timed')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix='bench-extract-metadata')
+    try:
+        filename = build_module(temp_dir, args.files)
+        assert extract_all(filename, temp_dir) == metadata.extract_metadata(filename)
+
+        for label, func in (('extractall', lambda: extract_all(filename, temp_dir)),
+                            ('streaming', lambda: metadata.extract_metadata(filename))):
+            best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            print '%-10s %8.2f ms' % (label, best * 1000)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,14 @@
 
 import functools
 import gdbm
+import json
 import unittest
 
 import mock
 from pulp.server.managers.consumer.bind import BindManager
 
 from pulp_puppet.common import constants
-from pulp_puppet.forge import releases
+from pulp_puppet.forge import releases, v3
 from pulp_puppet.forge.unit import Unit
 
 
@@ -296,6 +297,96 @@ class TestGetRepoData(unittest.TestCase):
             '/var/lib/pulp/published/puppet/http/repos/repo1/.dependency_db', 'r')
 
 
+class FakeDb(dict):
+    """
+    Stands in for an open gdbm database
+    """
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@mock.patch('pulp_puppet.forge.releases.model.Distributor.objects')
+class TestOpenV3Db(unittest.TestCase):
+
+    @mock.patch('gdbm.open', autospec=True)
+    def test_single_repo(self, mock_open, mock_find):
+        mock_find.return_value = [{'repo_id': 'repo1', 'config': {}}]
+
+        result = releases.open_v3_db(constants.FORGE_NULL_AUTH_VALUE, 'repo1')
+
+        self.assertEqual(result, mock_open.return_value)
+        mock_open.assert_called_once_with(
+            '/var/lib/pulp/published/puppet/http/repos/repo1/.forge_v3_db', 'r')
+
+    @mock.patch('gdbm.open', autospec=True)
+    @mock.patch.object(releases, 'get_bound_repos', autospec=True)
+    def test_multiple_repos(self, mock_get_bounds, mock_open, mock_find):
+        mock_get_bounds.return_value = ['repo1', 'repo2']
+
+        result = releases.open_v3_db('consumer1', constants.FORGE_NULL_AUTH_VALUE)
+
+        # results spanning repositories are built on request
+        self.assertTrue(result is None)
+        self.assertEqual(mock_open.call_count, 0)
+
+    @mock.patch('gdbm.open', autospec=True)
+    def test_not_precomputed(self, mock_open, mock_find):
+        mock_find.return_value = [{'repo_id': 'repo1', 'config': {}}]
+        mock_open.side_effect = gdbm.error
+
+        self.assertTrue(releases.open_v3_db(constants.FORGE_NULL_AUTH_VALUE, 'repo1') is None)
+
+
+@mock.patch.object(releases, 'open_v3_db', autospec=True)
+class TestV3Documents(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDb({
+            v3.RELEASES_KEY % 'me/mymodule': json.dumps(['1.0.0', '2.0.0']),
+            v3.RELEASE_KEY % ('me/mymodule', '1.0.0'): '{"version": "1.0.0"}',
+            v3.RELEASE_KEY % ('me/mymodule', '2.0.0'): '{"version": "2.0.0"}',
+            v3.MODULE_KEY % 'me/mymodule': '{"name": "mymodule"}',
+        })
+
+    def test_releases(self, mock_open):
+        mock_open.return_value = self.db
+
+        result = releases.v3_releases('consumer1', 'repo1', 'me/mymodule')
+
+        self.assertEqual(result, ['{"version": "1.0.0"}', '{"version": "2.0.0"}'])
+        self.assertTrue(self.db.closed)
+
+    def test_releases_version(self, mock_open):
+        mock_open.return_value = self.db
+
+        result = releases.v3_releases('consumer1', 'repo1', 'me/mymodule', version='2.0.0')
+
+        self.assertEqual(result, ['{"version": "2.0.0"}'])
+
+    def test_releases_not_found(self, mock_open):
+        mock_open.return_value = self.db
+
+        self.assertTrue(releases.v3_releases('consumer1', 'repo1', 'me/other') is None)
+        self.assertTrue(releases.v3_releases('consumer1', 'repo1', 'me/mymodule',
+                                             version='3.0.0') is None)
+
+    def test_not_precomputed(self, mock_open):
+        mock_open.return_value = None
+
+        self.assertTrue(releases.v3_releases('consumer1', 'repo1', 'me/mymodule') is None)
+        self.assertTrue(releases.v3_module('consumer1', 'repo1', 'me/mymodule') is None)
+
+    def test_module(self, mock_open):
+        mock_open.return_value = self.db
+
+        result = releases.v3_module('consumer1', 'repo1', 'me/mymodule')
+
+        self.assertEqual(result, '{"name": "mymodule"}')
+        self.assertTrue(self.db.closed)
+
+
 class TestGetProtocol(unittest.TestCase):
     def test_default(self):
         result = releases._get_protocol_from_distributor({'config': {}})
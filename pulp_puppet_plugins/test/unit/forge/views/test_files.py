@@ -128,3 +128,14 @@ class TestFilesPost36View(unittest.TestCase):
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.get('location'), 'http://example.com/foo-bar-1.2.3.tar.gz')
+
+    @mock.patch('pulp_puppet.forge.releases.view')
+    @mock.patch('pulp_puppet.forge.releases.v3_releases')
+    def test_get_releases_precomputed(self, mock_v3_releases, mock_view):
+        mock_v3_releases.return_value = ['{"file_uri": "/pulp/puppet/foo-bar-1.2.3.tar.gz"}']
+
+        result = FilesPost36View().get_releases('consumer1', 'repo1', module_name='foo/bar',
+                                                version='1.2.3', hostname='localhost')
+
+        self.assertEqual(result, {'foo/bar': [{'file': '/pulp/puppet/foo-bar-1.2.3.tar.gz'}]})
+        self.assertEqual(mock_view.call_count, 0)
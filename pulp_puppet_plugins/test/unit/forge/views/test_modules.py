@@ -161,6 +161,7 @@ class TestModulesPost36View(unittest.TestCase):
         self.assertEquals('apple', dependencies[0]['name'])
         self.assertEquals('42.5', dependencies[0]['version_requirement'])
 
+    @mock.patch('pulp_puppet.forge.releases.v3_module', mock.Mock(return_value=None))
     @mock.patch('pulp_puppet.forge.releases.view')
     @mock.patch('pulp_puppet.forge.views.modules.ModulesView._get_module_name')
     @mock.patch('pulp_puppet.forge.views.modules.ModulesView._get_credentials')
@@ -178,3 +179,25 @@ class TestModulesPost36View(unittest.TestCase):
         response = releases_view.get(mock_request)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, json.dumps(self.FAKE_VIEW_DATA))
+
+    @mock.patch('pulp_puppet.forge.releases.view')
+    @mock.patch('pulp_puppet.forge.releases.v3_module')
+    def test_get_releases_precomputed(self, mock_v3_module, mock_view):
+        mock_v3_module.return_value = '{"slug": "foo-bar"}'
+
+        response = ModulesPost36View().get_releases('consumer1', 'repo1', module_name='foo/bar',
+                                                    version=None, hostname='localhost')
+
+        # The precomputed module is served as it was stored
+        self.assertEqual(response.content, '{"slug": "foo-bar"}')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(mock_view.call_count, 0)
+
+    @mock.patch('pulp_puppet.forge.releases.view')
+    @mock.patch('pulp_puppet.forge.releases.v3_module')
+    def test_get_releases_version(self, mock_v3_module, mock_view):
+        result = ModulesPost36View().get_releases('consumer1', 'repo1', module_name='foo/bar',
+                                                  version='1.0.0', hostname='localhost')
+
+        self.assertEqual(result, mock_view.return_value)
+        self.assertEqual(mock_v3_module.call_count, 0)
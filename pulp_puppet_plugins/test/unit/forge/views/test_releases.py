@@ -236,3 +236,52 @@ class TestReleasesPost36View(unittest.TestCase):
         dependencies = module_data['metadata']['dependencies']
         self.assertEquals('apple', dependencies[0]['name'])
         self.assertEquals('42.5', dependencies[0]['version_requirement'])
+
+    def test_format_results_precomputed(self):
+        release = ReleasesPost36View()
+        get_dict = {'module': 'foo-bar', 'limit': '1', 'offset': '1'}
+        precomputed = [json.dumps({'metadata': {'name': 'foo-bar', 'version': v}})
+                       for v in ('1.0', '2.0', '3.0')]
+
+        result = json.loads(release.format_results(precomputed, get_dict,
+                                                   '/v3/releases').content)
+
+        self.assertEquals(3, result['pagination']['total'])
+        self.assertEquals(u'/v3/releases?limit=1&module=foo-bar&offset=2',
+                          result['pagination']['next'])
+        self.assertEquals([{'metadata': {'name': 'foo-bar', 'version': '2.0'}}],
+                          result['results'])
+
+    def test_format_results_precomputed_renamed(self):
+        release = ReleasesPost36View()
+        get_dict = {'module': 'foo/bar'}
+        precomputed = [json.dumps({'metadata': {'name': 'foo-bar', 'version': '1.0'}})]
+
+        result = json.loads(release.format_results(precomputed, get_dict,
+                                                   '/v3/releases').content)
+
+        # The module is named as it was requested
+        self.assertEquals('foo/bar', result['results'][0]['metadata']['name'])
+
+    @mock.patch('pulp_puppet.forge.releases.view')
+    @mock.patch('pulp_puppet.forge.releases.v3_releases')
+    def test_get_releases_precomputed(self, mock_v3_releases, mock_view):
+        mock_v3_releases.return_value = ['{}']
+
+        result = ReleasesPost36View().get_releases('consumer1', 'repo1', module_name='foo/bar',
+                                                   version=None, hostname='localhost')
+
+        self.assertEquals(['{}'], result)
+        mock_v3_releases.assert_called_once_with('consumer1', 'repo1', module_name='foo/bar',
+                                                 version=None)
+        self.assertEquals(0, mock_view.call_count)
+
+    @mock.patch('pulp_puppet.forge.releases.view')
+    @mock.patch('pulp_puppet.forge.releases.v3_releases')
+    def test_get_releases_not_precomputed(self, mock_v3_releases, mock_view):
+        mock_v3_releases.return_value = None
+
+        result = ReleasesPost36View().get_releases('consumer1', 'repo1', module_name='foo/bar',
+                                                   version=None, hostname='localhost')
+
+        self.assertEquals(mock_view.return_value, result)
@@ -1,8 +1,14 @@
+from cStringIO import StringIO
+import errno
+import os
+import shutil
+import tempfile
 import unittest
 
+import mock
 from pulp.common.compat import json
 
-from pulp_puppet.plugins.db.models import RepositoryMetadata, Module
+from pulp_puppet.plugins.db.models import RepositoryMetadata, Module, ModuleRecord
 
 # -- constants ----------------------------------------------------------------
 
@@ -96,6 +102,32 @@ class RepositoryMetadataTests(unittest.TestCase):
         self.assertEqual(sorted_modules[1].checksum, 'foo')
         self.assertEqual(sorted_modules[1].checksum_type, 'foo_type')
 
+    def test_update_records_from_json(self):
+        # Test
+        metadata = RepositoryMetadata()
+        metadata.update_records_from_json(VALID_REPO_METADATA_JSON)
+
+        # Verify
+        self.assertEqual(2, len(metadata.modules))
+        self.assertTrue(all(isinstance(m, ModuleRecord) for m in metadata.modules))
+
+        sorted_modules = sorted(metadata.modules, key=lambda m: m.name)
+        self.assertEqual(sorted_modules[0], ('lab42', 'common', '0.0.1', [], None, None))
+        self.assertEqual(sorted_modules[1], ('lab42', 'postfix', '0.0.2',
+                                             ['postfix', 'applications'], None, None))
+
+    def test_update_records_from_json_duplicates(self):
+        # Overlapping queries list the same modules more than once
+        metadata = RepositoryMetadata()
+        metadata.update_records_from_json(VALID_REPO_METADATA_JSON)
+        metadata.update_records_from_json(VALID_REPO_METADATA_JSON)
+
+        self.assertEqual(2, len(metadata.modules))
+
+    def test_update_records_from_json_invalid(self):
+        metadata = RepositoryMetadata()
+        self.assertRaises(ValueError, metadata.update_records_from_json, 'not parsable json')
+
     def test_to_json(self):
         # Setup
         metadata = RepositoryMetadata()
@@ -122,3 +154,93 @@ class RepositoryMetadataTests(unittest.TestCase):
         self.assertEqual(sorted_modules[1]['author'], 'lab42')
         self.assertEqual(sorted_modules[1]['version'], '0.0.2')
         self.assertEqual(sorted_modules[1]['tag_list'], ['postfix', 'applications'])
+
+    def test_write_json(self):
+        metadata = RepositoryMetadata()
+        metadata.update_from_json(VALID_REPO_METADATA_JSON)
+        expected = json.loads(metadata.to_json())
+        # The modules are only iterated once, so a cursor may be used
+        metadata.modules = iter(metadata.modules)
+
+        fp = StringIO()
+        metadata.write_json(fp)
+
+        self.assertEqual(json.loads(fp.getvalue()), expected)
+
+    def test_write_json_empty(self):
+        fp = StringIO()
+        RepositoryMetadata().write_json(fp)
+
+        self.assertEqual(json.loads(fp.getvalue()), [])
+
+
+class ModuleRecordTests(unittest.TestCase):
+
+    def setUp(self):
+        self.record = ModuleRecord.from_metadata({'author': 'jdob', 'name': 'valid',
+                                                  'version': '1.0.0', 'tag_list': ['a'],
+                                                  'desc': 'ignored'})
+
+    def test_from_metadata(self):
+        self.assertEqual(self.record, ('jdob', 'valid', '1.0.0', ['a'], None, None))
+        self.assertEqual(ModuleRecord.from_metadata({'name': 'valid'}).tag_list, [])
+
+    def test_from_metadata_file(self):
+        record = ModuleRecord.from_metadata({'author': 'jdob', 'name': 'valid',
+                                             'version': '1.0.0', 'file_uri': '/v3/files/x',
+                                             'file_md5': 'abc'})
+
+        self.assertEqual(record.file_uri, '/v3/files/x')
+        self.assertEqual(record.file_md5, 'abc')
+
+    def test_unit_key(self):
+        self.assertEqual(self.record.unit_key,
+                         {'author': 'jdob', 'name': 'valid', 'version': '1.0.0'})
+
+    def test_puppet_standard_filename(self):
+        self.assertEqual(self.record.puppet_standard_filename(), 'jdob-valid-1.0.0.tar.gz')
+
+
+@mock.patch('pulp_puppet.plugins.db.models.FileContentUnit.import_content')
+class ModuleImportContentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='module-import-content-tests')
+        self.source = os.path.join(self.tmp_dir, 'jdob-valid-1.0.0.tar.gz')
+        with open(self.source, 'w') as f:
+            f.write('module')
+        self.module = Module(author='jdob', name='valid', version='1.0.0', checksum='abc')
+        self.module._storage_path = os.path.join(self.tmp_dir, 'storage', 'module.tar.gz')
+        self.module._last_updated = 1
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_copy(self, mock_import_content):
+        self.module.import_content(self.source)
+
+        mock_import_content.assert_called_once_with(self.source, location=None)
+        self.assertFalse(os.path.exists(self.module._storage_path))
+
+    def test_link(self, mock_import_content):
+        self.module.import_content(self.source, link=True)
+
+        self.assertEqual(mock_import_content.call_count, 0)
+        self.assertTrue(os.path.samefile(self.source, self.module._storage_path))
+
+    @mock.patch('pulp_puppet.plugins.db.models.os.link')
+    def test_link_other_device(self, mock_link, mock_import_content):
+        mock_link.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        self.module.import_content(self.source, link=True)
+
+        mock_import_content.assert_called_once_with(self.source, location=None)
+
+    def test_link_unsaved(self, mock_import_content):
+        # The parent class reports an unsaved unit
+        self.module._last_updated = None
+
+        self.module.import_content(self.source, link=True)
+
+        mock_import_content.assert_called_once_with(self.source, location=None)
+        self.assertFalse(os.path.exists(self.module._storage_path))
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulp.plugins.config import PluginCallConfiguration
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.distributors import manifest
+from pulp_puppet.plugins.distributors.manifest import PublishManifest
+
+
+class PublishManifestTests(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='puppet-manifest-tests')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_diff(self):
+        published = PublishManifest({}, {'a.tar.gz': ['/storage/a', 'jdob/a'],
+                                         'b.tar.gz': ['/storage/b', 'jdob/b'],
+                                         'c.tar.gz': ['/storage/c', 'jdob/c']})
+
+        removed, added = published.diff({'a.tar.gz': '/storage/a',
+                                         'c.tar.gz': '/storage/c2',
+                                         'd.tar.gz': '/storage/d'})
+
+        # A module whose file changed is both removed and added
+        self.assertEqual(sorted(removed), ['b.tar.gz', 'c.tar.gz'])
+        self.assertEqual(sorted(added), ['c.tar.gz', 'd.tar.gz'])
+
+    def test_save_load(self):
+        PublishManifest({'version': 1}, {'a.tar.gz': ['/storage/a', 'jdob/a']}).save(
+            self.working_dir)
+
+        loaded = PublishManifest.load(self.working_dir)
+
+        self.assertEqual(loaded.fingerprint, {'version': 1})
+        self.assertEqual(loaded.modules, {'a.tar.gz': ['/storage/a', 'jdob/a']})
+
+    def test_load_missing(self):
+        self.assertTrue(PublishManifest.load(self.working_dir) is None)
+
+    def test_load_corrupt(self):
+        with open(os.path.join(self.working_dir, manifest.MANIFEST_FILENAME), 'w') as f:
+            f.write('{"modules": ')
+
+        self.assertTrue(PublishManifest.load(self.working_dir) is None)
+
+    def test_remove(self):
+        PublishManifest({}).save(self.working_dir)
+
+        PublishManifest.remove(self.working_dir)
+        # Removing a manifest that does not exist is not an error
+        PublishManifest.remove(self.working_dir)
+
+        self.assertTrue(PublishManifest.load(self.working_dir) is None)
+
+
+class PublishFingerprintTests(unittest.TestCase):
+
+    def test_configuration_changes(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_SERVE_HTTP: True})
+        fingerprint = manifest.publish_fingerprint('repo', config)
+
+        config.repo_plugin_config[constants.CONFIG_SERVE_HTTPS] = True
+
+        self.assertNotEqual(manifest.publish_fingerprint('repo', config), fingerprint)
+        self.assertNotEqual(manifest.publish_fingerprint('other', config), fingerprint)
@@ -0,0 +1,383 @@
+import gdbm
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from pulp.plugins.config import PluginCallConfiguration
+
+from pulp_puppet.common import constants
+from pulp_puppet.forge import v3
+from pulp_puppet.plugins.distributors import configuration, publish
+from pulp_puppet.plugins.distributors.manifest import PublishManifest
+
+
+class WriteDependencyDataTests(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='puppet-publish-tests')
+        self.filename = os.path.join(self.working_dir, '.dependency_db')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def _read(self):
+        db = gdbm.open(self.filename, 'r')
+        try:
+            return dict((key, json.loads(db[key])) for key in db.keys())
+        finally:
+            db.close()
+
+    def test_grouped(self):
+        entries = [('jdob/valid', {'version': '1.0.0'}),
+                   ('jdob/other', {'version': '2.0.0'}),
+                   ('jdob/valid', {'version': '1.1.0'})]
+
+        publish.write_dependency_data(self.filename, entries)
+
+        # The versions of a module are listed in the order they were given
+        self.assertEqual(self._read(), {
+            'jdob/valid': [{'version': '1.0.0'}, {'version': '1.1.0'}],
+            'jdob/other': [{'version': '2.0.0'}],
+        })
+
+    def test_update(self):
+        publish.write_dependency_data(self.filename, [('jdob/valid', {'version': '1.0.0'}),
+                                                      ('jdob/other', {'version': '2.0.0'}),
+                                                      ('jdob/gone', {'version': '3.0.0'})])
+
+        publish.write_dependency_data(self.filename, [('jdob/valid', {'version': '1.1.0'})],
+                                      forge_keys=set(['jdob/valid', 'jdob/gone']))
+
+        # Keys that are not given are left alone
+        self.assertEqual(self._read(), {
+            'jdob/valid': [{'version': '1.1.0'}],
+            'jdob/other': [{'version': '2.0.0'}],
+        })
+
+    def test_overwrites(self):
+        publish.write_dependency_data(self.filename, [('jdob/old', {'version': '1.0.0'})])
+        publish.write_dependency_data(self.filename, [])
+
+        self.assertEqual(self._read(), {})
+
+
+class WriteV3DataTests(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='puppet-publish-tests')
+        self.filename = os.path.join(self.working_dir, '.forge_v3_db')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def _read(self):
+        db = gdbm.open(self.filename, 'r')
+        try:
+            return dict((key, json.loads(db[key])) for key in db.keys())
+        finally:
+            db.close()
+
+    @staticmethod
+    def _value(version):
+        return {'file': '/pulp/puppet/repo/jdob-valid-%s.tar.gz' % version,
+                'version': version, 'file_md5': 'md5-%s' % version,
+                'dependencies': [{'name': 'puppetlabs/stdlib'}]}
+
+    def test_documents(self):
+        publish.write_v3_data(self.filename,
+                              {'jdob/valid': [self._value('1.0.0'), self._value('1.1.0')]})
+
+        data = self._read()
+        self.assertEqual(data[v3.RELEASES_KEY % 'jdob/valid'], ['1.0.0', '1.1.0'])
+        release = data[v3.RELEASE_KEY % ('jdob/valid', '1.1.0')]
+        self.assertEqual(release['metadata'], {
+            'name': 'jdob-valid', 'version': '1.1.0',
+            'dependencies': [{'name': 'puppetlabs/stdlib',
+                              'version_requirement': '>= 0.0.0'}]})
+        self.assertEqual(release['file_md5'], 'md5-1.1.0')
+        module = data[v3.MODULE_KEY % 'jdob/valid']
+        self.assertEqual(module['current_release']['version'], '1.1.0')
+        self.assertEqual(len(module['releases']), 2)
+
+    def test_invalid_version(self):
+        publish.write_v3_data(self.filename, {'jdob/valid': [self._value('latest')]})
+
+        # The module is left for the view to build, but its releases are stored
+        data = self._read()
+        self.assertTrue(v3.MODULE_KEY % 'jdob/valid' not in data)
+        self.assertEqual(data[v3.RELEASES_KEY % 'jdob/valid'], ['latest'])
+
+    def test_update(self):
+        publish.write_v3_data(self.filename, {'jdob/valid': [self._value('1.0.0')],
+                                              'jdob/other': [self._value('2.0.0')],
+                                              'jdob/gone': [self._value('3.0.0')]})
+
+        publish.write_v3_data(self.filename, {'jdob/valid': [self._value('1.1.0')]},
+                              forge_keys=set(['jdob/valid', 'jdob/gone']))
+
+        # The documents of the replaced versions are removed
+        self.assertEqual(sorted(self._read()), sorted([
+            v3.MODULE_KEY % 'jdob/valid', v3.RELEASES_KEY % 'jdob/valid',
+            v3.RELEASE_KEY % ('jdob/valid', '1.1.0'),
+            v3.MODULE_KEY % 'jdob/other', v3.RELEASES_KEY % 'jdob/other',
+            v3.RELEASE_KEY % ('jdob/other', '2.0.0'),
+        ]))
+
+
+class RepositoryModulesTests(unittest.TestCase):
+
+    @mock.patch('pulp_puppet.plugins.distributors.publish.PUBLISH_BATCH_SIZE', 2)
+    @mock.patch('pulp_puppet.plugins.distributors.publish.Module')
+    @mock.patch('pulp_puppet.plugins.distributors.publish.RepositoryContentUnit')
+    def test_batches(self, mock_rcu, mock_module):
+        mock_rcu.objects.return_value.scalar.return_value = iter(['a', 'b', 'c'])
+        mock_module.objects.return_value.only.side_effect = lambda *fields: ['module']
+
+        modules = publish.RepositoryModules.for_repo('repo')
+
+        self.assertEqual(len(modules), 3)
+        self.assertEqual(list(modules), ['module', 'module'])
+        # The modules are loaded a batch at a time, with only the fields publish uses
+        self.assertEqual(mock_module.objects.call_args_list,
+                         [mock.call(id__in=['a', 'b']), mock.call(id__in=['c'])])
+        mock_module.objects.return_value.only.assert_called_with(*publish.PUBLISH_FIELDS)
+        mock_rcu.objects.assert_called_once_with(repo_id='repo',
+                                                 unit_type_id=constants.TYPE_PUPPET_MODULE)
+
+    def test_split_batches(self):
+        self.assertEqual(list(publish._batches(xrange(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(publish._batches([], 2)), [])
+
+
+class PublishRunTests(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='puppet-publish-tests')
+        self.storage_dir = os.path.join(self.working_dir, 'storage')
+        os.makedirs(self.storage_dir)
+        self.http_dir = os.path.join(self.working_dir, 'http')
+        self.https_dir = os.path.join(self.working_dir, 'https')
+        self.master_dir = os.path.join(self.working_dir, 'master')
+        self.published_dir = os.path.join(self.http_dir, 'repo')
+        self.config = PluginCallConfiguration(
+            {}, {constants.CONFIG_HTTP_DIR: self.http_dir,
+                 constants.CONFIG_HTTPS_DIR: self.https_dir,
+                 constants.CONFIG_MASTER_DIR: self.master_dir,
+                 constants.CONFIG_INCREMENTAL_PUBLISH: True})
+        self.config.default_config = configuration.DEFAULT_CONFIG
+        self.repo = mock.Mock(repo_id='repo')
+        self.repo_transfer = mock.Mock(id='repo', working_dir=self.working_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def _module(self, name, version):
+        path = os.path.join(self.storage_dir, 'jdob-%s-%s.tar.gz' % (name, version))
+        open(path, 'w').close()
+        module = mock.Mock(author='jdob', version=version, tag_list=[], dependencies=[],
+                           file_md5='md5-%s' % version, _storage_path=path)
+        # name is an argument of Mock itself
+        module.name = name
+        return module
+
+    @mock.patch('pulp_puppet.plugins.distributors.publish.RepositoryModules.for_repo')
+    def _publish(self, modules, mock_for_repo):
+        mock_for_repo.return_value = modules
+        run = publish.PuppetModulePublishRun(self.repo, self.repo_transfer, mock.Mock(),
+                                             self.config, lambda: False)
+        run.perform_publish()
+        return run
+
+    def _published_modules(self):
+        releases_dir = os.path.join(self.published_dir, 'system/releases/j/jdob')
+        if not os.path.isdir(releases_dir):
+            return []
+        return sorted(os.listdir(releases_dir))
+
+    def _dependency_data(self):
+        db = gdbm.open(os.path.join(self.published_dir, constants.REPO_DEPDATA_FILENAME), 'r')
+        try:
+            return dict((key, [v['version'] for v in json.loads(db[key])])
+                        for key in db.keys())
+        finally:
+            db.close()
+
+
+class IncrementalPublishTests(PublishRunTests):
+
+    def test_incremental(self):
+        valid_1, valid_2, other = (self._module('valid', '1.0.0'),
+                                   self._module('valid', '2.0.0'),
+                                   self._module('other', '1.0.0'))
+        run = self._publish([valid_1, other])
+        self.assertTrue(run.previous_manifest is None)
+
+        run = self._publish([valid_1, valid_2])
+
+        # Only the changes are applied to the built repository
+        self.assertTrue(run.previous_manifest is not None)
+        self.assertEqual(run.changed_forge_keys, set(['jdob/valid', 'jdob/other']))
+        self.assertEqual(self._published_modules(),
+                         ['jdob-valid-1.0.0.tar.gz', 'jdob-valid-2.0.0.tar.gz'])
+        self.assertEqual(self._dependency_data(), {'jdob/valid': ['1.0.0', '2.0.0']})
+        db = gdbm.open(os.path.join(self.published_dir, constants.REPO_V3_DATA_FILENAME), 'r')
+        try:
+            self.assertEqual(json.loads(db[v3.RELEASES_KEY % 'jdob/valid']),
+                             ['1.0.0', '2.0.0'])
+            self.assertFalse(db.has_key(v3.RELEASES_KEY % 'jdob/other'))
+        finally:
+            db.close()
+        with open(os.path.join(self.published_dir, constants.REPO_METADATA_FILENAME)) as f:
+            self.assertEqual(len(json.load(f)), 2)
+        self.assertEqual(run.progress_report.modules_finished_count, 2)
+
+    def test_configuration_changed(self):
+        module = self._module('valid', '1.0.0')
+        self._publish([module])
+
+        self.config.repo_plugin_config[constants.CONFIG_ABSOLUTE_PATH] = '/other/'
+        run = self._publish([module])
+
+        self.assertTrue(run.previous_manifest is None)
+        self.assertEqual(self._published_modules(), ['jdob-valid-1.0.0.tar.gz'])
+
+    def test_not_incremental(self):
+        self.config.repo_plugin_config[constants.CONFIG_INCREMENTAL_PUBLISH] = False
+        module = self._module('valid', '1.0.0')
+        self._publish([module])
+        run = self._publish([module])
+
+        self.assertTrue(run.previous_manifest is None)
+        self.assertFalse(os.path.exists(run._build_dir()))
+        self.assertTrue(PublishManifest.load(self.working_dir) is None)
+
+
+class MetadataTests(PublishRunTests):
+
+    def test_compressed_copy(self):
+        self._publish([self._module('valid', '1.0.0'), self._module('other', '1.0.0')])
+
+        with open(os.path.join(self.published_dir, constants.REPO_METADATA_FILENAME)) as f:
+            metadata = f.read()
+        gz_file = os.path.join(self.published_dir, constants.REPO_METADATA_GZ_FILENAME)
+        with gzip.open(gz_file) as f:
+            self.assertEqual(f.read(), metadata)
+        self.assertEqual(sorted(m['name'] for m in json.loads(metadata)), ['other', 'valid'])
+
+
+class GenerationTests(PublishRunTests):
+
+    def test_symlink_swapped(self):
+        module = self._module('valid', '1.0.0')
+        self._publish([module])
+        self.assertEqual(os.readlink(self.published_dir),
+                         os.path.join(self.master_dir, 'repo', '1'))
+
+        self._publish([module, self._module('valid', '2.0.0')])
+
+        # The previous generation is kept for the requests still reading from it
+        self.assertEqual(os.readlink(self.published_dir),
+                         os.path.join(self.master_dir, 'repo', '2'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.master_dir, 'repo'))),
+                         ['1', '2'])
+        self.assertEqual(self._published_modules(),
+                         ['jdob-valid-1.0.0.tar.gz', 'jdob-valid-2.0.0.tar.gz'])
+
+        self._publish([module])
+
+        # Generations older than the previous one are removed
+        self.assertEqual(sorted(os.listdir(os.path.join(self.master_dir, 'repo'))),
+                         ['2', '3'])
+
+    def test_both_protocols(self):
+        self.config.repo_plugin_config[constants.CONFIG_SERVE_HTTPS] = True
+
+        self._publish([self._module('valid', '1.0.0')])
+
+        # Both protocols link to the single copy of the repository
+        self.assertEqual(os.readlink(self.published_dir),
+                         os.readlink(os.path.join(self.https_dir, 'repo')))
+        self.assertEqual(os.listdir(os.path.join(self.master_dir, 'repo')), ['1'])
+
+    def test_replaces_copy(self):
+        # Published before generations were used
+        os.makedirs(os.path.join(self.published_dir, 'system'))
+
+        self._publish([self._module('valid', '1.0.0')])
+
+        self.assertTrue(os.path.islink(self.published_dir))
+        self.assertEqual(self._published_modules(), ['jdob-valid-1.0.0.tar.gz'])
+
+    def test_removes_unfinished(self):
+        os.makedirs(os.path.join(self.master_dir, 'repo', '5'))
+
+        self._publish([self._module('valid', '1.0.0')])
+
+        self.assertEqual(os.listdir(os.path.join(self.master_dir, 'repo')), ['6'])
+
+    def test_not_served(self):
+        self._publish([self._module('valid', '1.0.0')])
+        self.config.repo_plugin_config[constants.CONFIG_SERVE_HTTP] = False
+
+        self._publish([self._module('valid', '1.0.0')])
+
+        self.assertFalse(os.path.lexists(self.published_dir))
+        # The generation that was served is only removed by the next publish
+        self.assertEqual(os.listdir(os.path.join(self.master_dir, 'repo')), ['1'])
+        self._publish([self._module('valid', '1.0.0')])
+        self.assertEqual(os.listdir(os.path.join(self.master_dir, 'repo')), [])
+
+    def test_unpublish_repo(self):
+        self._publish([self._module('valid', '1.0.0')])
+
+        publish.unpublish_repo(self.repo_transfer, self.config)
+
+        self.assertFalse(os.path.lexists(self.published_dir))
+        self.assertFalse(os.path.exists(os.path.join(self.master_dir, 'repo')))
+
+
+class ChecksumTests(PublishRunTests):
+
+    def test_missing_md5(self):
+        legacy = self._module('legacy', '1.0.0')
+        legacy.file_md5 = None
+        with open(legacy._storage_path, 'w') as f:
+            f.write('module contents')
+
+        run = self._publish([legacy, self._module('valid', '1.0.0')])
+
+        db = gdbm.open(os.path.join(self.published_dir, constants.REPO_DEPDATA_FILENAME), 'r')
+        try:
+            self.assertEqual(json.loads(db['jdob/legacy'])[0]['file_md5'],
+                             hashlib.md5('module contents').hexdigest())
+            self.assertEqual(json.loads(db['jdob/valid'])[0]['file_md5'], 'md5-1.0.0')
+        finally:
+            db.close()
+        # Only the module without a stored md5 is read
+        report = run.progress_report
+        self.assertEqual(report.metadata_checksum_total_count, 1)
+        self.assertEqual(report.metadata_checksum_finished_count, 1)
+        self.assertEqual(report.metadata_checksum_bytes, len('module contents'))
+
+    @mock.patch('pulp_puppet.plugins.distributors.publish.PUBLISH_BATCH_SIZE', 1)
+    def test_accumulated_over_batches(self):
+        modules = [self._module('legacy', '1.0.0'), self._module('legacy', '2.0.0')]
+        for module in modules:
+            module.file_md5 = None
+
+        run = self._publish(modules)
+
+        report = run.progress_report
+        self.assertEqual(report.metadata_checksum_total_count, 2)
+        self.assertEqual(report.metadata_checksum_finished_count, 2)
+        self.assertEqual(self._dependency_data(), {'jdob/legacy': ['1.0.0', '2.0.0']})
+
+    def test_stored_md5(self):
+        run = self._publish([self._module('valid', '1.0.0')])
+
+        self.assertTrue(run.progress_report.metadata_checksum_total_count is None)
@@ -15,3 +15,13 @@ class BaseDownloaderTests(unittest.TestCase):
         self.assertRaises(NotImplementedError, b.retrieve_modules, None, None)
         self.assertRaises(NotImplementedError, b.cancel)
         self.assertRaises(NotImplementedError, b.cleanup_module, None)
+
+    def test_retrieve_module_batch(self):
+        # The default batch implementation records each failure instead of raising
+
+        b = base.BaseDownloader(None, None, None)
+        succeeded, failed = b.retrieve_module_batch(None, ['a', 'b'])
+
+        self.assertEqual(succeeded, [])
+        self.assertEqual([m for m, e in failed], ['a', 'b'])
+        self.assertTrue(isinstance(failed[0][1], NotImplementedError))
@@ -1,7 +1,11 @@
 import unittest
 
+from pulp.plugins.config import PluginCallConfiguration
+
+from pulp_puppet.common import constants
 from pulp_puppet.plugins.importers.downloaders import factory
 from pulp_puppet.plugins.importers.downloaders.exceptions import  UnsupportedFeedType, InvalidFeed
+from pulp_puppet.plugins.importers.downloaders.forge_v3 import ForgeV3Downloader
 from pulp_puppet.plugins.importers.downloaders.local import LocalDownloader
 
 
@@ -34,3 +38,22 @@ class DownloadersFactoryTests(unittest.TestCase):
 
     def test_is_valid_feed_false(self):
         self.assertFalse(factory.is_valid_feed(None))
+
+    def test_get_downloader_forge_v3(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_FORGE_API: constants.FORGE_API_V3})
+
+        downloader = factory.get_downloader('http://forge.example.com', None, None, config)
+
+        self.assertTrue(isinstance(downloader, ForgeV3Downloader))
+
+    def test_get_downloader_forge_v3_unsupported_feed_type(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_FORGE_API: constants.FORGE_API_V3})
+
+        self.assertRaises(UnsupportedFeedType, factory.get_downloader, 'file://localhost',
+                          None, None, config)
+
+    def test_supports_forge_api(self):
+        self.assertTrue(factory.supports_forge_api('file://localhost', constants.FORGE_API_V1))
+        self.assertTrue(factory.supports_forge_api('https://forge', constants.FORGE_API_V3))
+        self.assertFalse(factory.supports_forge_api('file://localhost', constants.FORGE_API_V3))
+        self.assertFalse(factory.supports_forge_api(None, constants.FORGE_API_V3))
@@ -0,0 +1,204 @@
+import BaseHTTPServer
+import hashlib
+import json
+import os
+import threading
+import unittest
+import urlparse
+
+import mock
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.db.models import ModuleRecord, RepositoryMetadata
+from pulp_puppet.plugins.importers.downloaders import exceptions, forge_v3, web
+from pulp_puppet.plugins.importers.downloaders.forge_v3 import ForgeV3Downloader
+
+import base_downloader
+
+
+MODULE_CONTENT = 'module tarball'
+
+
+class StandInForge(BaseHTTPServer.HTTPServer):
+    """
+    Minimal stand-in for a forge's v3 API, listing a number of releases of a single
+    module in pages.
+    """
+
+    def __init__(self, release_count, report_total=True):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StandInForgeHandler)
+        self.release_count = release_count
+        self.report_total = report_total
+        self.requested_paths = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/' % self.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInForgeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requested_paths.append(self.path)
+        path, _, query = self.path.partition('?')
+        if path == '/v3/releases':
+            params = dict(urlparse.parse_qsl(query))
+            self._respond(json.dumps(self._page(int(params['limit']), int(params['offset']))))
+        elif path.startswith('/v3/files/'):
+            self._respond(MODULE_CONTENT)
+        else:
+            self.send_error(404)
+
+    def _page(self, limit, offset):
+        # The forge caps the page size, which the client must honor
+        limit = min(limit, 2)
+        releases = []
+        for i in range(offset, min(offset + limit, self.server.release_count)):
+            filename = 'jdob-valid-1.%d.0.tar.gz' % i
+            releases.append({
+                'metadata': {'name': 'jdob-valid', 'version': '1.%d.0' % i, 'tags': ['t']},
+                'file_uri': '/v3/files/%s' % filename,
+                'file_md5': hashlib.md5(MODULE_CONTENT).hexdigest(),
+            })
+        next_path = None
+        if offset + limit < self.server.release_count:
+            next_path = '/v3/releases?limit=%d&offset=%d' % (limit, offset + limit)
+        pagination = {'limit': limit, 'offset': offset, 'next': next_path}
+        if self.server.report_total:
+            pagination['total'] = self.server.release_count
+        return {'pagination': pagination, 'results': releases}
+
+    def _respond(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ForgeV3DownloaderTests(base_downloader.BaseDownloaderTests):
+
+    def _downloader(self, forge):
+        self.config.repo_plugin_config[constants.CONFIG_FEED] = forge.url
+        self.config.repo_plugin_config.setdefault(constants.CONFIG_QUERIES, ['jdob-valid'])
+        self.mock_progress_report.metadata_query_times = {}
+        return ForgeV3Downloader(self.repo, None, self.config)
+
+    def _parse(self, documents):
+        metadata = RepositoryMetadata()
+        for document in documents:
+            metadata.update_records_from_json(document)
+        return metadata.modules
+
+    def test_retrieve_metadata(self):
+        with StandInForge(5) as forge:
+            documents = self._downloader(forge).retrieve_metadata(self.mock_progress_report)
+
+        modules = self._parse(documents)
+        self.assertEqual([m.version for m in modules], ['1.%d.0' % i for i in range(5)])
+        self.assertEqual(modules[0].author, 'jdob')
+        self.assertEqual(modules[0].name, 'valid')
+        self.assertEqual(modules[0].tag_list, ['t'])
+        self.assertEqual(modules[0].file_uri, '/v3/files/jdob-valid-1.0.0.tar.gz')
+        self.assertEqual(modules[0].file_md5, hashlib.md5(MODULE_CONTENT).hexdigest())
+
+        # One page up front, then the remaining pages at the offsets the total implies
+        offsets = sorted(int(dict(urlparse.parse_qsl(p.partition('?')[2]))['offset'])
+                         for p in forge.requested_paths)
+        self.assertEqual(offsets, [0, 2, 4])
+        self.assertEqual(self.mock_progress_report.metadata_query_total_count, 3)
+
+    def test_retrieve_metadata_window(self):
+        self.config.repo_plugin_config['max_downloads'] = 2
+        original = web.HttpDownloader._download_metadata
+
+        with mock.patch.object(ForgeV3Downloader, '_download_metadata', autospec=True,
+                               side_effect=original) as mock_download:
+            with StandInForge(9) as forge:
+                downloader = self._downloader(forge)
+                documents = downloader.retrieve_metadata(self.mock_progress_report)
+
+        # The first page, then the remaining four pages no more than two at a time
+        self.assertEqual([len(c[0][2]) for c in mock_download.call_args_list], [1, 2, 2])
+        self.assertEqual(len(self._parse(documents)), 9)
+        self.assertEqual(self.mock_progress_report.metadata_query_total_count, 5)
+
+    def test_retrieve_metadata_no_total(self):
+        with StandInForge(5, report_total=False) as forge:
+            documents = self._downloader(forge).retrieve_metadata(self.mock_progress_report)
+
+        self.assertEqual(len(self._parse(documents)), 5)
+        self.assertEqual(len(forge.requested_paths), 3)
+
+    def test_retrieve_metadata_queries(self):
+        self.config.repo_plugin_config[constants.CONFIG_QUERIES] = ['jdob-valid', 'jdob/other']
+
+        with StandInForge(1) as forge:
+            self._downloader(forge).retrieve_metadata(self.mock_progress_report)
+
+        modules = sorted(dict(urlparse.parse_qsl(p.partition('?')[2]))['module']
+                         for p in forge.requested_paths)
+        self.assertEqual(modules, ['jdob-valid', 'jdob/other'])
+
+    def test_retrieve_metadata_error(self):
+        with StandInForge(1) as forge:
+            downloader = self._downloader(forge)
+            self.config.repo_plugin_config[constants.CONFIG_FEED] = forge.url + 'missing/'
+
+            self.assertRaises(exceptions.FileRetrievalException, downloader.retrieve_metadata,
+                              self.mock_progress_report)
+
+    def test_retrieve_module_batch(self):
+        good = ModuleRecord('jdob', 'valid', '1.0.0', [], '/v3/files/jdob-valid-1.0.0.tar.gz',
+                            hashlib.md5(MODULE_CONTENT).hexdigest())
+        corrupt = ModuleRecord('jdob', 'valid', '1.1.0', [], '/v3/files/jdob-valid-1.1.0.tar.gz',
+                               'not the md5')
+
+        with StandInForge(2) as forge:
+            downloader = self._downloader(forge)
+            succeeded, failed = downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                 [good, corrupt])
+
+        self.assertEqual([m for m, path, digests in succeeded], [good])
+        with open(succeeded[0][1]) as f:
+            self.assertEqual(f.read(), MODULE_CONTENT)
+        self.assertEqual(succeeded[0][2]['md5'], hashlib.md5(MODULE_CONTENT).hexdigest())
+        self.assertEqual([m for m, e in failed], [corrupt])
+        self.assertTrue(isinstance(failed[0][1], exceptions.ChecksumMismatchException))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.working_dir, web.DOWNLOAD_TMP_DIR, corrupt.puppet_standard_filename())))
+
+    def test_create_module_url(self):
+        self.config.repo_plugin_config[constants.CONFIG_FEED] = 'https://forge.example.com'
+        downloader = ForgeV3Downloader(self.repo, None, self.config)
+        module = ModuleRecord('jdob', 'valid', '1.0.0', [], '/v3/files/jdob-valid-1.0.0.tar.gz')
+
+        self.assertEqual(downloader._create_module_url(module),
+                         'https://forge.example.com/v3/files/jdob-valid-1.0.0.tar.gz')
+
+
+class PageToDocumentTests(unittest.TestCase):
+
+    def test_page_to_document(self):
+        page = {'results': [{'metadata': {'name': 'jdob/valid', 'version': '1.0.0'},
+                             'file_uri': '/pulp/puppet/repo/jdob-valid-1.0.0.tar.gz',
+                             'file_md5': 'abc'}]}
+
+        document = json.loads(forge_v3._page_to_document(page))
+
+        self.assertEqual(document, [{'author': 'jdob', 'name': 'valid', 'version': '1.0.0',
+                                     'tag_list': [],
+                                     'file_uri': '/pulp/puppet/repo/jdob-valid-1.0.0.tar.gz',
+                                     'file_md5': 'abc'}])
@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 import mock
@@ -57,6 +58,40 @@ class HttpDownloaderTests(base_downloader.BaseDownloaderTests):
         except exceptions.FileRetrievalException:
             pass
 
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_metadata_conditional(self, mock_downloader_download):
+        url = self.downloader._create_metadata_download_urls()[0]
+        validators = {url: {'etag': '"abc"', 'last_modified': 'Mon, 01 Jun 2015 00:00:00 GMT'}}
+
+        self.downloader.retrieve_metadata(self.mock_progress_report, validators=validators)
+
+        request = mock_downloader_download.call_args[0][0][0]
+        self.assertEqual(request.headers, {'If-None-Match': '"abc"',
+                                           'If-Modified-Since': 'Mon, 01 Jun 2015 00:00:00 GMT'})
+
+    @mock.patch('pulp_puppet.plugins.importers.downloaders.web.HTTPMetadataDownloadEventListener')
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_metadata_not_modified(self, mock_downloader_download,
+                                            mock_listener_constructor):
+        # Setup
+        url = self.downloader._create_metadata_download_urls()[0]
+        mock_listener = mock.MagicMock()
+        report = DownloadReport(url, None)
+        report.error_report = {'response_code': 304}
+        mock_listener.failed_reports = [report]
+        mock_listener_constructor.return_value = mock_listener
+
+        # Test
+        self.assertRaises(exceptions.MetadataNotModified, self.downloader.retrieve_metadata,
+                          self.mock_progress_report, {url: {'etag': '"abc"'}})
+
+    def test_validators(self):
+        report = DownloadReport('http://host/modules.json', None)
+        report.headers = {'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jun 2015 00:00:00 GMT'}
+
+        self.assertEqual(web._validators(report),
+                         {'etag': '"abc"', 'last_modified': 'Mon, 01 Jun 2015 00:00:00 GMT'})
+
     @mock.patch.object(HttpDownloader, 'retrieve_modules')
     def test_retrieve_module(self, mock_retrieve_modules):
         mock_retrieve_modules.return_value = ['foo', 'bar']
@@ -88,11 +123,135 @@ class HttpDownloaderTests(base_downloader.BaseDownloaderTests):
             expected_filename = web._create_download_tmp_dir(self.working_dir)
             expected_filename = os.path.join(expected_filename, self.module.filename())
 
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_module_batch(self, mock_downloader_download):
+        # Setup
+        good = mock.Mock(author='good')
+        good.puppet_standard_filename.return_value = 'good-module-1.0.0.tar.gz'
+        bad = mock.Mock(author='bad')
+        bad.puppet_standard_filename.return_value = 'bad-module-1.0.0.tar.gz'
+        mock_downloader_download.side_effect = _downloads(self.downloader, failed=[bad])
+
+        # Test
+        succeeded, failed = self.downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                  [good, bad])
+
+        # Verify
+        self.assertEqual(mock_downloader_download.call_count, 1)
+        requests = mock_downloader_download.call_args[0][0]
+        self.assertEqual([r.data for r in requests], [good, bad])
+
+        expected_dir = web._create_download_tmp_dir(self.working_dir)
+        self.assertEqual(succeeded,
+                         [(good, os.path.join(expected_dir, 'good-module-1.0.0.tar.gz'),
+                           {'sha256': hashlib.sha256('module').hexdigest(),
+                            'md5': hashlib.md5('module').hexdigest()})])
+        # Every download is closed, including those that failed
+        self.assertTrue(all(r.destination.closed for r in requests))
+        self.assertEqual(len(failed), 1)
+        self.assertTrue(failed[0][0] is bad)
+        self.assertTrue(isinstance(failed[0][1], exceptions.FileRetrievalException))
+
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_module_batch_cached(self, mock_downloader_download):
+        # Setup
+        mock_downloader_download.side_effect = _downloads(self.downloader)
+        cached = mock.Mock(author='cached', file_md5=hashlib.md5('module').hexdigest())
+        cached.puppet_standard_filename.return_value = 'cached-module-1.0.0.tar.gz'
+        new = mock.Mock(author='new', file_md5=None)
+        new.puppet_standard_filename.return_value = 'new-module-1.0.0.tar.gz'
+
+        cache_dir = web._create_download_tmp_dir(self.working_dir)
+        cached_path = os.path.join(cache_dir, 'cached-module-1.0.0.tar.gz')
+        with open(cached_path, 'w') as f:
+            f.write('module')
+
+        # Test
+        succeeded, failed = self.downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                  [cached, new])
+
+        # Verify
+        requests = mock_downloader_download.call_args[0][0]
+        self.assertEqual([r.data for r in requests], [new])
+        digests = {'sha256': hashlib.sha256('module').hexdigest(),
+                   'md5': hashlib.md5('module').hexdigest()}
+        self.assertEqual(succeeded,
+                         [(cached, cached_path, digests),
+                          (new, os.path.join(cache_dir, 'new-module-1.0.0.tar.gz'), digests)])
+        self.assertEqual(failed, [])
+
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_module_batch_cached_no_checksum(self, mock_downloader_download):
+        mock_downloader_download.side_effect = _downloads(self.downloader)
+        self.module.file_md5 = None
+        self.module.puppet_standard_filename.return_value = 'puppet-filename.tar.gz'
+
+        self.downloader.retrieve_module_batch(self.mock_progress_report, [self.module])
+        cache_dir = web._create_download_tmp_dir(self.working_dir)
+        with open(os.path.join(cache_dir, 'puppet-filename.tar.gz'), 'w') as f:
+            f.write('truncat')
+        succeeded, failed = self.downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                  [self.module])
+
+        # The feed lists no checksum, so the cached copy is verified against the digest
+        # of its download and downloaded again
+        self.assertEqual(mock_downloader_download.call_count, 2)
+        with open(succeeded[0][1]) as f:
+            self.assertEqual(f.read(), 'module')
+
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_module_batch_cached_corrupt(self, mock_downloader_download):
+        mock_downloader_download.side_effect = _downloads(self.downloader)
+        self.module.file_md5 = hashlib.md5('module').hexdigest()
+        self.module.puppet_standard_filename.return_value = 'puppet-filename.tar.gz'
+        cache_dir = web._create_download_tmp_dir(self.working_dir)
+        with open(os.path.join(cache_dir, 'puppet-filename.tar.gz'), 'w') as f:
+            f.write('truncat')
+
+        succeeded, failed = self.downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                  [self.module])
+
+        # The cached copy does not match the checksum so it is downloaded again
+        self.assertEqual(mock_downloader_download.call_count, 1)
+        with open(succeeded[0][1]) as f:
+            self.assertEqual(f.read(), 'module')
+
+    @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
+    def test_retrieve_module_batch_canceled(self, mock_downloader_download):
+        done = mock.Mock(author='done', file_md5=None)
+        done.puppet_standard_filename.return_value = 'done-module-1.0.0.tar.gz'
+        canceled = mock.Mock(author='canceled', file_md5=None)
+        canceled.puppet_standard_filename.return_value = 'canceled-module-1.0.0.tar.gz'
+        mock_downloader_download.side_effect = _downloads(self.downloader,
+                                                          canceled=[canceled])
+
+        succeeded, failed = self.downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                  [done, canceled])
+
+        # A request the cancel kept from finishing is neither succeeded nor failed, and
+        # its partial file is not taken into the cache
+        self.assertEqual([s[0] for s in succeeded], [done])
+        self.assertEqual(failed, [])
+        cache_dir = web._create_download_tmp_dir(self.working_dir)
+        self.assertFalse(os.path.exists(os.path.join(cache_dir,
+                                                     'canceled-module-1.0.0.tar.gz')))
+
+        # The next sync downloads it again
+        mock_downloader_download.side_effect = _downloads(self.downloader)
+        succeeded, failed = self.downloader.retrieve_module_batch(self.mock_progress_report,
+                                                                  [done, canceled])
+        requests = mock_downloader_download.call_args[0][0]
+        self.assertEqual([r.data for r in requests], [canceled])
+        with open(succeeded[1][1]) as f:
+            self.assertEqual(f.read(), 'module')
+
     @mock.patch('nectar.downloaders.threaded.HTTPThreadedDownloader.download')
     def test_cleanup_module(self, mock_downloader_download):
+        mock_downloader_download.side_effect = _downloads(self.downloader)
         self.module.author = 'asdf'
         self.module.puppet_standard_filename.return_value = 'puppet-filename.tar.gz'
         stored_filename = self.downloader.retrieve_module(self.mock_progress_report, self.module)
+        self.assertTrue(os.path.exists(stored_filename))
         self.downloader.cleanup_module(self.module)
         self.assertTrue(not os.path.exists(stored_filename))
 
@@ -143,3 +302,50 @@ class HttpDownloaderTests(base_downloader.BaseDownloaderTests):
         self.assertTrue(os.path.exists(created))
         self.assertEqual(created, os.path.join(self.working_dir, web.DOWNLOAD_TMP_DIR))
 
+
+
+class HTTPMetadataDownloadEventListenerTests(base_downloader.BaseDownloaderTests):
+
+    @mock.patch('pulp_puppet.plugins.importers.downloaders.web.time.time')
+    def test_query_times(self, mock_time):
+        self.mock_progress_report.metadata_query_finished_count = 0
+        self.mock_progress_report.metadata_query_times = {}
+        listener = web.HTTPMetadataDownloadEventListener(self.mock_progress_report)
+        succeeded = DownloadReport('http://host/modules.json?q=a', None)
+        failed = DownloadReport('http://host/modules.json?q=b', None)
+
+        mock_time.side_effect = [10.0, 11.0, 12.5, 15.0]
+        listener.download_started(succeeded)
+        listener.download_started(failed)
+        listener.download_succeeded(succeeded)
+        listener.download_failed(failed)
+
+        self.assertEqual(self.mock_progress_report.metadata_query_times,
+                         {succeeded.url: 2.5, failed.url: 4.0})
+        self.assertEqual(self.mock_progress_report.metadata_query_finished_count, 1)
+        self.assertEqual(listener.succeeded_reports, [succeeded])
+        self.assertEqual(listener.failed_reports, [failed])
+
+
+def _downloads(http_downloader, failed=(), canceled=()):
+    """
+    Stands in for nectar downloading each of the requested files and reporting the
+    outcome to the listener of the downloader in use.
+
+    :param failed: modules whose downloads are reported as failed
+    :param canceled: modules whose downloads are cut short by a cancel; they are
+                     partially written and reported neither way
+    """
+    def download(request_list):
+        listener = http_downloader.downloader.event_listener
+        for request in request_list:
+            report = DownloadReport.from_download_request(request)
+            if any(request.data is module for module in canceled):
+                request.destination.write('mod')
+            elif any(request.data is module for module in failed):
+                report.error_msg = 'oops'
+                listener.download_failed(report)
+            else:
+                request.destination.write('module')
+                listener.download_succeeded(report)
+    return download
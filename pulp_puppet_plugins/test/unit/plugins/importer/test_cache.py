@@ -0,0 +1,140 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.importers import cache
+from pulp_puppet.plugins.importers.cache import DownloadCache
+
+
+class DownloadCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='download-cache-tests')
+        self.cache = DownloadCache(os.path.join(self.working_dir, 'downloads'), 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def _write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_init_creates_directory(self):
+        self.assertTrue(os.path.isdir(self.cache.path))
+
+        # An existing directory is reused
+        DownloadCache(self.cache.path, 100)
+
+    def _complete(self, filename, content):
+        self._write(self.cache.partial_path_for(filename), content)
+        return self.cache.complete(filename, {'sha256': hashlib.sha256(content).hexdigest()})
+
+    def test_complete(self):
+        path = self._complete('a.tar.gz', 'module')
+
+        self.assertEqual(path, os.path.join(self.cache.path, 'a.tar.gz'))
+        self.assertEqual(self.cache.get('a.tar.gz')[0], path)
+        self.assertFalse(os.path.exists(self.cache.partial_path_for('a.tar.gz')))
+        with open(self.cache.digest_path_for('a.tar.gz')) as f:
+            self.assertEqual(f.read(), hashlib.sha256('module').hexdigest())
+
+    def test_get_recorded_digest_mismatch(self):
+        path = self._complete('a.tar.gz', 'module')
+        self._write(path, 'modul')
+
+        # Without a checksum the file is verified against the digest of its download
+        self.assertEqual(self.cache.get('a.tar.gz'), (None, None))
+        self.assertEqual(os.listdir(self.cache.path), [])
+
+    def test_get_unrecorded(self):
+        self._write(self.cache.path_for('a.tar.gz'), 'module')
+
+        # A file that cannot be verified is not served
+        self.assertEqual(self.cache.get('a.tar.gz'), (None, None))
+        self.assertFalse(os.path.exists(self.cache.path_for('a.tar.gz')))
+
+    def test_get_partial(self):
+        self._write(self.cache.partial_path_for('a.tar.gz'), 'mod')
+
+        self.assertEqual(self.cache.get('a.tar.gz'), (None, None))
+
+    def test_get_checksum(self):
+        self._write(self.cache.path_for('a.tar.gz'), 'module')
+        sha256 = hashlib.sha256('module').hexdigest()
+        md5 = hashlib.md5('module').hexdigest()
+
+        path, digests = self.cache.get('a.tar.gz', sha256)
+        self.assertEqual(path, self.cache.path_for('a.tar.gz'))
+        self.assertEqual(digests, {'sha256': sha256, 'md5': md5})
+        self.assertEqual(self.cache.get('a.tar.gz', md5, 'md5')[0], self.cache.path_for('a.tar.gz'))
+
+    def test_get_checksum_mismatch(self):
+        self._write(self.cache.path_for('a.tar.gz'), 'modul')
+
+        self.assertEqual(self.cache.get('a.tar.gz', hashlib.sha256('module').hexdigest()),
+                         (None, None))
+        self.assertFalse(os.path.exists(self.cache.path_for('a.tar.gz')))
+
+    def test_open_partial(self):
+        partial = self.cache.open_partial('a.tar.gz')
+        partial.write('mod')
+        partial.write('ule')
+        partial.close()
+
+        self.assertTrue(partial.closed)
+        self.assertEqual(partial.digests(), {'sha256': hashlib.sha256('module').hexdigest(),
+                                             'md5': hashlib.md5('module').hexdigest()})
+        with open(self.cache.partial_path_for('a.tar.gz')) as f:
+            self.assertEqual(f.read(), 'module')
+
+    def test_remove(self):
+        self._complete('a.tar.gz', 'module')
+        self._write(self.cache.partial_path_for('a.tar.gz'), 'mod')
+
+        self.cache.remove('a.tar.gz')
+        self.cache.remove('missing.tar.gz')
+
+        self.assertEqual(os.listdir(self.cache.path), [])
+
+    def test_prune(self):
+        for name, mtime in (('old.tar.gz', 1000), ('newer.tar.gz', 2000),
+                            ('newest.tar.gz', 3000)):
+            self._complete(name, 'x' * 40)
+            os.utime(self.cache.path_for(name), (mtime, mtime))
+        self._write(self.cache.partial_path_for('partial.tar.gz'), 'x')
+        self._write(self.cache.digest_path_for('orphan.tar.gz'), 'abc')
+
+        self.cache.prune()
+
+        # Recorded digests are not counted and go along with their file
+        self.assertEqual(sorted(os.listdir(self.cache.path)),
+                         ['newer.tar.gz', 'newer.tar.gz.sha256',
+                          'newest.tar.gz', 'newest.tar.gz.sha256'])
+
+
+class FileDigestsTests(unittest.TestCase):
+
+    def test_file_digests(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write('module')
+            f.flush()
+
+            digests = cache.file_digests(f.name, ['sha1', 'md5'])
+
+        self.assertEqual(digests, {'sha1': hashlib.sha1('module').hexdigest(),
+                                   'md5': hashlib.md5('module').hexdigest()})
+
+
+class MaxCacheSizeTests(unittest.TestCase):
+
+    def test_default(self):
+        self.assertEqual(cache.max_cache_size({}),
+                         constants.DEFAULT_DOWNLOAD_CACHE_SIZE * 1024 * 1024)
+
+    def test_configured(self):
+        config = {constants.CONFIG_DOWNLOAD_CACHE_SIZE: '2'}
+
+        self.assertEqual(cache.max_cache_size(config), 2 * 1024 * 1024)
@@ -103,6 +103,107 @@ class RemoveMissingTests(unittest.TestCase):
         self.assertTrue(constants.CONFIG_REMOVE_MISSING in msg)
 
 
+class DownloadBatchSizeTests(unittest.TestCase):
+
+    def test_validate_download_batch_size(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_DOWNLOAD_BATCH_SIZE: '25'}, {})
+        result, msg = configuration._validate_download_batch_size(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_download_batch_size_missing(self):
+        # Test
+        config = PluginCallConfiguration({}, {})
+        result, msg = configuration._validate_download_batch_size(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_download_batch_size_invalid(self):
+        for value in ('foo', 0, -3, '1.5'):
+            # Test
+            config = PluginCallConfiguration({constants.CONFIG_DOWNLOAD_BATCH_SIZE: value}, {})
+            result, msg = configuration._validate_download_batch_size(config)
+
+            # Verify
+            self.assertTrue(not result)
+            self.assertTrue(constants.CONFIG_DOWNLOAD_BATCH_SIZE in msg)
+
+
+class DownloadCacheSizeTests(unittest.TestCase):
+
+    def test_validate_download_cache_size(self):
+        config = PluginCallConfiguration({constants.CONFIG_DOWNLOAD_CACHE_SIZE: '512'}, {})
+        result, msg = configuration._validate_download_cache_size(config)
+
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_download_cache_size_invalid(self):
+        config = PluginCallConfiguration({constants.CONFIG_DOWNLOAD_CACHE_SIZE: 'lots'}, {})
+        result, msg = configuration._validate_download_cache_size(config)
+
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_DOWNLOAD_CACHE_SIZE in msg)
+
+
+class ExtractProcessesTests(unittest.TestCase):
+
+    def test_validate_extract_processes(self):
+        config = PluginCallConfiguration({constants.CONFIG_EXTRACT_PROCESSES: '4'}, {})
+        result, msg = configuration._validate_extract_processes(config)
+
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_extract_processes_invalid(self):
+        config = PluginCallConfiguration({constants.CONFIG_EXTRACT_PROCESSES: 0}, {})
+        result, msg = configuration._validate_extract_processes(config)
+
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_EXTRACT_PROCESSES in msg)
+
+
+class ImportModeTests(unittest.TestCase):
+
+    def test_validate_import_mode(self):
+        for value in constants.IMPORT_MODES:
+            config = PluginCallConfiguration({constants.CONFIG_IMPORT_MODE: value}, {})
+            result, msg = configuration._validate_import_mode(config)
+
+            self.assertTrue(result)
+            self.assertTrue(msg is None)
+
+    def test_validate_import_mode_invalid(self):
+        config = PluginCallConfiguration({constants.CONFIG_IMPORT_MODE: 'symlink'}, {})
+        result, msg = configuration._validate_import_mode(config)
+
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_IMPORT_MODE in msg)
+
+
+class FeedTypeTests(unittest.TestCase):
+
+    def test_validate_feed_type(self):
+        for value in constants.FEED_TYPES:
+            config = PluginCallConfiguration({constants.CONFIG_FEED_TYPE: value}, {})
+            result, msg = configuration._validate_feed_type(config)
+
+            self.assertTrue(result)
+            self.assertTrue(msg is None)
+
+    def test_validate_feed_type_invalid(self):
+        config = PluginCallConfiguration({constants.CONFIG_FEED_TYPE: 'git'}, {})
+        result, msg = configuration._validate_feed_type(config)
+
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_FEED_TYPE in msg)
+
+
 class TestValidate(unittest.TestCase):
     """
     Tests for the validate() function.
@@ -174,3 +275,58 @@ class TestValidate(unittest.TestCase):
         all_mock_calls[0].assert_called_once_with(c)
         all_mock_calls[1].assert_called_once_with(c)
         self.assertEqual(0, all_mock_calls[2].call_count)
+
+
+class ForgeApiTests(unittest.TestCase):
+
+    def test_validate_forge_api(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_FEED: 'https://forge.example.com',
+                                          constants.CONFIG_FORGE_API: constants.FORGE_API_V3,
+                                          constants.CONFIG_QUERIES: ['puppetlabs-stdlib']},
+                                         {})
+        result, msg = configuration._validate_forge_api(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_forge_api_v3_no_queries(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_FEED: 'https://forge.example.com',
+                                          constants.CONFIG_FORGE_API: constants.FORGE_API_V3},
+                                         {})
+        result, msg = configuration._validate_forge_api(config)
+
+        # Verify
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_QUERIES in msg)
+
+    def test_validate_forge_api_missing(self):
+        # Test
+        config = PluginCallConfiguration({}, {})
+        result, msg = configuration._validate_forge_api(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_forge_api_invalid(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_FORGE_API: 'v2'}, {})
+        result, msg = configuration._validate_forge_api(config)
+
+        # Verify
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_FORGE_API in msg)
+
+    def test_validate_forge_api_unsupported_feed(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_FEED: 'file:///var/modules',
+                                          constants.CONFIG_FORGE_API: constants.FORGE_API_V3},
+                                         {})
+        result, msg = configuration._validate_forge_api(config)
+
+        # Verify
+        self.assertTrue(not result)
+        self.assertTrue('file:///var/modules' in msg)
@@ -1,5 +1,7 @@
 import os
+import shutil
 
+from tempfile import mkdtemp
 from uuid import uuid4
 from unittest import TestCase
 from collections import namedtuple
@@ -8,8 +10,10 @@ from urlparse import urljoin
 from mock import patch, Mock, ANY
 
 from pulp_puppet.common import constants
+from pulp_puppet.plugins.importers import directory
 from pulp_puppet.plugins.importers.directory import SynchronizeWithDirectory, DownloadListener
 from pulp_puppet.common.sync_progress import SyncProgressReport
+from pulp_puppet.plugins.importers.state import metadata_digest
 
 
 class TestSynchronizeWithDirectory(TestCase):
@@ -59,19 +63,18 @@ class TestSynchronizeWithDirectory(TestCase):
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._remove_missing')
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._import_modules')
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._fetch_modules')
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._skip_known_modules')
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._fetch_manifest')
-    @patch('shutil.rmtree')
-    @patch('pulp_puppet.plugins.importers.directory.mkdtemp')
-    def test_call(self, mock_mkdtemp, mock_rmtree, mock_fetch_manifest, mock_fetch_modules,
+    @patch('pulp_puppet.plugins.importers.directory.DownloadCache')
+    def test_call(self, mock_cache, mock_fetch_manifest, mock_skip_known, mock_fetch_modules,
                   mock_import_modules, mock_remove_missing):
         mock_fetch_manifest.return_value = 'manifest_destiny'
+        mock_skip_known.return_value = 'new_manifest', 2
         mock_fetch_modules.return_value = 'some modules'
         mock_repo = Mock()
         conduit = Mock()
         config = {constants.CONFIG_FEED: 'http://host/root/PULP_MANAFEST'}
-        repository = Mock()
-        repository.working_dir = 'working'
-        mock_mkdtemp.return_value = '/abc'
+        mock_repo.working_dir = 'working'
 
         # testing
         method = SynchronizeWithDirectory(mock_repo, conduit, config)
@@ -79,28 +82,28 @@ class TestSynchronizeWithDirectory(TestCase):
 
         # validation
         self.assertEqual(1, mock_fetch_manifest.call_count)
-        mock_fetch_modules.assert_called_once_with('manifest_destiny')
+        mock_skip_known.assert_called_once_with('manifest_destiny')
+        mock_fetch_modules.assert_called_once_with('new_manifest', 2)
         mock_import_modules.assert_called_once_with('some modules')
         self.assertEqual(0, mock_remove_missing.call_count)
         self.assertFalse(method.canceled)
         self.assertTrue(isinstance(method.report, SyncProgressReport))
         self.assertTrue(isinstance(report, SyncProgressReport))
-        mock_mkdtemp.assert_called_with(dir=mock_repo.working_dir)
-        mock_rmtree.assert_called_with(os.path.join(repository.working_dir, mock_mkdtemp()))
+        mock_cache.assert_called_once_with(os.path.join('working', 'directory-downloads'),
+                                           constants.DEFAULT_DOWNLOAD_CACHE_SIZE * 1024 * 1024)
+        mock_cache.return_value.prune.assert_called_once_with()
+        self.assertEqual(method.cache, mock_cache.return_value)
 
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._import_modules')
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._fetch_modules')
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._fetch_manifest')
-    @patch('shutil.rmtree')
-    @patch('pulp_puppet.plugins.importers.directory.mkdtemp')
-    def test_call_no_manifest(self, mock_mkdtemp, mock_rmtree, mock_fetch_manifest, *mocks):
+    @patch('pulp_puppet.plugins.importers.directory.DownloadCache')
+    def test_call_no_manifest(self, mock_cache, mock_fetch_manifest, *mocks):
         mock_fetch_manifest.return_value = None
         mock_repo = Mock()
         conduit = Mock()
         config = {constants.CONFIG_FEED: 'http://host/root/PULP_MANAFEST'}
-        repository = Mock()
-        repository.working_dir = 'working'
-        mock_mkdtemp.return_value = '/abc'
+        mock_repo.working_dir = 'working'
 
         # testing
         method = SynchronizeWithDirectory(mock_repo, conduit, config)
@@ -113,8 +116,10 @@ class TestSynchronizeWithDirectory(TestCase):
         self.assertFalse(method.canceled)
         self.assertTrue(isinstance(method.report, SyncProgressReport))
         self.assertTrue(isinstance(report, SyncProgressReport))
-        mock_mkdtemp.assert_called_with(dir=mock_repo.working_dir)
-        mock_rmtree.assert_called_with(os.path.join(repository.working_dir, mock_mkdtemp()))
+        mock_cache.assert_called_once_with(os.path.join('working', 'directory-downloads'),
+                                           constants.DEFAULT_DOWNLOAD_CACHE_SIZE * 1024 * 1024)
+        mock_cache.return_value.prune.assert_called_once_with()
+        self.assertEqual(method.cache, mock_cache.return_value)
 
     @patch('pulp_puppet.plugins.importers.directory.URL_TO_DOWNLOADER')
     @patch('pulp_puppet.plugins.importers.directory.importer_config_to_nectar_config')
@@ -173,6 +178,8 @@ class TestSynchronizeWithDirectory(TestCase):
         self.assertTrue(isinstance(failed_reports, list))
 
 
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._previous_sync',
+           Mock(return_value={}))
     @patch('pulp_puppet.plugins.importers.directory.StringIO.getvalue')
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
     def test_fetch_manifest(self, mock_download, mock_get_value):
@@ -194,7 +201,8 @@ class TestSynchronizeWithDirectory(TestCase):
 
         # validation
 
-        mock_download.assert_called_with([(urljoin(feed_url, constants.MANIFEST_FILENAME), ANY)])
+        mock_download.assert_called_with([(urljoin(feed_url, constants.MANIFEST_FILENAME), ANY)],
+                                         headers=None)
 
         self.assertEqual(manifest, [('A', 'B', 'C'), ('D', 'E', 'F')])
 
@@ -205,6 +213,8 @@ class TestSynchronizeWithDirectory(TestCase):
         self.assertEqual(method.report.metadata_current_query, None)
         self.assertTrue(method.report.metadata_execution_time > 0)
 
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._previous_sync',
+           Mock(return_value={}))
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
     def test_fetch_manifest_failed(self, mock_download):
         feed_url = 'http://host/root/'
@@ -225,7 +235,8 @@ class TestSynchronizeWithDirectory(TestCase):
 
         # validation
 
-        mock_download.assert_called_with([(urljoin(feed_url, constants.MANIFEST_FILENAME), ANY)])
+        mock_download.assert_called_with([(urljoin(feed_url, constants.MANIFEST_FILENAME), ANY)],
+                                         headers=None)
 
         self.assertTrue(manifest is None)
 
@@ -234,6 +245,115 @@ class TestSynchronizeWithDirectory(TestCase):
         self.assertEqual(method.report.metadata_error_message, failed_report.error_msg)
         self.assertTrue(method.report.metadata_execution_time > 0)
 
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._previous_sync')
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
+    def test_fetch_manifest_not_modified(self, mock_download, mock_previous_sync):
+        feed_url = 'http://host/root/'
+
+        mock_repo = Mock()
+        conduit = Mock()
+        config = {constants.CONFIG_FEED: feed_url}
+        failed_report = Mock()
+        failed_report.error_report = {'response_code': 304}
+
+        mock_download.return_value = [], [failed_report]
+        mock_previous_sync.return_value = {'validators': {'etag': '"abc"'}}
+
+        # test
+
+        method = SynchronizeWithDirectory(mock_repo, conduit, config)
+        method.report = Mock()
+        manifest = method._fetch_manifest()
+
+        # validation
+
+        mock_download.assert_called_with([(urljoin(feed_url, constants.MANIFEST_FILENAME), ANY)],
+                                         headers={'If-None-Match': '"abc"'})
+
+        self.assertTrue(manifest is None)
+
+        self.assertEqual(method.report.metadata_state, constants.STATE_SUCCESS)
+        self.assertEqual(method.report.modules_state, constants.STATE_SUCCESS)
+        self.assertEqual(method.report.modules_total_count, 0)
+        self.assertEqual(method.report.modules_error_count, 0)
+
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._previous_sync')
+    @patch('pulp_puppet.plugins.importers.directory.StringIO.getvalue')
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
+    def test_fetch_manifest_unchanged(self, mock_download, mock_get_value, mock_previous_sync):
+        mock_repo = Mock()
+        conduit = Mock()
+        config = {constants.CONFIG_FEED: 'http://host/root/'}
+        succeeded_report = Mock()
+        succeeded_report.headers = {}
+
+        mock_download.return_value = [succeeded_report], []
+        mock_get_value.return_value = 'A,B,C\nD,E,F\n'
+        mock_previous_sync.return_value = {'digest': metadata_digest(['A,B,C\nD,E,F\n'])}
+
+        # test
+
+        method = SynchronizeWithDirectory(mock_repo, conduit, config)
+        method.report = Mock()
+        manifest = method._fetch_manifest()
+
+        # validation
+
+        self.assertTrue(manifest is None)
+        self.assertEqual(method.report.metadata_state, constants.STATE_SUCCESS)
+        self.assertEqual(method.report.modules_state, constants.STATE_SUCCESS)
+        self.assertEqual(method.report.modules_total_count, 0)
+
+    @patch('pulp_puppet.plugins.importers.directory.associate_modules')
+    @patch('pulp_puppet.plugins.importers.directory.ExistingModuleIndex')
+    def test_skip_known_modules(self, mock_index, mock_associate):
+        in_repo_key = ('jdob', 'valid', '1.0.0')
+        elsewhere_key = ('jdob', 'valid', '1.1.0')
+        index = mock_index.return_value
+        index.find_file_in_repo.side_effect = \
+            lambda checksum, unit_key: in_repo_key if checksum == 'AA' else None
+        index.find_outside_repo_by_checksum.return_value = {'BB': (elsewhere_key, 'elsewhere')}
+        manifest = [('jdob-valid-1.0.0.tar.gz', 'AA', 10),
+                    ('jdob-valid-1.1.0.tar.gz', 'BB', 20),
+                    ('jdob-valid-1.2.0.tar.gz', 'CC', 30)]
+
+        # test
+
+        method = SynchronizeWithDirectory(Mock(), Mock(), {})
+        method.cache = Mock()
+        remaining, associated_count = method._skip_known_modules(manifest)
+
+        # validation
+
+        self.assertEqual(remaining, [manifest[2]])
+        self.assertEqual(associated_count, 1)
+        self.assertEqual(method.known_unit_keys, [in_repo_key, elsewhere_key])
+        self.assertEqual(method.module_index, index)
+        index.find_file_in_repo.assert_any_call('AA', in_repo_key)
+        index.find_outside_repo_by_checksum.assert_called_once_with(['BB', 'CC'])
+        mock_associate.assert_called_once_with(method.repo.repo_obj, ['elsewhere'])
+        method.cache.remove.assert_any_call('jdob-valid-1.0.0.tar.gz')
+        method.cache.remove.assert_any_call('jdob-valid-1.1.0.tar.gz')
+        self.assertEqual(method.cache.remove.call_count, 2)
+
+    def test_unit_key_from_filename(self):
+        self.assertEqual(directory._unit_key_from_filename('a/jdob-valid-1.0.0-rc1.tar.gz'),
+                         ('jdob', 'valid', '1.0.0-rc1'))
+        self.assertTrue(directory._unit_key_from_filename('jdob-valid.tar.gz') is None)
+        self.assertTrue(directory._unit_key_from_filename('jdob-valid-1.0.0.zip') is None)
+
+    def _mock_cache(self, tmp_dir, cached=None):
+        cached = cached or {}
+        cache = Mock()
+        cache.get.side_effect = \
+            lambda path, checksum: (cached[path], {'sha256': checksum}) if path in cached \
+            else (None, None)
+        cache.partials = {}
+        cache.open_partial.side_effect = lambda path: cache.partials.setdefault(
+            path, Mock(path=os.path.join(tmp_dir, path + '.part')))
+        cache.complete.side_effect = lambda path: os.path.join(tmp_dir, path)
+        return cache
+
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
     def test_fetch_modules(self, mock_download):
         tmp_dir = '/tmp/puppet-testing'
@@ -246,35 +366,115 @@ class TestSynchronizeWithDirectory(TestCase):
         manifest = [('path1', 'AA', 10), ('path2', 'BB', 20)]
 
         report_1 = Mock()
-        report_1.destination = os.path.join(tmp_dir, manifest[0][0])
+        report_1.url = urljoin(feed_url, manifest[0][0])
         report_2 = Mock()
-        report_2.destination = os.path.join(tmp_dir, manifest[1][0])
-        mock_download.return_value = [report_1, report_2], []
+        report_2.url = urljoin(feed_url, manifest[1][0])
+        mock_download.return_value = [report_2, report_1], []
 
         # test
 
         method = SynchronizeWithDirectory(mock_repo, conduit, config)
         method.report = Mock()
-        method.tmp_dir = '/tmp/puppet-testing'
+        method.cache = self._mock_cache(tmp_dir)
         module_paths = method._fetch_modules(manifest)
 
         # validation
 
-        url_1 = os.path.join(feed_url, manifest[0][0])
-        url_2 = os.path.join(feed_url, manifest[1][0])
+        partials = method.cache.partials
+        mock_download.assert_called_once_with(
+            [(report_1.url, partials['path1']), (report_2.url, partials['path2'])])
+        self.assertTrue(partials['path1'].close.called)
+        self.assertTrue(partials['path2'].close.called)
 
-        mock_download.assert_any_with([(url_1, report_1.destination)])
-        mock_download.assert_any_with([(url_2, report_2.destination)])
-
-        self.assertEqual(len(module_paths), 2)
-        self.assertEqual(module_paths[0], report_1.destination)
-        self.assertEqual(module_paths[1], report_2.destination)
+        self.assertEqual(module_paths, [os.path.join(tmp_dir, 'path1'),
+                                        os.path.join(tmp_dir, 'path2')])
+        self.assertEqual(method.module_digests[os.path.join(tmp_dir, 'path1')],
+                         report_1.destination.digests.return_value)
+        method.cache.get.assert_any_call('path1', 'AA')
+        method.cache.get.assert_any_call('path2', 'BB')
 
         # Assert the progress report was updated and the report is still in the running state.
         # The _import_modules method must be called to complete the task.
         self.assertTrue(method.report.update_progress.called)
         self.assertEqual(method.report.modules_state, constants.STATE_RUNNING)
 
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
+    def test_fetch_modules_cached(self, mock_download):
+        tmp_dir = '/tmp/puppet-testing'
+        feed_url = 'http://host/root/'
+
+        mock_repo = Mock()
+        conduit = Mock()
+        config = {constants.CONFIG_FEED: feed_url}
+
+        manifest = [('path1', 'AA', 10), ('path2', 'BB', 20)]
+
+        report_2 = Mock()
+        report_2.url = urljoin(feed_url, manifest[1][0])
+        mock_download.return_value = [report_2], []
+
+        # test
+
+        method = SynchronizeWithDirectory(mock_repo, conduit, config)
+        method.report = Mock()
+        method.cache = self._mock_cache(tmp_dir, {'path1': '/cached/path1'})
+        module_paths = method._fetch_modules(manifest)
+
+        # validation
+
+        mock_download.assert_called_once_with([(report_2.url, method.cache.partials['path2'])])
+        self.assertEqual(module_paths, ['/cached/path1', os.path.join(tmp_dir, 'path2')])
+        self.assertEqual(method.module_digests['/cached/path1'], {'sha256': 'AA'})
+
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
+    def test_fetch_modules_all_cached(self, mock_download):
+        mock_repo = Mock()
+        conduit = Mock()
+        config = {constants.CONFIG_FEED: 'http://host/root/'}
+
+        manifest = [('path1', 'AA', 10)]
+
+        # test
+
+        method = SynchronizeWithDirectory(mock_repo, conduit, config)
+        method.report = Mock()
+        method.cache = self._mock_cache('/tmp/puppet-testing', {'path1': '/cached/path1'})
+        module_paths = method._fetch_modules(manifest)
+
+        # validation
+
+        self.assertEqual(mock_download.call_count, 0)
+        self.assertEqual(module_paths, ['/cached/path1'])
+
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
+    def test_fetch_modules_local_link(self, mock_download):
+        source_dir = mkdtemp(prefix='puppet-directory-tests')
+        try:
+            with open(os.path.join(source_dir, 'path1'), 'w') as f:
+                f.write('module')
+            config = {constants.CONFIG_FEED: 'file://' + source_dir,
+                      constants.CONFIG_IMPORT_MODE: constants.IMPORT_MODE_HARDLINK}
+            report_2 = Mock()
+            report_2.url = urljoin('file://' + source_dir + '/', 'path2')
+            mock_download.return_value = [report_2], []
+
+            # test
+
+            method = SynchronizeWithDirectory(Mock(), Mock(), config)
+            method.report = Mock()
+            method.cache = self._mock_cache('/tmp/puppet-testing')
+            module_paths = method._fetch_modules([('path1', 'AA', 10), ('path2', 'BB', 20)])
+
+            # validation
+
+            # The file in the feed is used in place; the missing one is fetched as usual
+            self.assertEqual(module_paths, [os.path.join(source_dir, 'path1'),
+                                            '/tmp/puppet-testing/path2'])
+            mock_download.assert_called_once_with(
+                [(report_2.url, method.cache.partials['path2'])])
+        finally:
+            shutil.rmtree(source_dir)
+
     @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._download')
     def test_fetch_modules_failures(self, mock_download):
         tmp_dir = '/tmp/puppet-testing'
@@ -287,9 +487,9 @@ class TestSynchronizeWithDirectory(TestCase):
         manifest = [('path1', 'AA', 10), ('path2', 'BB', 20)]
 
         report_1 = Mock()
-        report_1.destination = os.path.join(tmp_dir, manifest[0][0])
+        report_1.url = urljoin(feed_url, manifest[0][0])
         report_2 = Mock()
-        report_2.destination = os.path.join(tmp_dir, manifest[1][0])
+        report_2.url = urljoin(feed_url, manifest[1][0])
         report_2.error_msg = 'it just dont work'
         mock_download.return_value = [report_1], [report_2]
 
@@ -297,19 +497,13 @@ class TestSynchronizeWithDirectory(TestCase):
 
         method = SynchronizeWithDirectory(mock_repo, conduit, config)
         method.report = Mock()
-        method.tmp_dir = '/tmp/puppet-testing'
+        method.cache = self._mock_cache(tmp_dir)
         module_paths = method._fetch_modules(manifest)
 
         # validation
 
-        url_1 = os.path.join(feed_url, manifest[0][0])
-        url_2 = os.path.join(feed_url, manifest[1][0])
-
-        mock_download.assert_any_with([(url_1, report_1.destination)])
-        mock_download.assert_any_with([(url_2, report_2.destination)])
-
-        self.assertEqual(len(module_paths), 1)
-        self.assertEqual(module_paths[0], report_1.destination)
+        self.assertEqual(module_paths, [os.path.join(tmp_dir, 'path1')])
+        method.cache.complete.assert_called_once_with('path1')
 
         self.assertTrue(method.report.update_progress.called)
         self.assertEqual(method.report.modules_state, constants.STATE_FAILED)
@@ -317,35 +511,9 @@ class TestSynchronizeWithDirectory(TestCase):
         self.assertEqual(len(method.report.modules_individual_errors), 1)
         self.assertEqual(method.report.modules_individual_errors[0], report_2.error_msg)
 
-    @patch('__builtin__.open')
-    @patch('pulp_puppet.plugins.importers.directory.shutil')
-    @patch('pulp_puppet.plugins.importers.directory.json')
-    @patch('pulp_puppet.plugins.importers.directory.tarfile')
-    @patch('pulp_puppet.plugins.importers.directory.mkdtemp')
-    def test_extract_metadata(self, *mocks):
-        mock_mkdtemp, mock_tarfile, mock_json, mock_shutil, mock_open = mocks
-        Member = namedtuple('Member', ['name'])
+    @patch('pulp_puppet.plugins.importers.directory.metadata_parser.extract_metadata')
+    def test_extract_metadata(self, mock_extract):
         module_path = '/build/modules/puppet-module.tar.gz'
-        mock_mkdtemp.return_value = '/tmp/xx'
-        members = [
-            Member(name='puppet-module'),
-            Member(name='puppet-module/manifests'),
-            Member(name='puppet-module/spec'),
-            Member(name='puppet-module/templates'),
-            Member(name='puppet-module/tests'),
-            Member(name='puppet-module/CHANGELOG'),
-            Member(name='puppet-module/%s' % constants.MODULE_METADATA_FILENAME),
-            Member(name='puppet-module/README'),
-        ]
-        tarball = Mock()
-        tarball.getmembers = Mock(return_value=members)
-        mock_tarfile.open = Mock(return_value=tarball)
-
-        mock_fp = Mock()
-        mock_fp.__enter__ = Mock(return_value=mock_fp)
-        mock_fp.__exit__ = Mock()
-        mock_open.return_value = mock_fp
-        mock_json.load.return_value = '12345'
 
         # test
 
@@ -353,13 +521,60 @@ class TestSynchronizeWithDirectory(TestCase):
 
         # validation
 
-        mock_mkdtemp.assert_called_with(dir=os.path.dirname(module_path))
-        mock_tarfile.open.assert_called_with(module_path)
-        tarball.getmembers.assert_called_with()
-        tarball.extract.assert_called_with(members[6], mock_mkdtemp())
-        mock_open.assert_called_with(os.path.join(mock_mkdtemp(), members[6].name))
-        mock_json.load.assert_called_with(mock_fp)
-        mock_shutil.rmtree.assert_called_with(mock_mkdtemp())
+        mock_extract.assert_called_once_with(module_path, any_depth=True)
+        self.assertEqual(puppet_manifest, mock_extract.return_value)
+
+    @patch('pulp_puppet.plugins.importers.directory.Pool')
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._extract_metadata')
+    def test_iter_metadata_serial(self, mock_extract, mock_pool):
+        mock_extract.side_effect = lambda path: {'name': path}
+        method = SynchronizeWithDirectory(Mock(), Mock(), {})
+
+        extracted = list(method._iter_metadata(['a', 'b']))
+
+        self.assertEqual(extracted, [('a', {'name': 'a'}), ('b', {'name': 'b'})])
+        self.assertEqual(mock_pool.call_count, 0)
+
+    @patch('pulp_puppet.plugins.importers.directory.Pool')
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._extract_metadata')
+    def test_iter_metadata_pool(self, mock_extract, mock_pool):
+        pool = mock_pool.return_value
+        pool.imap.return_value = iter([{'name': 'a'}, None, {'name': 'c'}])
+        mock_extract.return_value = {'name': 'b'}
+        config = {constants.CONFIG_EXTRACT_PROCESSES: '3'}
+        method = SynchronizeWithDirectory(Mock(), Mock(), config)
+
+        extracted = list(method._iter_metadata(['a', 'b', 'c']))
+
+        mock_pool.assert_called_once_with(3)
+        pool.imap.assert_called_once_with(directory._extract_metadata_in_worker,
+                                          ['a', 'b', 'c'], directory.EXTRACT_CHUNK_SIZE)
+        self.assertEqual(extracted,
+                         [('a', {'name': 'a'}), ('b', {'name': 'b'}), ('c', {'name': 'c'})])
+        # Only the module the extraction process failed on is extracted again
+        mock_extract.assert_called_once_with('b')
+        self.assertTrue(pool.terminate.called)
+
+    @patch('pulp_puppet.plugins.importers.directory.Pool')
+    @patch('pulp_puppet.plugins.importers.directory.SynchronizeWithDirectory._extract_metadata')
+    def test_iter_metadata_pool_unavailable(self, mock_extract, mock_pool):
+        mock_pool.side_effect = AssertionError('daemonic processes are not allowed to have '
+                                               'children')
+        mock_extract.side_effect = lambda path: {'name': path}
+        config = {constants.CONFIG_EXTRACT_PROCESSES: 2}
+        method = SynchronizeWithDirectory(Mock(), Mock(), config)
+
+        extracted = list(method._iter_metadata(['a', 'b']))
+
+        self.assertEqual(extracted, [('a', {'name': 'a'}), ('b', {'name': 'b'})])
+
+    @patch('pulp_puppet.plugins.importers.directory.metadata_parser.extract_metadata')
+    def test_extract_metadata_in_worker(self, mock_extract):
+        self.assertEqual(directory._extract_metadata_in_worker('a'), mock_extract.return_value)
+        mock_extract.assert_called_once_with('a', any_depth=True)
+
+        mock_extract.side_effect = IOError('unreadable')
+        self.assertTrue(directory._extract_metadata_in_worker('a') is None)
 
 
 class TestListener(TestCase):
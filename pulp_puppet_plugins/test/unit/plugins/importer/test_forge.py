@@ -9,8 +9,11 @@ from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.model import Repository, SyncReport, Unit
 
 from pulp_puppet.common import constants, sync_progress
-from pulp_puppet.plugins.db.models import Module, RepositoryMetadata
-from pulp_puppet.plugins.importers.forge import SynchronizeWithPuppetForge
+from pulp_puppet.plugins.db.models import Module, ModuleRecord, RepositoryMetadata
+from pulp_puppet.plugins.importers.downloaders.exceptions import MetadataNotModified
+from pulp_puppet.plugins.importers.forge import ModuleImport, SynchronizeWithPuppetForge
+from pulp_puppet.plugins.importers.state import metadata_digest
+from pulp_puppet.plugins.importers.units import CommitResult
 
 
 DATA_DIR = os.path.abspath(os.path.dirname(__file__)) + '/../../../data'
@@ -194,6 +197,59 @@ class TestSynchronizeWithPuppetForge(unittest.TestCase):
         self.assertEqual(pr.metadata_state, constants.STATE_CANCELED)
         self.assertEqual(pr.modules_state, constants.STATE_NOT_STARTED)
 
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._previous_sync')
+    @mock.patch('pulp_puppet.plugins.importers.downloaders.local.LocalDownloader.retrieve_metadata')
+    def test_parse_metadata_not_modified(self, mock_retrieve, mock_previous_sync):
+        # Setup
+        mock_previous_sync.return_value = {'validators': {'a': {'etag': '"abc"'}}}
+        mock_retrieve.side_effect = MetadataNotModified(['a'])
+
+        # Test
+        report = self.method().build_final_report()
+
+        # Verify
+        self.assertTrue(report.success_flag)
+        mock_retrieve.assert_called_once_with(self.method.progress_report,
+                                              validators={'a': {'etag': '"abc"'}})
+
+        pr = self.method.progress_report
+        self.assertEqual(pr.metadata_state, constants.STATE_SUCCESS)
+        self.assertEqual(pr.modules_state, constants.STATE_SUCCESS)
+        self.assertEqual(pr.modules_total_count, 0)
+        self.assertEqual(pr.modules_error_count, 0)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._import_modules')
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._previous_sync')
+    @mock.patch('pulp_puppet.plugins.importers.downloaders.local.LocalDownloader.retrieve_metadata')
+    def test_parse_metadata_unchanged(self, mock_retrieve, mock_previous_sync, mock_import):
+        # Setup
+        mock_retrieve.return_value = ['[]']
+        mock_previous_sync.return_value = {'digest': metadata_digest(['[]'])}
+
+        # Test
+        report = self.method().build_final_report()
+
+        # Verify
+        self.assertTrue(report.success_flag)
+        self.assertEqual(mock_import.call_count, 0)
+
+        pr = self.method.progress_report
+        self.assertEqual(pr.metadata_state, constants.STATE_SUCCESS)
+        self.assertEqual(pr.modules_state, constants.STATE_SUCCESS)
+        self.assertEqual(pr.modules_total_count, 0)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.sync_fingerprint')
+    def test_previous_sync_fingerprint_changed(self, mock_fingerprint):
+        mock_fingerprint.return_value = {'feed': FEED, 'unit_count': 1}
+        self.method._metadata_validators = {'a': {'etag': '"abc"'}}
+        self.method._metadata_digest = 'abc'
+        self.method._record_sync()
+
+        self.assertEqual(self.method._previous_sync()['digest'], 'abc')
+
+        mock_fingerprint.return_value = {'feed': FEED, 'unit_count': 2}
+        self.assertEqual(self.method._previous_sync(), {})
+
     @mock.patch('pulp_puppet.plugins.importers.downloaders.local.LocalDownloader.retrieve_metadata')
     def test_parse_metadata_parse_exception(self, mock_retrieve):
         # Setup
@@ -241,3 +297,186 @@ class TestSynchronizeWithPuppetForge(unittest.TestCase):
         self.assertTrue(pr.modules_error_message is not None)
         self.assertTrue(pr.modules_exception is not None)
         self.assertTrue(pr.modules_traceback is not None)
+
+    def test_download_batch_size(self):
+        self.assertEqual(self.method._download_batch_size(),
+                         constants.DEFAULT_DOWNLOAD_BATCH_SIZE)
+
+        self.config.repo_plugin_config[constants.CONFIG_DOWNLOAD_BATCH_SIZE] = '7'
+        self.assertEqual(self.method._download_batch_size(), 7)
+
+    def test_download_stage(self):
+        # Setup
+        good = mock.Mock()
+        missing = mock.Mock()
+        error = Exception('not found')
+        downloader = mock.MagicMock()
+        digests = {'sha256': 'abc'}
+        downloader.retrieve_module_batch.return_value = (
+            [(good, '/tmp/good.tar.gz', digests)], [(missing, error)])
+
+        # Test
+        work = self.method._download_stage(downloader, [good, missing])
+
+        # Verify
+        downloader.retrieve_module_batch.assert_called_once_with(self.method.progress_report,
+                                                                 [good, missing])
+        self.assertEqual([(w.module, w.path, w.digests, w.error) for w in work],
+                         [(good, '/tmp/good.tar.gz', digests, None),
+                          (missing, None, None, error)])
+
+    def test_download_stage_canceled(self):
+        downloader = mock.MagicMock()
+        self.method.cancel()
+
+        self.assertEqual(self.method._download_stage(downloader, [mock.Mock()]), [])
+        self.assertEqual(downloader.retrieve_module_batch.call_count, 0)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.metadata_module.extract_metadata')
+    def test_extract_stage(self, mock_extract):
+        mock_extract.return_value = {'name': 'jdob-valid', 'version': '1.0.0'}
+        work = ModuleImport(mock.Mock(), path='/tmp/jdob-valid-1.0.0.tar.gz')
+
+        result = self.method._extract_stage(work)
+
+        self.assertEqual(result, [work])
+        mock_extract.assert_called_once_with(work.path)
+        self.assertEqual(work.metadata, {'author': 'jdob', 'name': 'valid', 'version': '1.0.0'})
+        self.assertTrue(work.error is None)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.metadata_module.extract_metadata')
+    def test_extract_stage_error(self, mock_extract):
+        mock_extract.side_effect = Exception('bad tarball')
+        work = ModuleImport(mock.Mock(), path='/tmp/jdob-valid-1.0.0.tar.gz')
+
+        self.method._extract_stage(work)
+
+        self.assertTrue(work.metadata is None)
+        self.assertTrue(work.error is mock_extract.side_effect)
+        self.assertTrue(work.traceback is not None)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.Module.from_metadata')
+    def test_store_stage(self, mock_from_metadata):
+        # Setup
+        good = mock.Mock(author='jdob', version='1.0.0')
+        good.name = 'good'
+        broken = mock.Mock(author='jdob', version='1.0.0')
+        broken.name = 'broken'
+        missing = mock.Mock(author='jdob', version='1.0.0')
+        missing.name = 'missing'
+
+        good_work = ModuleImport(good, path='/tmp/good.tar.gz', digests={'sha256': 'abc'})
+        good_work.metadata = {'name': 'good'}
+        broken_work = ModuleImport(broken, path='/tmp/broken.tar.gz')
+        broken_work.metadata = {'name': 'broken'}
+        missing_work = ModuleImport(missing, error=Exception('not found'))
+
+        downloader = mock.MagicMock()
+        committer = mock.Mock()
+        good_module, broken_module = mock.Mock(), mock.Mock()
+        mock_from_metadata.side_effect = [good_module, broken_module]
+        committer.add.side_effect = [
+            [],
+            [CommitResult(good_module, good_work.path, good_work, None, None),
+             CommitResult(broken_module, broken_work.path, broken_work,
+                          Exception('cannot save'), None)],
+        ]
+
+        pr = self.method.progress_report
+        pr.modules_finished_count = 0
+        pr.modules_error_count = 0
+
+        # Test
+        for work in (good_work, broken_work, missing_work):
+            self.method._store_stage(downloader, committer, work)
+
+        # Verify
+        committer.add.assert_any_call(good_module, '/tmp/good.tar.gz', good_work,
+                                      {'sha256': 'abc'})
+        self.assertEqual(pr.modules_finished_count, 1)
+        self.assertEqual(pr.modules_error_count, 2)
+        failed_names = [e['module'] for e in pr.modules_individual_errors]
+        self.assertEqual(failed_names, ['broken-1.0.0', 'missing-1.0.0'])
+        self.assertEqual(downloader.cleanup_module.call_count, 2)
+
+    def test_store_stage_canceled(self):
+        work = ModuleImport(mock.Mock(), path='/tmp/good.tar.gz')
+        work.metadata = {'name': 'good'}
+        downloader = mock.MagicMock()
+        committer = mock.Mock()
+        self.method.cancel()
+
+        self.method._store_stage(downloader, committer, work)
+
+        # The download is kept for the next sync
+        self.assertEqual(committer.add.call_count, 0)
+        self.assertEqual(downloader.cleanup_module.call_count, 0)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._store_stage')
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._extract_stage')
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._create_downloader')
+    @mock.patch('pulp_puppet.plugins.importers.forge.ExistingModuleIndex')
+    def test_do_import_modules_batches(self, mock_index, mock_create, mock_extract,
+                                       mock_store):
+        # Setup
+        self.config.repo_plugin_config[constants.CONFIG_DOWNLOAD_BATCH_SIZE] = 2
+        mock_index.return_value.repo_ids_by_key = {}
+        mock_index.return_value.find_outside_repo.return_value = {}
+        downloader = mock_create.return_value
+        downloader.retrieve_module_batch.side_effect = lambda pr, batch: (
+            [(m, '/tmp/%s' % m.version, None) for m in batch], [])
+        mock_extract.side_effect = lambda work: [work]
+        metadata = RepositoryMetadata()
+        for version in ('1.0.0', '1.1.0', '1.2.0'):
+            metadata.modules.append(ModuleRecord('jdob', 'valid', version, []))
+
+        # Test
+        self.method._do_import_modules(metadata)
+
+        # Verify
+        batch_sizes = [len(c[0][1]) for c in downloader.retrieve_module_batch.call_args_list]
+        self.assertEqual(sorted(batch_sizes), [1, 2])
+        self.assertEqual(mock_extract.call_count, 3)
+        self.assertEqual(mock_store.call_count, 3)
+        stored = sorted(c[0][2].path for c in mock_store.call_args_list)
+        self.assertEqual(stored, ['/tmp/1.0.0', '/tmp/1.1.0', '/tmp/1.2.0'])
+        self.assertEqual(self.method.progress_report.modules_total_count, 3)
+        self.assertTrue(self.method.pipeline is None)
+
+    @mock.patch('pulp_puppet.plugins.importers.forge.associate_modules')
+    @mock.patch('pulp_puppet.plugins.importers.forge.repo_controller')
+    @mock.patch('pulp_puppet.plugins.importers.forge.Module.objects')
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._store_stage')
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._extract_stage')
+    @mock.patch('pulp_puppet.plugins.importers.forge.SynchronizeWithPuppetForge._create_downloader')
+    @mock.patch('pulp_puppet.plugins.importers.forge.ExistingModuleIndex')
+    def test_do_import_modules_existing(self, mock_index, mock_create, mock_extract,
+                                        mock_store, mock_objects, mock_repo_controller,
+                                        mock_associate):
+        # Setup
+        self.config.repo_plugin_config[constants.CONFIG_REMOVE_MISSING] = True
+        in_repo = ModuleRecord('jdob', 'valid', '1.0.0', [])
+        elsewhere = ModuleRecord('jdob', 'valid', '1.1.0', [])
+        new = ModuleRecord('jdob', 'valid', '1.2.0', [])
+        mock_index.return_value.repo_ids_by_key = {('jdob', 'valid', '1.0.0'): 'in-repo',
+                                                   ('jdob', 'valid', '0.1.0'): 'missing'}
+        mock_index.return_value.find_outside_repo.return_value = {
+            ('jdob', 'valid', '1.1.0'): 'elsewhere'}
+        mock_associate.return_value = 1
+        downloader = mock_create.return_value
+        downloader.retrieve_module_batch.side_effect = lambda pr, batch: (
+            [(m, '/tmp/%s' % m.version, None) for m in batch], [])
+        mock_extract.side_effect = lambda work: [work]
+        metadata = RepositoryMetadata()
+        metadata.modules.extend([in_repo, elsewhere, new])
+
+        # Test
+        self.method._do_import_modules(metadata)
+
+        # Verify
+        mock_index.assert_called_once_with(self.repo.repo_obj)
+        downloaded = [m for c in downloader.retrieve_module_batch.call_args_list for m in c[0][1]]
+        self.assertEqual(downloaded, [new])
+        mock_associate.assert_called_once_with(self.repo.repo_obj, ['elsewhere'])
+        self.assertEqual(self.method.progress_report.modules_total_count, 2)
+        mock_objects.in_bulk.assert_called_once_with(['missing'])
@@ -19,6 +19,19 @@ class TestImporter(unittest.TestCase):
 
 class TestPuppetModuleImporter(unittest.TestCase):
 
+    def setUp(self):
+        patcher = patch('pulp_puppet.plugins.importers.importer.SyncState')
+        self.mock_state = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.state_data = {}
+        self.mock_state.return_value.get.side_effect = self.state_data.get
+        self.mock_state.return_value.set.side_effect = self.state_data.__setitem__
+
+    def _report(self, metadata_state):
+        report = SyncProgressReport(Mock())
+        report.metadata_state = metadata_state
+        return report
+
     @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
     @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
     def test_directory_synchronization(self, forge_call, mock_call):
@@ -66,6 +79,126 @@ class TestPuppetModuleImporter(unittest.TestCase):
         # validation
         mock_call.assert_called_with()
         self.assertEquals(report, conduit.build_failure_report.return_value)
+        # Neither method worked, so nothing is remembered
+        self.assertFalse(self.mock_state.return_value.save.called)
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_forge_detected(self, directory_call, forge_call):
+        config = {constants.CONFIG_FEED: 'http://host/forge'}
+        directory_call.return_value = self._report(constants.STATE_FAILED)
+        forge_call.return_value = self._report(constants.STATE_SUCCESS)
+
+        PuppetModuleImporter().sync_repo(Mock(), Mock(), config)
+
+        self.assertEqual(directory_call.call_count, 1)
+        self.assertEqual(forge_call.call_count, 1)
+        self.assertEqual(self.state_data[importer.FEED_TYPE_STATE_KEY],
+                         {'feed': 'http://host/forge', 'type': constants.FEED_TYPE_FORGE})
+        self.mock_state.return_value.save.assert_called_once_with()
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_remembered_forge(self, directory_call, forge_call):
+        config = {constants.CONFIG_FEED: 'http://host/forge'}
+        self.state_data[importer.FEED_TYPE_STATE_KEY] = {'feed': 'http://host/forge',
+                                                         'type': constants.FEED_TYPE_FORGE}
+        forge_call.return_value = self._report(constants.STATE_SUCCESS)
+
+        PuppetModuleImporter().sync_repo(Mock(), Mock(), config)
+
+        # The manifest is not probed and the unchanged state is not written again
+        self.assertFalse(directory_call.called)
+        self.assertEqual(forge_call.call_count, 1)
+        self.assertFalse(self.mock_state.return_value.save.called)
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_remembered_feed_changed(self, directory_call, forge_call):
+        config = {constants.CONFIG_FEED: 'http://host/modules'}
+        self.state_data[importer.FEED_TYPE_STATE_KEY] = {'feed': 'http://host/forge',
+                                                         'type': constants.FEED_TYPE_FORGE}
+        directory_call.return_value = self._report(constants.STATE_SUCCESS)
+
+        PuppetModuleImporter().sync_repo(Mock(), Mock(), config)
+
+        self.assertEqual(directory_call.call_count, 1)
+        self.assertFalse(forge_call.called)
+        self.assertEqual(self.state_data[importer.FEED_TYPE_STATE_KEY],
+                         {'feed': 'http://host/modules', 'type': constants.FEED_TYPE_DIRECTORY})
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_remembered_type_fails(self, directory_call, forge_call):
+        config = {constants.CONFIG_FEED: 'http://host/modules'}
+        self.state_data[importer.FEED_TYPE_STATE_KEY] = {'feed': 'http://host/modules',
+                                                         'type': constants.FEED_TYPE_FORGE}
+        forge_call.return_value = self._report(constants.STATE_FAILED)
+        directory_call.return_value = self._report(constants.STATE_SUCCESS)
+
+        PuppetModuleImporter().sync_repo(Mock(), Mock(), config)
+
+        # The remembered type is tried first and the feed detected again when it fails
+        self.assertEqual(forge_call.call_count, 1)
+        self.assertEqual(directory_call.call_count, 1)
+        self.assertEqual(self.state_data[importer.FEED_TYPE_STATE_KEY]['type'],
+                         constants.FEED_TYPE_DIRECTORY)
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_remembered_type_error_reported(self, directory_call, forge_call):
+        config = {constants.CONFIG_FEED: 'http://host/forge'}
+        self.state_data[importer.FEED_TYPE_STATE_KEY] = {'feed': 'http://host/forge',
+                                                         'type': constants.FEED_TYPE_FORGE}
+        conduit = Mock()
+        forge_report = SyncProgressReport(conduit)
+        forge_report.metadata_state = constants.STATE_FAILED
+        forge_report.metadata_error_message = 'forge unavailable'
+        forge_call.return_value = forge_report
+        directory_report = SyncProgressReport(conduit)
+        directory_report.metadata_state = constants.STATE_FAILED
+        directory_report.metadata_error_message = 'PULP_MANIFEST could not be fetched'
+        directory_call.return_value = directory_report
+
+        report = PuppetModuleImporter().sync_repo(Mock(), conduit, config)
+
+        # The error of the remembered type is reported, not that of the failed probe
+        self.assertEqual(directory_call.call_count, 1)
+        self.assertEquals(report, conduit.build_failure_report.return_value)
+        progress = conduit.set_progress.call_args[0][0]
+        self.assertEqual(progress['metadata']['error_message'], 'forge unavailable')
+        self.assertEqual(self.state_data[importer.FEED_TYPE_STATE_KEY]['type'],
+                         constants.FEED_TYPE_FORGE)
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_configured_feed_type(self, directory_call, forge_call):
+        config = {constants.CONFIG_FEED: 'http://host/forge',
+                  constants.CONFIG_FEED_TYPE: constants.FEED_TYPE_FORGE}
+        forge_call.return_value = self._report(constants.STATE_FAILED)
+
+        conduit = Mock()
+        report = PuppetModuleImporter().sync_repo(Mock(), conduit, config)
+
+        # Only the configured method is used, even when it fails
+        self.assertFalse(directory_call.called)
+        self.assertEqual(forge_call.call_count, 1)
+        self.assertEquals(report, conduit.build_failure_report.return_value)
+        self.assertFalse(self.mock_state.called)
+
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithPuppetForge.__call__')
+    @patch('pulp_puppet.plugins.importers.importer.SynchronizeWithDirectory.__call__')
+    def test_cancelled_not_retried(self, directory_call, forge_call):
+        plugin = PuppetModuleImporter()
+
+        def cancel():
+            plugin.cancel_sync_repo()
+            return self._report(constants.STATE_FAILED)
+        directory_call.side_effect = cancel
+
+        plugin.sync_repo(Mock(), Mock(), {constants.CONFIG_FEED: 'http://host/modules'})
+
+        self.assertFalse(forge_call.called)
 
 
     @patch('pulp_puppet.plugins.importers.upload.handle_uploaded_unit')
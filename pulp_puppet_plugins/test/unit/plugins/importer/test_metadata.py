@@ -1,5 +1,8 @@
+from cStringIO import StringIO
+import json
 import os
 import shutil
+import tarfile
 import tempfile
 import unittest
 
@@ -36,7 +39,7 @@ class NegativeMetadataTests(unittest.TestCase):
 
         # Test
         try:
-            metadata.extract_metadata(filename, self.tmp_dir)
+            metadata.extract_metadata(filename)
             self.fail()
         except metadata.ExtractionException, e:
             self.assertEqual(e.module_filename, filename)
@@ -50,20 +53,105 @@ class NegativeMetadataTests(unittest.TestCase):
 
         # Test
         try:
-            metadata._extract_json(filename, self.tmp_dir)
+            metadata._extract_json(filename)
             self.fail()
         except metadata.ExtractionException, e:
             self.assertEqual(e.module_filename, filename)
 
-    @mock.patch(MODULE_STRING + '.tarfile')
-    def test_extract_metadata_no_metadata(self, mock_tarfile):
+    def test_extract_metadata_no_metadata(self):
         # Setup
         self.module.name = 'no-metadata'
         filename = os.path.join(self.module_dir, self.module.filename())
 
         # Test
         try:
-            metadata.extract_metadata(filename, self.tmp_dir)
+            metadata.extract_metadata(filename)
             self.fail()
         except metadata.MissingModuleFile, e:
-            self.assertEqual(e.module_filename, filename)
\ No newline at end of file
+            self.assertEqual(e.module_filename, filename)
+
+
+class ExtractMetadataTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='puppet-metadata-tests')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _build_module(self, members):
+        filename = os.path.join(self.tmp_dir, 'jdob-valid-1.0.0.tar.gz')
+        tgz = tarfile.open(filename, 'w:gz')
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tgz.addfile(info, StringIO(content))
+        tgz.close()
+        return filename
+
+    def test_extract_metadata(self):
+        filename = os.path.join(DATA_DIR, 'good-modules', 'jdob-valid', 'pkg',
+                                'jdob-valid-1.0.0.tar.gz')
+
+        extracted = metadata.extract_metadata(filename)
+
+        self.assertEqual(extracted['name'], 'jdob-valid')
+        self.assertEqual(extracted['version'], '1.0.0')
+        # Nothing is extracted to disk
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_extract_metadata_main_directory(self):
+        filename = self._build_module([
+            ('jdob-valid-1.0.0/spec/fixtures/metadata.json', json.dumps({'name': 'fixture'})),
+            ('./jdob-valid-1.0.0/metadata.json', json.dumps({'name': 'jdob-valid'})),
+        ])
+
+        # Metadata files nested deeper in the module are not the module's own
+        self.assertEqual(metadata.extract_metadata(filename), {'name': 'jdob-valid'})
+
+    def test_extract_metadata_top_level(self):
+        filename = self._build_module([('metadata.json', json.dumps({'name': 'jdob-valid'}))])
+
+        self.assertRaises(metadata.MissingModuleFile, metadata.extract_metadata, filename)
+
+    def test_extract_metadata_any_depth(self):
+        filename = self._build_module([
+            ('metadata.json', json.dumps({'name': 'jdob-valid'})),
+            ('spec/fixtures/metadata.json', json.dumps({'name': 'fixture'})),
+        ])
+
+        # Without a main directory the first metadata file in the tarball is used
+        self.assertEqual(metadata.extract_metadata(filename, any_depth=True),
+                         {'name': 'jdob-valid'})
+
+    def test_extract_metadata_any_depth_main_directory(self):
+        filename = self._build_module([
+            ('jdob-valid-1.0.0/spec/fixtures/metadata.json', json.dumps({'name': 'fixture'})),
+            ('jdob-valid-1.0.0/metadata.json', json.dumps({'name': 'jdob-valid'})),
+        ])
+
+        # The main directory's metadata file is still preferred
+        self.assertEqual(metadata.extract_metadata(filename, any_depth=True),
+                         {'name': 'jdob-valid'})
+
+class IterJsonArrayTests(unittest.TestCase):
+
+    def test_iter_json_array(self):
+        document = ' [ {"name": "a", "tag_list": ["x", "y"]},\n{"name": "b"} ] \n'
+
+        elements = list(metadata.iter_json_array(document))
+
+        self.assertEqual(elements, [{'name': 'a', 'tag_list': ['x', 'y']}, {'name': 'b'}])
+
+    def test_iter_json_array_empty(self):
+        self.assertEqual(list(metadata.iter_json_array('[ ]')), [])
+
+    def test_iter_json_array_not_array(self):
+        self.assertRaises(ValueError, list, metadata.iter_json_array('not parsable json'))
+        self.assertRaises(ValueError, list, metadata.iter_json_array('{"name": "a"}'))
+        self.assertRaises(ValueError, list, metadata.iter_json_array(''))
+
+    def test_iter_json_array_malformed(self):
+        self.assertRaises(ValueError, list, metadata.iter_json_array('[{"name": "a"} {}]'))
+        self.assertRaises(ValueError, list, metadata.iter_json_array('[{"name": "a"},'))
+        self.assertRaises(ValueError, list, metadata.iter_json_array('[{"name": "a"}] x'))
@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from pulp_puppet.plugins.importers.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_run(self):
+        consumed = []
+        consumer_threads = set()
+
+        def consumer(item):
+            consumed.append(item)
+            consumer_threads.add(threading.current_thread())
+
+        pipeline = Pipeline([lambda x: [x, x * 10], lambda x: [x + 1]], queue_size=1)
+        pipeline.run(xrange(5), consumer)
+
+        self.assertEqual(consumed, [1, 1, 2, 11, 3, 21, 4, 31, 5, 41])
+        self.assertEqual(consumer_threads, set([threading.current_thread()]))
+
+    def test_run_no_items(self):
+        consumed = []
+
+        Pipeline([lambda x: [x]]).run([], consumed.append)
+
+        self.assertEqual(consumed, [])
+
+    def test_stage_error(self):
+        consumed = []
+
+        def stage(item):
+            if item == 2:
+                raise ValueError('boom')
+            return [item]
+
+        pipeline = Pipeline([stage], queue_size=1)
+
+        self.assertRaises(ValueError, pipeline.run, xrange(100), consumed.append)
+        self.assertTrue(2 not in consumed)
+        self.assertTrue(len(consumed) < 100)
+
+    def test_consumer_error(self):
+        consumed = []
+
+        def consumer(item):
+            if item == 3:
+                raise ValueError('boom')
+            consumed.append(item)
+
+        pipeline = Pipeline([lambda x: [x]], queue_size=1)
+
+        self.assertRaises(ValueError, pipeline.run, xrange(100), consumer)
+        self.assertEqual(consumed, [0, 1, 2])
+
+    def test_stop(self):
+        consumed = []
+        pipeline = Pipeline([lambda x: [x]], queue_size=1)
+
+        def consumer(item):
+            consumed.append(item)
+            pipeline.stop()
+
+        pipeline.run(xrange(100), consumer)
+
+        self.assertTrue(len(consumed) < 100)
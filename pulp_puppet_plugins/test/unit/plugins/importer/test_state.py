@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.importers import state
+
+
+class TestSyncState(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='puppet-state-tests')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_no_state(self):
+        sync_state = state.SyncState(self.working_dir)
+
+        self.assertEqual(sync_state.data, {})
+        self.assertEqual(sync_state.get('a'), None)
+
+    def test_save(self):
+        sync_state = state.SyncState(self.working_dir)
+        sync_state.set('a', {'b': 1})
+        sync_state.save()
+
+        self.assertEqual(state.SyncState(self.working_dir).get('a'), {'b': 1})
+        self.assertFalse(os.path.exists(sync_state.path + '.tmp'))
+
+    def test_remove(self):
+        sync_state = state.SyncState(self.working_dir)
+        sync_state.set('a', 1)
+        sync_state.remove('a')
+        sync_state.remove('b')
+
+        self.assertEqual(sync_state.data, {})
+
+    def test_corrupt(self):
+        with open(os.path.join(self.working_dir, state.STATE_FILENAME), 'w') as fp:
+            fp.write('{not json')
+
+        self.assertEqual(state.SyncState(self.working_dir).data, {})
+
+
+class TestSyncFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = mock.Mock(id='repo-1')
+        self.config = mock.Mock()
+        self.config.get.side_effect = {constants.CONFIG_FEED: 'http://host/',
+                                       constants.CONFIG_QUERIES: None}.get
+        self.config.get_boolean.return_value = True
+
+    def _fingerprint(self, mock_rcu, count, last_created):
+        associations = mock_rcu.objects.return_value
+        associations.count.return_value = count
+        latest = associations.order_by.return_value.only.return_value
+        latest.first.return_value = mock.Mock(created=last_created) if last_created else None
+        return state.sync_fingerprint(self.repo, self.config)
+
+    @mock.patch('pulp_puppet.plugins.importers.state.RepositoryContentUnit')
+    def test_sync_fingerprint(self, mock_rcu):
+        fingerprint = self._fingerprint(mock_rcu, 3, '2016-01-01T00:00:00Z')
+
+        self.assertEqual(fingerprint, {'feed': 'http://host/', 'queries': None,
+                                       'remove_missing': True, 'unit_count': 3,
+                                       'last_associated': '2016-01-01T00:00:00Z'})
+        mock_rcu.objects.assert_called_once_with(repo_id='repo-1',
+                                                 unit_type_id=constants.TYPE_PUPPET_MODULE)
+        mock_rcu.objects.return_value.order_by.assert_called_once_with('-created')
+        # The unit ids are not read
+        self.assertFalse(mock_rcu.objects.return_value.scalar.called)
+
+    @mock.patch('pulp_puppet.plugins.importers.state.RepositoryContentUnit')
+    def test_empty_repository(self, mock_rcu):
+        fingerprint = self._fingerprint(mock_rcu, 0, None)
+
+        self.assertEqual(fingerprint['unit_count'], 0)
+        self.assertEqual(fingerprint['last_associated'], None)
+
+    @mock.patch('pulp_puppet.plugins.importers.state.RepositoryContentUnit')
+    def test_module_swapped(self, mock_rcu):
+        # One module removed and another added leaves the count unchanged, but the
+        # added module was associated later than any module before
+        before = self._fingerprint(mock_rcu, 2, '2016-01-01T00:00:00Z')
+        after = self._fingerprint(mock_rcu, 2, '2016-01-02T00:00:00Z')
+
+        self.assertNotEqual(before, after)
+
+
+class TestMetadataDigest(unittest.TestCase):
+
+    def test_metadata_digest(self):
+        self.assertEqual(state.metadata_digest(['a', 'b']), state.metadata_digest(['a', 'b']))
+        self.assertNotEqual(state.metadata_digest(['a', 'b']), state.metadata_digest(['ab']))
+        self.assertNotEqual(state.metadata_digest(['a', 'b']), state.metadata_digest(['b', 'a']))
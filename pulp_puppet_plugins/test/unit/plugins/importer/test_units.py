@@ -0,0 +1,317 @@
+import unittest
+
+import mock
+from mongoengine.errors import NotUniqueError
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.db.models import Module, ModuleRecord
+from pulp_puppet.plugins.importers import units
+from pulp_puppet.plugins.importers.units import (ExistingModuleIndex, ModuleCommitter,
+                                                 associate_modules, store_module,
+                                                 unit_key_tuple)
+
+
+class TestExistingModuleIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.in_repo = Module(author='jdob', name='valid', version='1.0.0', checksum='aa')
+        self.in_repo.id = 'in-repo'
+        self.legacy = Module(author='jdob', name='legacy', version='1.0.0', checksum='bb',
+                             checksum_type='md5')
+        self.legacy.id = 'legacy'
+        self.elsewhere = Module(author='jdob', name='valid', version='1.1.0')
+        self.elsewhere.id = 'elsewhere'
+        self.new = Module(author='jdob', name='valid', version='1.2.0')
+
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    def test_init(self, mock_repo_controller):
+        mock_repo_controller.find_repo_content_units.return_value = [self.in_repo]
+        repo_obj = mock.Mock()
+
+        index = ExistingModuleIndex(repo_obj)
+
+        mock_repo_controller.find_repo_content_units.assert_called_once_with(
+            repo_obj, unit_fields=units.INDEX_FIELDS, yield_content_unit=True)
+        self.assertEqual(index.repo_ids_by_key, {('jdob', 'valid', '1.0.0'): 'in-repo'})
+        self.assertTrue(index.in_repo(unit_key_tuple(self.in_repo)))
+        self.assertFalse(index.in_repo(unit_key_tuple(self.new)))
+
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    def test_find_file_in_repo(self, mock_repo_controller):
+        mock_repo_controller.find_repo_content_units.return_value = [self.in_repo, self.legacy]
+
+        index = ExistingModuleIndex(mock.Mock())
+
+        self.assertEqual(index.find_file_in_repo('aa'), ('jdob', 'valid', '1.0.0'))
+        # A changed file is not matched by its unit key
+        self.assertTrue(index.find_file_in_repo('cc', ('jdob', 'valid', '1.0.0')) is None)
+        # Unless the module in the repository has no comparable checksum
+        self.assertEqual(index.find_file_in_repo('cc', ('jdob', 'legacy', '1.0.0')),
+                         ('jdob', 'legacy', '1.0.0'))
+        self.assertTrue(index.find_file_in_repo('bb') is None)
+
+    @mock.patch('pulp_puppet.plugins.importers.units.Module.objects')
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    def test_find_outside_repo_by_checksum(self, mock_repo_controller, mock_objects):
+        mock_repo_controller.find_repo_content_units.return_value = [self.in_repo]
+        self.elsewhere.checksum = 'dd'
+        mock_objects.return_value.only.return_value = [self.elsewhere]
+
+        index = ExistingModuleIndex(mock.Mock())
+        found = index.find_outside_repo_by_checksum(['aa', 'dd', 'ee'])
+
+        self.assertEqual(found, {'dd': (('jdob', 'valid', '1.1.0'), 'elsewhere')})
+        mock_objects.assert_called_once_with(checksum__in=['dd', 'ee'],
+                                             checksum_type='sha256')
+
+    @mock.patch('pulp_puppet.plugins.importers.units.Module.objects')
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    def test_find_outside_repo(self, mock_repo_controller, mock_objects):
+        mock_repo_controller.find_repo_content_units.return_value = [self.in_repo]
+        mock_objects.return_value.only.return_value = [self.elsewhere]
+
+        index = ExistingModuleIndex(mock.Mock())
+        found = index.find_outside_repo([self.in_repo, self.elsewhere,
+                                         ModuleRecord('jdob', 'valid', '1.2.0', [])])
+
+        self.assertEqual(found, {('jdob', 'valid', '1.1.0'): 'elsewhere'})
+        self.assertEqual(mock_objects.call_count, 1)
+        mock_objects.return_value.only.assert_called_once_with(*Module.unit_key_fields)
+
+    @mock.patch('pulp_puppet.plugins.importers.units.QUERY_CHUNK_SIZE', 1)
+    @mock.patch('pulp_puppet.plugins.importers.units.Module.objects')
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    def test_find_outside_repo_chunks(self, mock_repo_controller, mock_objects):
+        mock_repo_controller.find_repo_content_units.return_value = []
+        mock_objects.return_value.only.return_value = []
+
+        index = ExistingModuleIndex(mock.Mock())
+        found = index.find_outside_repo([self.elsewhere, self.new])
+
+        self.assertEqual(found, {})
+        self.assertEqual(mock_objects.call_count, 2)
+
+    @mock.patch('pulp_puppet.plugins.importers.units.Module.objects')
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    def test_find_outside_repo_none(self, mock_repo_controller, mock_objects):
+        mock_repo_controller.find_repo_content_units.return_value = [self.in_repo]
+
+        index = ExistingModuleIndex(mock.Mock())
+
+        self.assertEqual(index.find_outside_repo([self.in_repo]), {})
+        self.assertEqual(mock_objects.call_count, 0)
+
+
+@mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+@mock.patch('pulp_puppet.plugins.importers.units.RepositoryContentUnit')
+@mock.patch('pulp_puppet.plugins.importers.units.Module.objects')
+class TestAssociateModules(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_obj = mock.Mock(repo_id='repo')
+        self.modules = [mock.Mock(id='a', _content_type_id='puppet_module'),
+                        mock.Mock(id='b', _content_type_id='puppet_module'),
+                        mock.Mock(id='c', _content_type_id='puppet_module')]
+
+    @mock.patch('pulp_puppet.plugins.importers.units.QUERY_CHUNK_SIZE', 2)
+    def test_associate_modules(self, mock_objects, mock_rcu, mock_repo_controller):
+        mock_objects.return_value.only.side_effect = [self.modules[:2], self.modules[2:]]
+
+        count = associate_modules(self.repo_obj, ['a', 'b', 'c'])
+
+        self.assertEqual(count, 3)
+        mock_objects.assert_any_call(id__in=['a', 'b'])
+        mock_objects.assert_any_call(id__in=['c'])
+        # One bulk write per chunk
+        self.assertEqual(mock_rcu.objects.insert.call_count, 2)
+        self.assertEqual(len(mock_rcu.objects.insert.call_args_list[0][0][0]), 2)
+        self.assertEqual(mock_rcu.call_args[1]['repo_id'], 'repo')
+        self.assertEqual(mock_rcu.call_args[1]['unit_id'], 'c')
+        self.assertEqual(mock_repo_controller.associate_single_unit.call_count, 0)
+
+    def test_associate_modules_bulk_fails(self, mock_objects, mock_rcu,
+                                          mock_repo_controller):
+        mock_objects.return_value.only.return_value = self.modules
+        mock_rcu.objects.insert.side_effect = NotUniqueError()
+
+        count = associate_modules(self.repo_obj, ['a', 'b', 'c'])
+
+        self.assertEqual(count, 3)
+        for module in self.modules:
+            mock_repo_controller.associate_single_unit.assert_any_call(self.repo_obj, module)
+
+    def test_associate_modules_single_fails(self, mock_objects, mock_rcu,
+                                            mock_repo_controller):
+        mock_objects.return_value.only.return_value = self.modules
+        mock_rcu.objects.insert.side_effect = NotUniqueError()
+        mock_repo_controller.associate_single_unit.side_effect = [None, ValueError()]
+
+        self.assertRaises(ValueError, associate_modules, self.repo_obj, ['a', 'b', 'c'])
+
+    def test_associate_modules_none(self, mock_objects, mock_rcu, mock_repo_controller):
+        self.assertEqual(associate_modules(self.repo_obj, []), 0)
+        self.assertEqual(mock_rcu.objects.insert.call_count, 0)
+
+
+@mock.patch('pulp_puppet.plugins.importers.units._prepare_module')
+@mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+@mock.patch('pulp_puppet.plugins.importers.units.RepositoryContentUnit')
+@mock.patch('pulp_puppet.plugins.importers.units.Module.objects')
+class TestModuleCommitter(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_obj = mock.Mock(repo_id='repo')
+        self.modules = [mock.Mock(id='a', _content_type_id='puppet_module'),
+                        mock.Mock(id='b', _content_type_id='puppet_module')]
+
+    def test_add_buffers(self, mock_objects, mock_rcu, mock_repo_controller, mock_prepare):
+        committer = ModuleCommitter(self.repo_obj, batch_size=2)
+
+        self.assertEqual(committer.add(self.modules[0], '/tmp/a.tar.gz', 'data-a'), [])
+        self.assertEqual(mock_objects.insert.call_count, 0)
+
+        results = committer.add(self.modules[1], '/tmp/b.tar.gz', 'data-b')
+
+        self.assertEqual([(r.module, r.path, r.data, r.error) for r in results],
+                         [(self.modules[0], '/tmp/a.tar.gz', 'data-a', None),
+                          (self.modules[1], '/tmp/b.tar.gz', 'data-b', None)])
+        mock_objects.insert.assert_called_once_with(self.modules, load_bulk=False)
+        self.modules[0].import_content.assert_called_once_with('/tmp/a.tar.gz', link=False)
+        self.assertEqual(mock_rcu.objects.insert.call_count, 1)
+        self.assertEqual(mock_rcu.call_args[1]['repo_id'], 'repo')
+        self.assertEqual(mock_repo_controller.associate_single_unit.call_count, 0)
+        for module in self.modules:
+            self.assertEqual(module.save.call_count, 0)
+
+    def test_add_digests(self, mock_objects, mock_rcu, mock_repo_controller, mock_prepare):
+        committer = ModuleCommitter(self.repo_obj)
+        committer.add(self.modules[0], '/tmp/a.tar.gz', digests={'sha256': 'abc'})
+        committer.add(self.modules[1], '/tmp/b.tar.gz')
+
+        committer.flush()
+
+        mock_prepare.assert_any_call(self.modules[0], '/tmp/a.tar.gz', {'sha256': 'abc'})
+        mock_prepare.assert_any_call(self.modules[1], '/tmp/b.tar.gz', None)
+
+    def test_flush_link(self, mock_objects, mock_rcu, mock_repo_controller, mock_prepare):
+        committer = ModuleCommitter(self.repo_obj, link=True)
+        committer.add(self.modules[0], '/tmp/a.tar.gz')
+
+        committer.flush()
+
+        self.modules[0].import_content.assert_called_once_with('/tmp/a.tar.gz', link=True)
+
+    def test_flush_empty(self, mock_objects, mock_rcu, mock_repo_controller, mock_prepare):
+        self.assertEqual(ModuleCommitter(self.repo_obj).flush(), [])
+        self.assertEqual(mock_objects.insert.call_count, 0)
+        self.assertEqual(mock_rcu.objects.insert.call_count, 0)
+
+    def test_flush_insert_fails(self, mock_objects, mock_rcu, mock_repo_controller,
+                                mock_prepare):
+        mock_objects.insert.side_effect = NotUniqueError()
+        self.modules[1].save.side_effect = NotUniqueError('duplicate')
+        committer = ModuleCommitter(self.repo_obj)
+        committer.add(self.modules[0], '/tmp/a.tar.gz')
+        committer.add(self.modules[1], '/tmp/b.tar.gz')
+
+        results = committer.flush()
+
+        # Only the module that could not be saved fails
+        self.assertTrue(results[0].error is None)
+        self.assertTrue(results[1].error is self.modules[1].save.side_effect)
+        self.assertTrue(results[1].traceback is not None)
+        self.assertEqual(self.modules[1].import_content.call_count, 0)
+        self.assertEqual(len(mock_rcu.objects.insert.call_args[0][0]), 1)
+
+    def test_flush_associate_fails(self, mock_objects, mock_rcu, mock_repo_controller,
+                                   mock_prepare):
+        mock_rcu.objects.insert.side_effect = NotUniqueError()
+        committer = ModuleCommitter(self.repo_obj)
+        committer.add(self.modules[0], '/tmp/a.tar.gz')
+        committer.add(self.modules[1], '/tmp/b.tar.gz')
+
+        results = committer.flush()
+
+        self.assertEqual([r.error for r in results], [None, None])
+        for module in self.modules:
+            mock_repo_controller.associate_single_unit.assert_any_call(self.repo_obj, module)
+
+    def test_flush_prepare_fails(self, mock_objects, mock_rcu, mock_repo_controller,
+                                 mock_prepare):
+        error = IOError('missing file')
+        mock_prepare.side_effect = [error, None]
+        committer = ModuleCommitter(self.repo_obj)
+        committer.add(self.modules[0], '/tmp/a.tar.gz')
+        committer.add(self.modules[1], '/tmp/b.tar.gz')
+
+        results = committer.flush()
+
+        self.assertEqual([r.error for r in results], [error, None])
+        mock_objects.insert.assert_called_once_with([self.modules[1]], load_bulk=False)
+
+
+class TestStoreModule(unittest.TestCase):
+
+    @mock.patch('pulp_puppet.plugins.importers.units.repo_controller')
+    @mock.patch('pulp_puppet.plugins.importers.units.file_digests')
+    def test_store_module(self, mock_digests, mock_repo_controller):
+        module = mock.Mock(checksum=None, checksum_type='sha256', file_md5=None)
+        mock_digests.return_value = {'sha256': 'abc', 'md5': 'def'}
+        repo_obj = mock.Mock()
+
+        store_module(repo_obj, module, '/tmp/jdob-valid-1.0.0.tar.gz')
+
+        module.set_storage_path.assert_called_once_with('jdob-valid-1.0.0.tar.gz')
+        mock_digests.assert_called_once_with('/tmp/jdob-valid-1.0.0.tar.gz',
+                                             set(['sha256', 'md5']))
+        self.assertEqual(module.checksum, 'abc')
+        self.assertEqual(module.file_md5, 'def')
+        module.save.assert_called_once_with()
+        module.import_content.assert_called_once_with('/tmp/jdob-valid-1.0.0.tar.gz')
+        mock_repo_controller.associate_single_unit.assert_called_once_with(repo_obj, module)
+
+
+@mock.patch('pulp_puppet.plugins.importers.units.signals')
+@mock.patch('pulp_puppet.plugins.importers.units.file_digests')
+class TestPrepareModule(unittest.TestCase):
+
+    def test_digests(self, mock_digests, mock_signals):
+        module = mock.Mock(checksum=None, checksum_type='sha256', file_md5=None)
+
+        units._prepare_module(module, '/tmp/a.tar.gz', {'sha256': 'abc', 'md5': 'def'})
+
+        # The file is not read again
+        self.assertEqual(mock_digests.call_count, 0)
+        self.assertEqual(module.checksum, 'abc')
+        self.assertEqual(module.file_md5, 'def')
+        module.validate.assert_called_once_with()
+
+    def test_digests_other_type(self, mock_digests, mock_signals):
+        module = mock.Mock(checksum=None, checksum_type='sha256', file_md5=None)
+        mock_digests.return_value = {'sha256': 'abc'}
+
+        units._prepare_module(module, '/tmp/a.tar.gz', {'md5': 'def'})
+
+        # Only the missing digest is computed
+        mock_digests.assert_called_once_with('/tmp/a.tar.gz', set(['sha256']))
+        self.assertEqual(module.checksum, 'abc')
+        self.assertEqual(module.file_md5, 'def')
+
+    def test_already_set(self, mock_digests, mock_signals):
+        module = mock.Mock(checksum='abc', checksum_type='sha256', file_md5='def')
+
+        units._prepare_module(module, '/tmp/a.tar.gz')
+
+        self.assertEqual(mock_digests.call_count, 0)
+        self.assertEqual(module.checksum, 'abc')
+        self.assertEqual(module.file_md5, 'def')
+
+
+class TestLinkContent(unittest.TestCase):
+
+    def test_default(self):
+        self.assertFalse(units.link_content({}))
+
+    def test_configured(self):
+        self.assertTrue(units.link_content({constants.CONFIG_IMPORT_MODE: 'hardlink'}))
+        self.assertFalse(units.link_content({constants.CONFIG_IMPORT_MODE: 'copy'}))
@@ -40,8 +40,8 @@ class UploadTests(unittest.TestCase):
             shutil.rmtree(self.dest_dir)
 
     @mock.patch(MODULE_STRING + '.Module')
-    @mock.patch(MODULE_STRING + '.repo_controller')
-    def test_handle_uploaded_unit(self, mock_repo_controller, mock_module):
+    @mock.patch(MODULE_STRING + '.store_module')
+    def test_handle_uploaded_unit(self, mock_store_module, mock_module):
         # Setup
         initialized_unit = mock.MagicMock()
         initialized_unit.storage_path = self.dest_dir
@@ -52,7 +52,9 @@ class UploadTests(unittest.TestCase):
                                              self.unit_metadata, self.source_file, self.conduit)
 
         # Verify
-        mock_module.from_metadata.return_value.save.assert_called_once_with()
+        mock_store_module.assert_called_once_with(
+            self.repo.repo_obj, mock_module.from_metadata.return_value,
+            os.path.join(os.path.dirname(self.source_file), 'jdob-valid-1.0.0.tar.gz'))
 
         self.assertTrue(isinstance(report, dict))
         self.assertTrue('success_flag' in report)
@@ -61,8 +63,8 @@ class UploadTests(unittest.TestCase):
         self.assertTrue('details' in report)
 
     @mock.patch(MODULE_STRING + '.Module')
-    @mock.patch(MODULE_STRING + '.repo_controller')
-    def test_handle_uploaded_unit_with_no_data(self, mock_repo_controller, mock_module):
+    @mock.patch(MODULE_STRING + '.store_module')
+    def test_handle_uploaded_unit_with_no_data(self, mock_store_module, mock_module):
         # Setup
         initialized_unit = mock.MagicMock()
         initialized_unit.storage_path = self.dest_dir
@@ -72,7 +74,7 @@ class UploadTests(unittest.TestCase):
         report = upload.handle_uploaded_unit(self.repo, constants.TYPE_PUPPET_MODULE, {},
                                              {}, self.source_file, self.conduit)
 
-        mock_module.from_metadata.return_value.save.assert_called_once_with()
+        self.assertEqual(mock_store_module.call_count, 1)
 
         self.assertTrue(report['success_flag'])
 
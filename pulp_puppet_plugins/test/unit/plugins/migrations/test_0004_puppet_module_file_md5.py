@@ -0,0 +1,87 @@
+"""
+Tests for pulp_puppet.plugins.migrations.0004_puppet_module_file_md5
+"""
+from itertools import imap
+import unittest
+
+from mock import patch, call
+
+from pulp.server.db.migrate.models import _import_all_the_way
+from pymongo import ASCENDING
+
+
+migration = _import_all_the_way('pulp_puppet.plugins.migrations.0004_puppet_module_file_md5')
+
+
+@patch('pulp_puppet.plugins.importers.metadata.calculate_checksum')
+@patch.object(migration, 'get_collection')
+class Test0004PuppetModuleFileMd5(unittest.TestCase):
+    """
+    Test the migration of the puppet module content units adds the md5 of their file
+    """
+
+    def setUp(self):
+        self.units = [{'_id': 'a', '_storage_path': '/storage/a.tar.gz'},
+                      {'_id': 'b', '_storage_path': '/storage/b.tar.gz'},
+                      {'_id': 'c', '_storage_path': '/storage/c.tar.gz'}]
+
+    @patch.object(migration, 'BATCH_SIZE', 2)
+    @patch.object(migration, 'Pool')
+    def test_migration(self, mock_pool, mock_get_collection, mock_checksum):
+        mock_pool.return_value.imap.side_effect = lambda func, batch, chunk: imap(func, batch)
+        collection = mock_get_collection.return_value
+        specs = []
+
+        def find(spec, fields, sort, limit):
+            # The spec is updated in place for the next batch
+            specs.append(dict(spec))
+            after = spec.get('_id', {}).get('$gt', '')
+            return [unit for unit in self.units if unit['_id'] > after][:limit]
+        collection.find.side_effect = find
+        mock_checksum.side_effect = lambda path, checksum_type: 'md5-' + path[-8]
+
+        migration.migrate()
+
+        mock_get_collection.assert_called_once_with('units_puppet_module')
+        # Each batch is read with a query of its own, starting after the previous batch
+        self.assertEqual(specs, [{'file_md5': {'$exists': False}},
+                                 {'file_md5': {'$exists': False}, '_id': {'$gt': 'b'}},
+                                 {'file_md5': {'$exists': False}, '_id': {'$gt': 'c'}}])
+        self.assertEqual(collection.find.call_args[1], {'sort': [('_id', ASCENDING)],
+                                                        'limit': 2})
+        # Two batches are handed to the pool
+        self.assertEqual(mock_pool.return_value.imap.call_count, 2)
+        mock_checksum.assert_has_calls([call('/storage/a.tar.gz', 'md5'),
+                                        call('/storage/b.tar.gz', 'md5'),
+                                        call('/storage/c.tar.gz', 'md5')])
+        collection.update_one.assert_has_calls([
+            call({'_id': 'a'}, {'$set': {'file_md5': 'md5-a'}}),
+            call({'_id': 'b'}, {'$set': {'file_md5': 'md5-b'}}),
+            call({'_id': 'c'}, {'$set': {'file_md5': 'md5-c'}})])
+        mock_pool.return_value.close.assert_called_once_with()
+        mock_pool.return_value.join.assert_called_once_with()
+
+    @patch.object(migration, 'Pool')
+    def test_migration_without_pool(self, mock_pool, mock_get_collection, mock_checksum):
+        mock_pool.side_effect = OSError()
+        collection = mock_get_collection.return_value
+        collection.find.side_effect = [self.units[:1], []]
+        mock_checksum.return_value = 'abc'
+
+        migration.migrate()
+
+        collection.update_one.assert_called_once_with({'_id': 'a'}, {'$set': {'file_md5': 'abc'}})
+
+    @patch.object(migration, 'Pool')
+    def test_migration_missing_file(self, mock_pool, mock_get_collection, mock_checksum):
+        mock_pool.side_effect = OSError()
+        collection = mock_get_collection.return_value
+        collection.find.side_effect = [self.units[:2], []]
+        mock_checksum.side_effect = [IOError(), 'abc']
+
+        migration.migrate()
+
+        # The module whose file is missing is left to be checksummed when published, and
+        # the next batch starts after it rather than reading it again
+        self.assertEqual(collection.find.call_args[0][0]['_id'], {'$gt': 'b'})
+        collection.update_one.assert_called_once_with({'_id': 'b'}, {'$set': {'file_md5': 'abc'}})
@@ -51,6 +51,41 @@ class HttpsTests(unittest.TestCase):
         self.assertTrue(constants.CONFIG_SERVE_HTTPS in msg)
 
 
+class IncrementalPublishTests(unittest.TestCase):
+
+    def test_validate_incremental_publish(self):
+        config = PluginCallConfiguration({constants.CONFIG_INCREMENTAL_PUBLISH: 'true'}, {})
+        result, msg = configuration._validate_incremental_publish(config)
+
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_incremental_publish_invalid(self):
+        config = PluginCallConfiguration({constants.CONFIG_INCREMENTAL_PUBLISH: 'foo'}, {})
+        result, msg = configuration._validate_incremental_publish(config)
+
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_INCREMENTAL_PUBLISH in msg)
+
+
+class ChecksumThreadsTests(unittest.TestCase):
+
+    def test_validate_checksum_threads(self):
+        config = PluginCallConfiguration({constants.CONFIG_CHECKSUM_THREADS: '8'}, {})
+        result, msg = configuration._validate_checksum_threads(config)
+
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_checksum_threads_invalid(self):
+        for value in ('0', '-1', 'many', '1.5'):
+            config = PluginCallConfiguration({constants.CONFIG_CHECKSUM_THREADS: value}, {})
+            result, msg = configuration._validate_checksum_threads(config)
+
+            self.assertTrue(not result)
+            self.assertTrue(constants.CONFIG_CHECKSUM_THREADS in msg)
+
+
 class FullValidationTests(unittest.TestCase):
 
     @mock.patch('pulp_puppet.plugins.distributors.configuration._validate_http')